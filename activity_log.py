@@ -0,0 +1,175 @@
+try:
+    from .database import db
+    from .models import LogAtividade
+    from .json_store import migrate_json_once
+except ImportError:
+    from database import db
+    from models import LogAtividade
+    from json_store import migrate_json_once
+from datetime import datetime, time
+import atexit
+import os
+import queue
+import threading
+import time as clock
+
+LOG_TIMESTAMP_FORMAT = "%d/%m/%Y %H:%M:%S"
+# Lista de usuários do filtro: relida do banco no máximo a cada USERS_TTL segundos
+# (entre uma leitura e outra, os lotes gravados por este processo a mantêm em dia)
+USERS_TTL = 300
+# Espera (segundos) antes de cada nova tentativa de gravar um lote que falhou (ex: "database is locked")
+RETRY_DELAYS = (0.5, 1, 2, 5, 10)
+
+
+class ActivityLog:
+    """
+    Log de atividades com gravação em segundo plano.
+
+    log() só coloca a entrada numa fila em memória (limitada); uma thread
+    grava as entradas em lote na tabela logs_atividade. Um lote que falha é
+    regravado após cada espera de RETRY_DELAYS; só depois da última tentativa
+    suas entradas são descartadas (contadas em `failed`). Se a fila encher
+    (banco travado), as entradas excedentes são descartadas e contadas em
+    `dropped` em vez de travar a requisição. A thread é criada no primeiro
+    log() de cada processo, então funciona também com workers criados por fork.
+    """
+
+    def __init__(self, app, maxsize=10000, batch_size=500, flush_interval=1.0):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+        self._users = None  # (lido em, set de usuários)
+        atexit.register(self.flush)
+
+    def log(self, user, action):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait({"data_hora": datetime.now(), "usuario": user or 'Sistema', "acao": action})
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='activity-log', daemon=True)
+            self._pid = os.getpid()
+            self._worker.start()
+
+    def _take_batch(self, timeout):
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch, retry_delays=RETRY_DELAYS):
+        for delay in (*retry_delays, None):
+            with self.app.app_context():
+                try:
+                    db.session.execute(db.insert(LogAtividade), batch)
+                    db.session.commit()
+                    break
+                except Exception as e:
+                    db.session.rollback()
+                    if delay is None:
+                        self.failed += len(batch)
+                        print(f"Erro ao gravar {len(batch)} log(s) de atividade, descartados: {e}")
+                        return
+                    print(f"Erro ao gravar {len(batch)} log(s) de atividade, nova tentativa em {delay}s: {e}")
+            clock.sleep(delay)
+        cached = self._users
+        if cached is not None:
+            novos = {entry['usuario'] for entry in batch} - cached[1]
+            if novos:
+                # Troca o set em vez de alterar (users() pode estar iterando o atual)
+                self._users = (cached[0], cached[1] | novos)
+
+    def users(self):
+        """
+        Usuários que aparecem no log, em ordem (filtro da tela de admin). O
+        DISTINCT no banco roda uma vez a cada USERS_TTL segundos (para ver os
+        gravados por outros workers); no meio tempo a thread de gravação
+        acrescenta os usuários de cada lote, então a tela não varre a tabela.
+        """
+        cached = self._users
+        if cached is None or clock.monotonic() - cached[0] > USERS_TTL:
+            cached = (clock.monotonic(), set(log_users()))
+            self._users = cached
+        return sorted(cached[1])
+
+    def _run(self):
+        while True:
+            batch = self._take_batch(self.flush_interval)
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Grava o que estiver na fila (no encerramento do processo, com menos tentativas)"""
+        while True:
+            batch = self._take_batch(0)
+            if not batch:
+                return
+            self._write(batch, RETRY_DELAYS[:2])
+
+
+def _parse_date(value, end_of_day=False):
+    if not value:
+        return None
+    try:
+        parsed = datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return None
+    return datetime.combine(parsed.date(), time.max) if end_of_day else parsed
+
+
+def query_logs(page=1, per_page=50, user=None, start=None, end=None, action=None):
+    """Página de logs (mais recentes primeiro) com filtros por usuário, período (AAAA-MM-DD) e texto da ação"""
+    query = db.select(LogAtividade)
+    if user:
+        query = query.where(LogAtividade.usuario == user)
+    start, end = _parse_date(start), _parse_date(end, end_of_day=True)
+    if start:
+        query = query.where(LogAtividade.data_hora >= start)
+    if end:
+        query = query.where(LogAtividade.data_hora <= end)
+    if action:
+        query = query.where(LogAtividade.acao.ilike(f"%{action}%"))
+    query = query.order_by(LogAtividade.data_hora.desc(), LogAtividade.id.desc())
+    return db.paginate(query, page=page, per_page=per_page, max_per_page=200, error_out=False)
+
+
+def log_users():
+    """Usuários que aparecem no log (para o filtro da tela de admin)"""
+    return db.session.scalars(db.select(LogAtividade.usuario).distinct().order_by(LogAtividade.usuario)).all()
+
+
+def migrate_logs_json(path):
+    """Importa uma única vez o logs.json antigo (mais recente primeiro) para a tabela"""
+    def importer(data):
+        rows = []
+        for entry in reversed(data if isinstance(data, list) else []):
+            try:
+                data_hora = datetime.strptime(entry.get('timestamp', ''), LOG_TIMESTAMP_FORMAT)
+            except (AttributeError, ValueError):
+                continue
+            rows.append({"data_hora": data_hora, "usuario": entry.get('user') or 'Sistema', "acao": entry.get('action', '')})
+        if rows:
+            db.session.execute(db.insert(LogAtividade), rows)
+        db.session.commit()
+        return len(rows)
+
+    return migrate_json_once(path, importer)
@@ -1,17 +1,35 @@
-from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, session, Response, send_file
+from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, session, Response, send_file, stream_with_context
 import os
 import json
 import csv
 import io
+import zlib
 import shutil
 import functools
 import hashlib
 import re
-from datetime import datetime
-from collections import Counter
+from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy     # Novo
 from database import db, init_db   # Novo
 from models import User, Categoria, Produto, Pedido, ItemPedido, Ingrediente, FichaTecnica, Reserva, Depoimento # Novo
+from menu_cache import MenuCache, format_price, parse_price
+from http_cache import VersionedJsonCache
+from menu_sync import sync_menu, CsvMenuImporter, ImportAborted
+from menu_pdf import MenuPdfCache
+from image_pipeline import process_image, image_variants, ImageTooLarge
+from assets import AssetManifest
+from json_store import JsonStore
+from menu_search import MenuSearchIndex
+from loyalty import add_points, get_points
+from activity_log import ActivityLog, query_logs
+from order_intake import ProductResolver
+from pricing import PricingEngine, QuoteError, QuoteMismatch
+from order_events import OrderEventBus, stream_events
+from order_read import OrderReadModel, history_criteria, HISTORY_PAGE_SIZE, EXPORT_BATCH_SIZE
+from order_writer import OrderWriter, OrderQueueFull
+from inventory import deduct_stock, StockShortage
+from recipe_costs import refresh_product_costs, refresh_ingredient_costs, margin_report
+from coupons import CouponCache, CouponError, check_coupon, list_coupons, save_coupons
 
 # --- API DE ESTOQUE (FASE 2) ---
 
@@ -27,12 +45,44 @@ INSTANCE_DIR = os.path.join(BASE_DIR, 'instance')
 if not os.path.exists(INSTANCE_DIR):
     os.makedirs(INSTANCE_DIR)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(INSTANCE_DIR, 'pizzaria.db')}"
+# DATABASE_URL aponta para um servidor (ex: postgresql+psycopg2://...); sem ela, SQLite em instance/
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL') or f"sqlite:///{os.path.join(INSTANCE_DIR, 'pizzaria.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Perfil de armazenamento (database.STORAGE_PROFILES): 'sqlite' ou 'server'; vazio = pelo tipo da URI
+app.config['DATABASE_PROFILE'] = os.environ.get('DATABASE_PROFILE')
+# Aplica as migrações pendentes (migrations.py) ao iniciar; AUTO_MIGRATE=0 deixa para `python migrations.py`
+app.config['AUTO_MIGRATE'] = os.environ.get('AUTO_MIGRATE', '1') != '0'
 
 # Inicializa o Banco
 init_db(app)
 
+# Cache do cardápio (invalidado apenas pelas rotas que alteram o cardápio)
+menu_cache = MenuCache(os.path.join(INSTANCE_DIR, 'menu_version'))
+# Respostas públicas pré-serializadas (ETag + gzip) por versão
+menu_json_cache = VersionedJsonCache('m{revision}')
+config_json_cache = VersionedJsonCache('cfg')
+# PDF do cardápio: renderizado em memória uma vez por versão, refeito em segundo plano após cada save
+menu_pdf_cache = MenuPdfCache(app, menu_cache)
+menu_cache.subscribe(menu_pdf_cache.refresh_async)
+# Índice de busca do cardápio (reindexa só os produtos alterados quando a versão muda)
+menu_search = MenuSearchIndex(menu_cache)
+# Nome/id -> produto para os itens dos pedidos (sem consulta por item)
+product_resolver = ProductResolver(menu_cache)
+# Arquivos estáticos com hash no nome e cache imutável (helper asset_url nos templates)
+assets = AssetManifest(app)
+# Cupons ativos em memória (recarregados quando o admin salva a lista)
+coupon_cache = CouponCache(os.path.join(INSTANCE_DIR, 'cupons_version'))
+# Log de atividades: fila em memória gravada em lote por uma thread
+activity_log = ActivityLog(app)
+# Eventos de pedidos (criado/alterado/removido) para o SSE da cozinha e do painel.
+# O barramento é deste processo: com vários workers (gunicorn -w N) o stream de uma
+# tela só traz os pedidos gravados no worker dela; o order_feed.js completa a lista
+# com /api/admin/pedidos?since= a cada poucos segundos. Para tempo real
+# completo, rode um único worker com threads (gunicorn -w 1 --threads N / gevent).
+order_events = OrderEventBus()
+# Listas de pedidos em duas consultas, com o dict de cada pedido em cache até ele mudar
+order_reads = OrderReadModel()
+
 # --- API DE ESTOQUE (FASE 2) ---
 
 @app.route('/api/admin/ingredientes', methods=['GET', 'POST', 'DELETE'])
@@ -59,12 +109,18 @@ def api_ingredientes():
         if data.get('id'):
             ing = Ingrediente.query.get(data.get('id'))
             if ing:
+                custo = float(data.get('custo', 0))
+                custo_mudou = custo != (ing.custo_unitario or 0)
                 ing.nome = data.get('nome')
                 ing.unidade = data.get('unidade')
                 ing.tipo = data.get('tipo', 'insumo')
                 ing.estoque_atual = float(data.get('estoque_atual', 0))
                 ing.estoque_minimo = float(data.get('estoque_minimo', 0))
-                ing.custo_unitario = float(data.get('custo', 0))
+                ing.custo_unitario = custo
+                if custo_mudou:
+                    # Recalcula só os produtos que usam este ingrediente
+                    db.session.flush()
+                    refresh_ingredient_costs(ing.id)
         else:
             new_ing = Ingrediente(
                 nome=data.get('nome'),
@@ -87,6 +143,8 @@ def api_ingredientes():
         ing = Ingrediente.query.get(data.get('id'))
         if ing:
             db.session.delete(ing)
+            db.session.flush()
+            refresh_ingredient_costs(ing.id)
             db.session.commit()
             return jsonify({"success": True})
         return jsonify({"success": False, "message": "Ingrediente não encontrado"}), 404
@@ -108,6 +166,14 @@ def api_estoque_baixo():
         "tipo": i.tipo
     } for i in ingredientes])
 
+@app.route('/api/admin/relatorio/margens', methods=['GET'])
+def api_relatorio_margens():
+    if not session.get('logged_in'):
+        return jsonify({"success": False}), 401
+
+    # Custo já calculado em produto_custos: uma leitura para o cardápio inteiro
+    return jsonify(margin_report())
+
 @app.route('/api/admin/receita/<int:produto_id>', methods=['GET'])
 def get_receita(produto_id):
     if not session.get('logged_in'):
@@ -153,6 +219,9 @@ def save_receita():
             db.session.delete(item)
             
     try:
+        # Custo do produto na mesma transação da ficha
+        db.session.flush()
+        refresh_product_costs([produto_id])
         db.session.commit()
         return jsonify({"success": True})
     except Exception as e:
@@ -173,12 +242,22 @@ CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'config.json')
 BANNERS_FILE = os.path.join(os.path.dirname(__file__), 'banners.json')
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'uploads')
 
+# Arquivos JSON com cache por mtime/tamanho e gravação atômica (ver json_store.py)
+config_store = JsonStore(CONFIG_FILE, default=dict)
+users_store = JsonStore(USERS_FILE, default=list)
+promos_store = JsonStore(PROMOS_FILE, default=list)
+banners_store = JsonStore(BANNERS_FILE, default=list)
+legacy_menu_store = JsonStore(CARDAPIO_FILE, default=dict)
+
+# Cotação do carrinho no servidor (preços, promoções, cupom e taxa, sem consultar o banco)
+pricing = PricingEngine(product_resolver, coupon_cache, promos_store, config_store, app.secret_key)
+
+# Fidelidade, cupons e logs agora ficam no banco. Os JSON antigos são importados
+# pela linha de comando (python migrations.py json), nunca na importação do app.
+
 @app.route('/')
 def index():
-    banners = []
-    if os.path.exists(BANNERS_FILE):
-        with open(BANNERS_FILE, 'r', encoding='utf-8') as f:
-            banners = json.load(f)
+    banners = banners_store.read()
             
     # Busca depoimentos aprovados (limitado a 3 mais recentes)
     depoimentos = Depoimento.query.filter_by(aprovado=True).order_by(Depoimento.data.desc()).limit(3).all()
@@ -187,33 +266,10 @@ def index():
 
 @app.route('/cardapio')
 def cardapio():
-    # NOVO: Carrega do Banco de Dados
-    categorias_db = Categoria.query.filter_by(visivel=True).order_by(Categoria.ordem).all()
-    
-    menu = {}
-    config = {}
-    
-    for cat in categorias_db:
-        # Carrega produtos visíveis
-        produtos_db = Produto.query.filter_by(categoria_id=cat.id, visivel=True).all()
-        
-        items_list = []
-        for p in produtos_db:
-            items_list.append({
-                "id": p.id,
-                "nome": p.nome,
-                "desc": p.descricao,
-                "preco": f"R$ {p.preco:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."), # Formata R$ 1.200,50
-                "foto": p.foto_url,
-                "visivel": p.visivel
-            })
-        
-        if items_list:
-            menu[cat.nome] = items_list
-            config[cat.nome] = {
-                "visible": True, 
-                "show_price": cat.exibir_preco
-            }
+    # Carrega do cache do cardápio (uma consulta só quando o cardápio muda)
+    snapshot = menu_cache.get()
+    menu = snapshot.site_menu
+    config = snapshot.site_config
             
     return render_template('cardapio.html', title='Nosso Cardápio — Pizzaria Colonial', menu=menu, config=config)
 
@@ -282,47 +338,32 @@ def inject_site_config():
         "manual_payment_confirm": True,
         "sobre_nos": "A Pizzaria Colonial nasceu do sonho de trazer o verdadeiro sabor da pizza artesanal para a nossa região. Desde a nossa fundação, trabalhamos com ingredientes selecionados e muito carinho em cada receita.\n\nNossa missão é proporcionar momentos felizes e saborosos para você e sua família."
     }
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            saved_config = json.load(f)
-            default_config.update(saved_config)
+    default_config.update(config_store.read())
     return dict(site_config=default_config)
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# Helper de template: src/srcset das fotos processadas pelo pipeline de imagens
+app.jinja_env.globals['image_variants'] = image_variants
+
 @app.route('/api/cardapio')
 def api_cardapio():
-    # NOVO: API via Banco de Dados
-    menu = {}
+    # API via cache do cardápio (snapshot montado do Banco de Dados)
     try:
-        categorias_db = Categoria.query.order_by(Categoria.ordem).all()
-        
-        # Carrega promoções (ainda via JSON por enquanto ou migra depois)
-        # Por simplificação, mantemos a lógica de promoção separada ou desativada neste refactor inicial
-        # Idealmente, Promocoes virariam tabela.
-        
-        for cat in categorias_db:
-            produtos_db = Produto.query.filter_by(categoria_id=cat.id).all()
-            items_list = []
-            for p in produtos_db:
-                items_list.append({
-                    "id": p.id,
-                    "nome": p.nome,
-                    "desc": p.descricao,
-                    "preco": f"R$ {p.preco:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-                    "foto": p.foto_url,
-                    "visivel": p.visivel
-                })
-            
-            if items_list:
-                menu[cat.nome] = items_list
-                
-        return jsonify(menu)
+        snapshot = menu_cache.get()
+        return menu_json_cache.get(snapshot.version, lambda: snapshot.api_menu).response()
     except Exception as e:
         print(f"Erro na API Cardapio SQL: {e}")
         return jsonify({})
 
+@app.route('/api/cardapio/busca')
+def api_cardapio_busca():
+    # Busca sem acento, por prefixo (type-ahead): /api/cardapio/busca?q=calab
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    return jsonify(menu_search.search(query, limit))
+
 # Rota de Login
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -375,24 +416,8 @@ def logout():
 
 # --- Helpers ---
 def log_activity(action):
-    entry = {
-        "timestamp": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-        "user": session.get('username', 'Sistema'),
-        "action": action
-    }
-    logs = []
-    if os.path.exists(LOGS_FILE):
-        try:
-            with open(LOGS_FILE, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        except: pass
-    
-    logs.insert(0, entry) # Mais recente primeiro
-    # Mantém apenas os últimos 1000 logs
-    logs = logs[:1000]
-    
-    with open(LOGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(logs, f, indent=4, ensure_ascii=False)
+    # Só enfileira: a gravação no banco é feita em lote em segundo plano
+    activity_log.log(session.get('username', 'Sistema'), action)
 
 def check_permission(perm):
     user_perms = session.get('permissions', [])
@@ -466,21 +491,23 @@ def admin_logs():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
     
-    logs = []
-    if os.path.exists(LOGS_FILE):
-        with open(LOGS_FILE, 'r', encoding='utf-8') as f:
-            logs = json.load(f)
+    filtros = {
+        "user": request.args.get('user', '').strip(),
+        "start": request.args.get('start', '').strip(),
+        "end": request.args.get('end', '').strip(),
+        "action": request.args.get('action', '').strip()
+    }
+    page = request.args.get('page', 1, type=int)
+    pagination = query_logs(page=page, per_page=50, **filtros)
             
-    return render_template('admin_logs.html', title='Logs de Atividade — Admin Colonial', logs=logs)
+    return render_template('admin_logs.html', title='Logs de Atividade — Admin Colonial',
+                           logs=pagination.items, pagination=pagination, filtros=filtros, usuarios=activity_log.users())
 
 @app.route('/api/admin/cupons', methods=['GET'])
 def api_admin_cupons():
     if not session.get('logged_in'):
         return jsonify({}), 401
-    if os.path.exists(COUPONS_FILE):
-        with open(COUPONS_FILE, 'r', encoding='utf-8') as f:
-            return jsonify(json.load(f))
-    return jsonify({})
+    return jsonify(list_coupons())
 
 @app.route('/api/admin/cupons/save', methods=['POST'])
 def api_admin_save_cupons():
@@ -488,81 +515,37 @@ def api_admin_save_cupons():
         return jsonify({"success": False}), 401
     try:
         data = request.get_json()
-        with open(COUPONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        save_coupons(data)
+        db.session.commit()
+        coupon_cache.invalidate()
         log_activity("Atualizou lista de cupons")
         return jsonify({"success": True})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
 
 # Rota para Gerar PDF do Cardápio
 @app.route('/api/cardapio/pdf')
 def cardapio_pdf():
     try:
-        from fpdf import FPDF
-    except ImportError:
-        return "Biblioteca FPDF não instalada. Instale com 'pip install fpdf'", 500
-
-    class PDF(FPDF):
-        def header(self):
-            self.set_font('Arial', 'B', 16)
-            self.cell(0, 10, 'Cardápio - Pizzaria Colonial', 0, 1, 'C')
-            self.ln(5)
-
-        def footer(self):
-            self.set_y(-15)
-            self.set_font('Arial', 'I', 8)
-            self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
-
-    try:
-        pdf = PDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-
-        if os.path.exists(CARDAPIO_FILE):
-            with open(CARDAPIO_FILE, 'r', encoding='utf-8') as f:
-                menu = json.load(f)
-                
-            for category, items in menu.items():
-                # Título da Categoria
-                pdf.set_font("Arial", 'B', 14)
-                pdf.set_fill_color(240, 240, 240)
-                # Decodifica para latin-1 para compatibilidade do FPDF padrão
-                cat_text = category.encode('latin-1', 'replace').decode('latin-1')
-                pdf.cell(0, 10, cat_text, 1, 1, 'L', 1)
-                
-                # Itens
-                pdf.set_font("Arial", size=11)
-                for item in items:
-                    name = item['nome'].encode('latin-1', 'replace').decode('latin-1')
-                    price = item['preco'].encode('latin-1', 'replace').decode('latin-1')
-                    desc = item['desc'].encode('latin-1', 'replace').decode('latin-1')
-                    
-                    pdf.cell(140, 8, name, 0, 0)
-                    pdf.cell(50, 8, price, 0, 1, 'R')
-                    pdf.set_font("Arial", 'I', 9)
-                    pdf.multi_cell(0, 5, desc)
-                    pdf.set_font("Arial", size=11)
-                    pdf.ln(2)
-                pdf.ln(5)
-
-        # Salva em memória ou arquivo temporário
-        pdf_output = os.path.join(os.path.dirname(__file__), 'cardapio_temp.pdf')
-        pdf.output(pdf_output)
-        
-        return send_file(pdf_output, as_attachment=True, download_name='cardapio_colonial.pdf')
+        rendered = menu_pdf_cache.get()
+    except RuntimeError as e:
+        return str(e), 500
     except Exception as e:
         return f"Erro ao gerar PDF: {str(e)}", 500
 
-def parse_price(price_str):
-    if not price_str: return 0.0
-    try:
-        if isinstance(price_str, (int, float)): return float(price_str)
-        clean = str(price_str).replace('R$', '').replace('.', '').replace(',', '.').strip()
-        clean = clean.replace('\xa0', '') 
-        return float(clean)
-    except:
-        return 0.0
+    # send_file trata If-None-Match com o ETag da versão (304 sem reenviar o PDF)
+    return send_file(
+        io.BytesIO(rendered.data),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name='cardapio_colonial.pdf',
+        etag=rendered.etag,
+        max_age=0
+    )
 
 # Rota para salvar alterações (POST)
 @app.route('/api/admin/save', methods=['POST'])
@@ -572,66 +555,16 @@ def save_cardapio():
     try:
         data = request.get_json() # Formato: { "Categoria": [ {itens...} ] }
         
-        # Rastreamento para identificar exclusões (Simples não deleta categorias por enquanto para segurança)
-        # processed_cats = [] 
-        
-        cat_order = 0
-        for cat_name, items in data.items():
-            cat_order += 1
-            
-            # Busca ou Cria Categoria
-            cat = Categoria.query.filter_by(nome=cat_name).first()
-            if not cat:
-                cat = Categoria(nome=cat_name, ordem=cat_order)
-                db.session.add(cat)
-                db.session.flush() # ID
-            else:
-                cat.ordem = cat_order
-            
-            # Processa Itens
-            # processed_items = []
-            
-            for item in items:
-                p_id = item.get('id')
-                # Se item tem ID, tenta buscar. Se não, tenta buscar por nome e categoria (fallback)
-                prod = None
-                if p_id:
-                    prod = Produto.query.get(p_id)
-                
-                # Fallback por nome se ID não bater ou não existir (casos de cardápios antigos cacheados)
-                if not prod and item.get('nome'):
-                     prod = Produto.query.filter_by(categoria_id=cat.id, nome=item['nome']).first()
-
-                if prod:
-                    # Atualiza
-                    prod.nome = item.get('nome')
-                    prod.descricao = item.get('desc')
-                    prod.preco = parse_price(item.get('preco'))
-                    prod.foto_url = item.get('foto')
-                    prod.visivel = item.get('visivel', True)
-                    prod.esgotado = item.get('esgotado', False)
-                    prod.categoria_id = cat.id # Garante que está na cat certa (caso tenha movido)
-                else:
-                    # Cria Novo
-                    prod = Produto(
-                        categoria_id=cat.id,
-                        nome=item.get('nome'),
-                        descricao=item.get('desc'),
-                        preco=parse_price(item.get('preco')),
-                        foto_url=item.get('foto'),
-                        visivel=item.get('visivel', True),
-                        esgotado=item.get('esgotado', False)
-                    )
-                    db.session.add(prod)
-            
-            # TODO: Lógica de exclusão de itens removidos no front (comparar IDs)
-            # Para V1, itens removidos no front não são deletados no banco explicitamente aqui
-            # para evitar acidentes, mas idealmente deveriam.
-            # Se o usuário deletou no front, o item não vem no JSON.
+        # Diff em lote contra o banco (insere, atualiza e remove itens apagados no front)
+        resumo = sync_menu(data)
             
         db.session.commit()
+        menu_cache.invalidate()
         log_activity("Salvou alterações no cardápio (SQL)")
-        return jsonify({"success": True, "message": "Cardápio atualizado com sucesso!"})
+        return jsonify({"success": True, "message": "Cardápio atualizado com sucesso!", "resumo": resumo})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
@@ -659,6 +592,7 @@ def api_cardapio_config():
                     cat.exibir_preco = cfg.get('show_price', True)
             
             db.session.commit()
+            menu_cache.invalidate()
             log_activity("Atualizou configurações de visibilidade (SQL)")
             return jsonify({"success": True})
         except Exception as e:
@@ -699,59 +633,39 @@ def upload_cardapio():
     mode = request.form.get('mode', 'merge') # 'merge' ou 'replace'
 
     try:
-        # Cria backup automático antes de qualquer alteração
-        if os.path.exists(CARDAPIO_FILE):
-            shutil.copy2(CARDAPIO_FILE, BACKUP_FILE)
+        importer = CsvMenuImporter(mode)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
 
-        # Lê e decodifica o arquivo
-        stream = io.StringIO(file.stream.read().decode("utf-8-sig"), newline=None)
-        reader = csv.DictReader(stream, delimiter=';')
-        
-        # Carrega menu atual
-        current_menu = {}
-        if mode == 'merge' and os.path.exists(CARDAPIO_FILE):
-            with open(CARDAPIO_FILE, 'r', encoding='utf-8') as f:
-                current_menu = json.load(f)
-        
-        # Processa linhas
-        for row in reader:
-            category = row.get('Categoria', '').strip()
-            name = row.get('Nome', '').strip()
-            desc = row.get('Descricao', '').strip()
-            price = row.get('Preco', '').strip()
-            photo = row.get('Foto', '').strip()
-            
-            if not category or not name:
-                continue
-                
-            if category not in current_menu:
-                current_menu[category] = []
-            
-            # Verifica se item já existe para atualizar
-            found = False
-            for item in current_menu[category]:
-                if item['nome'].lower() == name.lower():
-                    item['desc'] = desc
-                    item['preco'] = price
-                    if photo: item['foto'] = photo
-                    found = True
-                    break
-            
-            # Se não existe, cria novo
-            if not found:
-                new_item = {"nome": name, "desc": desc, "preco": price}
-                if photo: new_item['foto'] = photo
-                current_menu[category].append(new_item)
-        
-        # Salva alterações
-        with open(CARDAPIO_FILE, 'w', encoding='utf-8') as f:
-            json.dump(current_menu, f, indent=4, ensure_ascii=False)
+    try:
+        # Cria backup automático (cardápio atual do banco) antes de qualquer alteração
+        with open(BACKUP_FILE, 'w', encoding='utf-8') as f:
+            json.dump(menu_cache.get().api_menu, f, indent=4, ensure_ascii=False)
+
+        # Lê o arquivo em streaming (linha a linha), sem carregar tudo na memória
+        stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+        resumo = importer.run(stream)
+
+        db.session.commit()
+        menu_cache.invalidate()
         
-        log_activity(f"Importou cardápio via CSV (Modo: {mode})")
+        log_activity(f"Importou cardápio via CSV (Modo: {mode}) - {resumo['criados']} novos, {resumo['atualizados']} atualizados")
             
-        return jsonify({"success": True, "message": "Cardápio atualizado com sucesso!"})
+        message = f"Cardápio atualizado com sucesso! {resumo['criados']} itens novos, {resumo['atualizados']} atualizados"
+        if resumo['removidos']:
+            message += f", {resumo['removidos']} removidos"
+        if resumo['erros']:
+            message += f". {resumo['erros']} linha(s) ignorada(s) com erro"
+        return jsonify({"success": True, "message": message + ".", "resumo": resumo, "erros": importer.erros})
         
+    except ImportAborted as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e), "resumo": importer.resumo, "erros": importer.erros}), 400
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({"success": False, "message": "Arquivo não está em UTF-8. Salve o CSV como 'CSV UTF-8'."}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({"success": False, "message": f"Erro ao processar arquivo: {str(e)}"}), 500
 
 # Rota para Upload de Imagens do Cardápio
@@ -773,13 +687,14 @@ def upload_image():
     if ext.lower() not in ALLOWED_EXTENSIONS:
         return jsonify({"success": False, "message": "Tipo de arquivo não permitido"}), 400
 
-    # Sanitização básica do nome do arquivo
-    safe_filename = re.sub(r'[^a-zA-Z0-9_.-]', '', file.filename)
-    filename = f"{int(datetime.now().timestamp())}_{safe_filename}"
-    
+    # Nome derivado do hash do conteúdo (reenvio da mesma foto não duplica arquivos)
+    # e variantes thumb/medium/full + WebP geradas pelo pipeline
     try:
-        file.save(os.path.join(UPLOAD_FOLDER, filename))
-        return jsonify({"success": True, "url": url_for('static', filename=f'uploads/{filename}')})
+        filename = process_image(file.read(), ext, UPLOAD_FOLDER)
+        url = url_for('static', filename=f'uploads/{filename}')
+        return jsonify({"success": True, "url": url, "variants": image_variants(url)})
+    except ImageTooLarge:
+        return jsonify({"success": False, "message": "Imagem grande demais. Envie uma foto com menos pixels."}), 400
     except Exception as e:
         return jsonify({"success": False, "message": "Erro ao salvar arquivo"}), 500
 
@@ -790,7 +705,15 @@ def restore_cardapio():
         return jsonify({"success": False, "message": "Não autorizado"}), 401
         
     if os.path.exists(BACKUP_FILE):
-        shutil.copy2(BACKUP_FILE, CARDAPIO_FILE)
+        try:
+            with open(BACKUP_FILE, 'r', encoding='utf-8') as f:
+                backup = json.load(f)
+            sync_menu(backup)
+            db.session.commit()
+            menu_cache.invalidate()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"success": False, "message": f"Erro ao restaurar backup: {str(e)}"}), 500
         log_activity("Restaurou backup do cardápio")
         return jsonify({"success": True, "message": "Backup restaurado com sucesso!"})
     
@@ -803,138 +726,119 @@ def validar_cupom():
         data = request.get_json()
         codigo = data.get('codigo', '').upper().strip()
         
-        if not os.path.exists(COUPONS_FILE):
-            # Cria cupons padrão se o arquivo não existir
-            default_coupons = {
-                "PIZZA10": {"valor": 10, "tipo": "porcentagem", "desc": "10% OFF"},
-                "BEMVINDO": {"valor": 5.00, "tipo": "fixo", "desc": "R$ 5,00 de desconto"}
-            }
-            with open(COUPONS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(default_coupons, f, indent=4, ensure_ascii=False)
-        
-        with open(COUPONS_FILE, 'r', encoding='utf-8') as f:
-            coupons = json.load(f)
-            
-        if codigo in coupons:
-            return jsonify({"valid": True, "codigo": codigo, **coupons[codigo]})
-        
-        return jsonify({"valid": False, "message": "Cupom inválido ou expirado."})
+        # Cache em memória; só o limite por cliente consulta o banco (índice cupom+telefone)
+        cupom = check_coupon(coupon_cache, codigo, phone=data.get('phone'))
+        return jsonify({"valid": True, "codigo": codigo, "valor": cupom['valor'], "tipo": cupom['tipo'], "desc": cupom['desc']})
+    except CouponError as e:
+        return jsonify({"valid": False, "message": str(e)})
     except Exception as e:
         return jsonify({"valid": False, "message": "Erro ao processar cupom."}), 500
 
-
-def parse_price(price_input):
-    if not price_input: return 0.0
-    if isinstance(price_input, (int, float)): return float(price_input)
-    try:
-        # Remove R$, spaces, convert , to .
-        clean = str(price_input).replace('R$', '').replace(' ', '').replace('.', '').replace(',', '.')
-        return float(clean)
-    except:
-        return 0.0
-
 # --- API DE PEDIDOS ---
 
-# Helper para converter Pedido SQL -> Dict (Compatibilidade Legada)
-def pedido_to_dict(p):
-    # Recupera metadados
-    meta = {}
-    if p.metadata_json:
-        try: meta = json.loads(p.metadata_json)
-        except: pass
-    
-    items_list = []
-    for i in p.itens:
-        items_list.append({
-            "name": i.produto_nome,
-            "price": f"R$ {i.preco_unitario:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        })
-    
-    return {
-        "id": p.id,
-        "customer": p.cliente_nome,
-        "phone": p.cliente_telefone,
-        "method": meta.get('metodo_envio', ''),
-        "address": p.cliente_endereco,
-        "total": f"R$ {p.total:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-        "items": items_list,
-        "obs": meta.get('obs', ''), # Assumindo que obs está no meta ou criar campo
-        "coupon": meta.get('coupon'),
-        "fee": f"R$ {meta.get('taxa_entrega', 0):,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-        "timestamp": p.data_hora.strftime("%d/%m/%Y %H:%M:%S"),
-        "status": p.status,
-        "motoboy": meta.get('motoboy'),
-        "payment_info": {
-            "method": p.metodo_pagamento or "Não informado",
-            "change": meta.get('troco_para')
-        }
-    }
+# Folga do cursor de /api/admin/pedidos?since= (pedidos repetidos são inofensivos, perdidos não)
+ORDER_CURSOR_SKEW = timedelta(seconds=5)
+
+def active_orders():
+    """Fila ativa (tudo que não foi concluído), mais recentes primeiro"""
+    return order_reads.fetch(Pedido.status != 'concluido')
+
+def publish_pedido(pedido):
+    """Avisa as telas conectadas (SSE) depois do commit de uma alteração no pedido"""
+    if pedido.status == 'concluido':
+        order_events.publish('removido', {"id": pedido.id})
+    else:
+        order_events.publish('pedido', order_reads.serialize(pedido))
+
+# Pedidos novos gravados por uma thread só, em lotes (um commit por lote no pico)
+order_writer = OrderWriter(app, product_resolver, coupon_cache, on_commit=publish_pedido)
+
+def troco_text(valor):
+    """'Troco para' como o cliente digitou (texto livre ou número); None se vazio"""
+    if valor is None:
+        return None
+    return str(valor).strip()[:50] or None
+
+# Helpers da cotação (pricing.py)
+def quote_response(quote, status=200, message=None):
+    body = {"success": status == 200, "cotacao": quote, "token": pricing.sign(quote)}
+    if message:
+        body['message'] = message
+    return jsonify(body), status
+
+def quote_items(quote):
+    """Itens da cotação no formato de insert_order_items"""
+    return [
+        {"id": i['id'], "nome": i['nome'], "quantidade": i['qtd'], "preco": i['preco'], "obs": i['obs']}
+        for i in quote['itens']
+    ]
+
+@app.route('/api/pedido/cotacao', methods=['POST'])
+def cotacao_pedido():
+    """Cotação assinada do carrinho; o site chama a cada alteração e envia o token junto com o pedido"""
+    data = request.get_json() or {}
+    try:
+        quote = pricing.quote(
+            data.get('items', []),
+            tipo_entrega=data.get('tipo_entrega') or data.get('method') or 'Retirada',
+            coupon=data.get('cupom') or data.get('coupon'),
+            phone=data.get('telefone') or data.get('phone'),
+            lat=data.get('lat'), lon=data.get('lon')
+        )
+    except QuoteError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    return quote_response(quote)
 
 @app.route('/api/pedido/novo', methods=['POST'])
 def novo_pedido():
     try:
         data = request.get_json()
         
-        # Validação: Valor Total > 0
-        total_str = data.get('total', '0').replace('R$', '').replace('.', '').replace(',', '.').strip()
-        try:
-            total_val = float(total_str)
-            if total_val <= 0:
-                pass 
-                # return jsonify({"success": False, "message": "O valor total do pedido deve ser maior que zero."}), 400
-        except ValueError:
-            return jsonify({"success": False, "message": "Valor total inválido."}), 400
-
-        # Recupera taxa de entrega
-        fee_str = data.get('fee', '0').replace('R$ ', '').replace('R$', '').replace('.', '').replace(',', '.').strip()
-        try: fee_val = float(fee_str)
-        except: fee_val = 0.0
+        # Preços, cupom e taxa vêm da cotação do servidor; o total do cliente só é conferido
+        quote = pricing.checkout(
+            token=data.get('cotacao'),
+            client_total=parse_price(data.get('total')) if data.get('total') else None,
+            items=[{"nome": item.get('name'), "id": item.get('id'), "qtd": item.get('qtd')} for item in data.get('items', [])],
+            tipo_entrega=data.get('method'),
+            coupon=data.get('coupon'),
+            phone=data.get('phone'),
+            lat=data.get('lat'), lon=data.get('lon')
+        )
 
+        coupon_code = quote['cupom']
         meta = {
-            "taxa_entrega": fee_val,
-            "coupon": data.get('coupon'),
-            "metodo_envio": data.get('method'),
-            "obs": data.get('obs', ''),
-            "motoboy": None,
-            "troco_para": data.get('change')
+            "desconto_promocao": quote['desconto_promocao'],
+            "desconto_cupom": quote['desconto_cupom'],
+            "obs": data.get('obs', '')
         }
 
-        # Cria Pedido SQL
-        pedido = Pedido(
-            data_hora=datetime.now(),
-            cliente_nome=data.get('customer'),
-            cliente_telefone=data.get('phone'),
-            cliente_endereco=data.get('address'),
-            status='Pendente', # Status inicial
-            metodo_pagamento=data.get('paymentMethod', 'Site'),
-            total=total_val,
-            metadata_json=json.dumps(meta)
-        )
-        db.session.add(pedido)
-        db.session.flush() # Gerar ID (necessário para itens)
-        
-        # Cria Itens
-        for item in data.get('items', []):
-            # Parse preço unitario
-            i_price = parse_price(item.get('price'))
-            
-            # Tenta linkar com produto existente
-            prod = Produto.query.filter_by(nome=item.get('name')).first()
-            
-            item_obj = ItemPedido(
-                pedido_id=pedido.id,
-                produto_nome=item.get('name'),
-                produto_id=prod.id if prod else None,
-                quantidade=1, 
-                preco_unitario=i_price,
-                observacao=""
-            )
-            db.session.add(item_obj)
+        # Grava Pedido SQL + cupom + itens (preços da cotação) pela fila de gravação
+        pedido_id = order_writer.write({
+            "data_hora": datetime.now(),
+            "cliente_nome": data.get('customer'),
+            "cliente_telefone": data.get('phone'),
+            "cliente_endereco": data.get('address'),
+            "status": 'Pendente', # Status inicial
+            "metodo_pagamento": data.get('paymentMethod', 'Site'),
+            "total": quote['total'],
+            "metodo_envio": quote['tipo_entrega'],
+            "taxa_entrega": quote['taxa_entrega'],
+            "cupom_codigo": coupon_code,
+            "troco_para": troco_text(data.get('change')),
+            "metadata_json": json.dumps(meta)
+        }, quote_items(quote), coupon=coupon_code, phone=data.get('phone'))
             
-        db.session.commit()
-            
-        return jsonify({"success": True})
+        return jsonify({"success": True, "id": pedido_id, "total": quote['total']})
 
+    except QuoteMismatch as e:
+        db.session.rollback()
+        return quote_response(e.quote, 409, str(e))
+    except (QuoteError, CouponError) as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e)}), 400
+    except OrderQueueFull as e:
+        # Fila cheia ou pedido ainda em gravação (OrderPending): a mensagem diz se pode reenviar
+        return jsonify({"success": False, "message": str(e)}), 503
     except Exception as e:
         db.session.rollback()
         print(f"Erro ao criar pedido: {e}")
@@ -946,9 +850,7 @@ def novo_pedido_online():
         data = request.get_json()
         
         # 1. Config Check
-        config = {}
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f: config = json.load(f)
+        config = config_store.read()
         
         if not config.get('online_ordering_enabled', False):
             return jsonify({"success": False, "message": "Pedidos online estão temporariamente desativados."}), 403
@@ -965,58 +867,62 @@ def novo_pedido_online():
         manual_confirm = config.get('manual_payment_confirm', True)
         initial_status = 'Aguardando Confirmação' if manual_confirm else 'Pendente'
 
-        # 4. Calcula Totais
-        total_items = 0.0
-        # Re-confirma precos do banco para seguranca (Simplificado aqui, confia no front por enqto ou TODO)
-        total_items = float(data.get('total', 0)) # TODO: Validar server-side
+        # 4. Calcula Totais (cotação do servidor; o total enviado pelo cliente só é conferido)
+        quote = pricing.checkout(
+            token=data.get('cotacao'),
+            client_total=data.get('total'),
+            items=items,
+            tipo_entrega=data.get('tipo_entrega', 'Retirada'),
+            coupon=data.get('cupom') or data.get('coupon'),
+            phone=cliente.get('telefone'),
+            lat=data.get('lat'), lon=data.get('lon')
+        )
         
         # 5. Metadata (Pagamento e Endereco)
+        coupon_code = quote['cupom']
         meta = {
-            "metodo_envio": data.get('tipo_entrega', 'Retirada'), # Entrega ou Retirada
-            "taxa_entrega": data.get('taxa_entrega', 0),
+            "desconto_promocao": quote['desconto_promocao'],
+            "desconto_cupom": quote['desconto_cupom'],
             "obs": data.get('obs', ''),
             "forma_pagamento": pagamento.get('metodo'), # 'maquina_cartao', 'maquina_pix', 'dinheiro'
-            "troco_para": pagamento.get('troco_para'),
-            "endereco_completo": f"{cliente.get('rua')}, {cliente.get('numero')} - {cliente.get('bairro')}" if data.get('tipo_entrega') == 'Entrega' else 'Retirada no Balcão'
+            "endereco_completo": f"{cliente.get('rua')}, {cliente.get('numero')} - {cliente.get('bairro')}" if quote['tipo_entrega'] == 'Entrega' else 'Retirada no Balcão'
         }
 
-        # 6. Cria Pedido
-        novo_pedido = Pedido(
-            cliente_nome=cliente.get('nome'),
-            cliente_telefone=cliente.get('telefone'),
-            cliente_endereco=meta['endereco_completo'],
-            status=initial_status,
-            metodo_pagamento=pagamento.get('metodo_label'), # Texto legivel: "Cartão (Maquininha)"
-            total=total_items,
-            metadata_json=json.dumps(meta, ensure_ascii=False)
-        )
-        db.session.add(novo_pedido)
-        db.session.flush() # ID
-
-        # 7. Itens
-        for item in items:
-            item_db = ItemPedido(
-                pedido_id=novo_pedido.id,
-                produto_nome=item.get('nome'),
-                produto_id=item.get('id'), # Pode ser None
-                quantidade=int(item.get('qtd', 1)),
-                preco_unitario=float(item.get('preco', 0)),
-                observacao=item.get('obs', '')
-            )
-            db.session.add(item_db)
-
-        db.session.commit()
+        # 6. Cria Pedido + cupom + 7. Itens (preços da cotação), gravados pela fila de gravação
+        pedido_id = order_writer.write({
+            "cliente_nome": cliente.get('nome'),
+            "cliente_telefone": cliente.get('telefone'),
+            "cliente_endereco": meta['endereco_completo'],
+            "status": initial_status,
+            "metodo_pagamento": pagamento.get('metodo_label'), # Texto legivel: "Cartão (Maquininha)"
+            "total": quote['total'],
+            "metodo_envio": quote['tipo_entrega'], # Entrega ou Retirada (o da cotação assinada)
+            "taxa_entrega": quote['taxa_entrega'],
+            "cupom_codigo": coupon_code,
+            "troco_para": troco_text(pagamento.get('troco_para')),
+            "metadata_json": json.dumps(meta, ensure_ascii=False)
+        }, quote_items(quote), coupon=coupon_code, phone=cliente.get('telefone'))
         
         # Log (Opcional)
-        # log_activity(f"Novo pedido online #{novo_pedido.id} - {novo_pedido.status}")
+        # log_activity(f"Novo pedido online #{pedido_id} - {initial_status}")
 
         return jsonify({
             "success": True, 
-            "id": novo_pedido.id, 
+            "id": pedido_id, 
             "message": "Pedido recebido com sucesso!",
-            "status": initial_status
+            "status": initial_status,
+            "total": quote['total']
         })
 
+    except QuoteMismatch as e:
+        db.session.rollback()
+        return quote_response(e.quote, 409, str(e))
+    except (QuoteError, CouponError) as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e)}), 400
+    except OrderQueueFull as e:
+        # Fila cheia ou pedido ainda em gravação (OrderPending): a mensagem diz se pode reenviar
+        return jsonify({"success": False, "message": str(e)}), 503
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "message": f"Erro interno: {str(e)}"}), 500
@@ -1028,11 +934,51 @@ def get_pedidos():
     if not session.get('logged_in'):
         return jsonify([]), 401
     
+    # Cursor = instante desta leitura; o cliente devolve em ?since= na próxima
+    cursor = datetime.utcnow()
+    since = request.args.get('since')
+    if since:
+        # Só o que mudou desde o cursor: pedidos ativos completos + ids que saíram da fila
+        try:
+            since_dt = datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({"success": False, "message": "Cursor inválido"}), 400
+        # Margem para transações que gravaram updated_at antes do cursor mas commitaram depois
+        changed = Pedido.updated_at >= since_dt - ORDER_CURSOR_SKEW
+        return jsonify({
+            "cursor": cursor.isoformat(),
+            "pedidos": order_reads.fetch(changed, Pedido.status != 'concluido'),
+            "removidos": db.session.scalars(db.select(Pedido.id).where(changed, Pedido.status == 'concluido')).all()
+        })
+
     # Busca pedidos que NÃO estão concluídos (fila ativa)
     # Assumindo que 'concluido' sai da tela principal
-    pedidos = Pedido.query.filter(Pedido.status != 'concluido').order_by(Pedido.data_hora.desc()).all()
-    
-    return jsonify([pedido_to_dict(p) for p in pedidos])
+    response = jsonify(active_orders())
+    response.headers['X-Pedidos-Cursor'] = cursor.isoformat()
+    return response
+
+@app.route('/api/admin/pedidos/stream')
+def pedidos_stream():
+    """
+    Server-Sent Events da fila de pedidos: 'snapshot' com a lista completa na
+    conexão e depois só 'pedido' (criado/alterado) e 'removido'. O navegador
+    reenvia Last-Event-ID ao reconectar e recebe apenas o que perdeu.
+    (Cada tela conectada ocupa uma thread: rode com servidor threaded/gevent.)
+    """
+    if not session.get('logged_in'):
+        return jsonify([]), 401
+
+    def snapshot():
+        try:
+            return active_orders()
+        finally:
+            db.session.close() # Não segura conexão/lock do banco durante o stream
+
+    seq = order_events.parse_cursor(request.headers.get('Last-Event-ID') or request.args.get('cursor'))
+    response = Response(stream_with_context(stream_events(order_events, seq, snapshot)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # nginx: não bufferizar
+    return response
 
 @app.route('/api/admin/pedido/concluir', methods=['POST'])
 def concluir_pedido():
@@ -1045,70 +991,37 @@ def concluir_pedido():
     try:
         pedido = Pedido.query.get(order_id)
         if pedido:
-            # --- Lógica de Estoque (Fase 2) ---
-            # Carrega Config
-            config = {}
-            if os.path.exists(CONFIG_FILE):
-                try: 
-                    with open(CONFIG_FILE, 'r') as f: 
-                        config = json.load(f)
-                except: pass
-            
-            print(f"DEBUG: Concluding Order {order_id}. Config Inventory: {config.get('inventory_enabled')}")
+            # Troca o status num UPDATE condicional: se dois caixas concluírem ao mesmo
+            # tempo, só um baixa o estoque e soma os pontos
+            concluiu = db.session.execute(
+                db.update(Pedido)
+                .where(Pedido.id == pedido.id, Pedido.status != 'concluido')
+                .values(status='concluido', updated_at=datetime.utcnow())
+            ).rowcount == 1
             
-            if config.get('inventory_enabled', False):
-                allow_negative = config.get('allow_negative_stock', True)
-                print(f"DEBUG: Allow Negative: {allow_negative}")
+            if concluiu:
+                # --- Lógica de Estoque (Fase 2): baixa de todos os ingredientes num UPDATE só ---
+                config = {}
+                try: config = config_store.read()
+                except ValueError: pass
                 
-                # Verifica Estoque Primeiro (se não permitir negativo)
-                if not allow_negative:
-                    for item in pedido.itens:
-                        if not item.produto_id: 
-                            print(f"DEBUG: Item {item.produto_nome} has no Product ID")
-                            continue
-                        receita = FichaTecnica.query.filter_by(produto_id=item.produto_id).all()
-                        if not receita: print(f"DEBUG: No recipe for Product {item.produto_id}")
-                        for r in receita:
-                            qtd_necessaria = r.quantidade * item.quantidade
-                            if r.ingrediente.estoque_atual < qtd_necessaria:
-                                return jsonify({"success": False, "message": f"Estoque insuficiente de {r.ingrediente.nome}. Necessário: {qtd_necessaria}, Atual: {r.ingrediente.estoque_atual}"}), 400
+                if config.get('inventory_enabled', False):
+                    deduct_stock(pedido.id, allow_negative=config.get('allow_negative_stock', True))
                 
-                # Baixa o Estoque
-                print("DEBUG: Deducting Stock...")
-                for item in pedido.itens:
-                    if not item.produto_id: continue
-                    receita = FichaTecnica.query.filter_by(produto_id=item.produto_id).all()
-                    for r in receita:
-                        qtd_necessaria = r.quantidade * item.quantidade
-                        r.ingrediente.estoque_atual -= qtd_necessaria
-                        print(f"DEBUG: Deducted {qtd_necessaria} from {r.ingrediente.nome}. New Stock: {r.ingrediente.estoque_atual}")
-                        db.session.add(r.ingrediente) # Marca para update
-
-            pedido.status = 'concluido'
-            
-            # --- Lógica de Fidelidade (Híbrida: Mantendo JSON por enquanto) ---
-            try:
-                # Extrai apenas números do telefone
-                phone = ''.join(filter(str.isdigit, pedido.cliente_telefone or ''))
-                points = int(pedido.total) # 1 ponto por real
-                
-                if phone and points > 0:
-                    loyalty = {}
-                    if os.path.exists(LOYALTY_FILE):
-                        with open(LOYALTY_FILE, 'r', encoding='utf-8') as lf:
-                            loyalty = json.load(lf)
-                    
-                    loyalty[phone] = loyalty.get(phone, 0) + points
-                    
-                    with open(LOYALTY_FILE, 'w', encoding='utf-8') as lf:
-                        json.dump(loyalty, lf, indent=4)
-            except Exception as e: print(f"Erro fidelidade: {e}")
+                # --- Lógica de Fidelidade (extrato + saldo no banco, mesmo commit do status) ---
+                points = int(pedido.total or 0) # 1 ponto por real
+                if points > 0:
+                    add_points(pedido.cliente_telefone, points, pedido_id=pedido.id)
             
             db.session.commit()
+            publish_pedido(pedido)
             log_activity(f"Concluiu pedido #{order_id} (SQL)")
             return jsonify({"success": True})
             
         return jsonify({"success": False, "message": "Pedido não encontrado"}), 404
+    except StockShortage as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e), "faltas": e.faltas}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
@@ -1127,6 +1040,7 @@ def update_pedido_status():
         if pedido:
             pedido.status = new_status
             db.session.commit()
+            publish_pedido(pedido)
             log_activity(f"Alterou status do pedido #{order_id} para {new_status} (SQL)")
             return jsonify({"success": True})
         return jsonify({"success": False, "message": "Pedido não encontrado"}), 404
@@ -1151,6 +1065,7 @@ def update_pedido_total():
         if pedido:
             pedido.total = total_val
             db.session.commit()
+            publish_pedido(pedido)
             log_activity(f"Atualizou total do pedido #{order_id} (SQL)")
             return jsonify({"success": True})
         return jsonify({"success": False, "message": "Pedido não encontrado"}), 404
@@ -1169,18 +1084,9 @@ def update_pedido_motoboy():
     try:
         pedido = Pedido.query.get(order_id)
         if pedido:
-            # Motoboy geralmente fica no metadata se não tiver coluna
-            # Mas vamos checar se tem coluna? Não tem. Metadata it is.
-            # Precisa ler metadata, update, save
-            meta = {}
-            if pedido.metadata_json:
-                try: meta = json.loads(pedido.metadata_json)
-                except: pass
-            
-            meta['motoboy'] = motoboy
-            pedido.metadata_json = json.dumps(meta)
-            
+            pedido.motoboy = motoboy or None
             db.session.commit()
+            publish_pedido(pedido)
             log_activity(f"Definiu motoboy {motoboy} para pedido #{order_id} (SQL)")
             return jsonify({"success": True})
         return jsonify({"success": False, "message": "Pedido não encontrado"}), 404
@@ -1201,9 +1107,19 @@ def get_historico():
     if not session.get('logged_in'):
         return jsonify([]), 401
     
-    # Busca pedidos CONCLUÍDOS
-    pedidos = Pedido.query.filter_by(status='concluido').order_by(Pedido.data_hora.desc()).all()
-    return jsonify([pedido_to_dict(p) for p in pedidos])
+    # Pedidos CONCLUÍDOS, uma página por vez (?cursor= com o "proximo" da página anterior)
+    try:
+        return jsonify(order_reads.history(
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', HISTORY_PAGE_SIZE, type=int),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            telefone=request.args.get('telefone'),
+            pagamento=request.args.get('pagamento'),
+            motoboy=request.args.get('motoboy')
+        ))
+    except ValueError:
+        return jsonify({"success": False, "message": "Filtro ou cursor inválido"}), 400
 
 @app.route('/api/admin/historico/csv')
 def export_historico_csv():
@@ -1212,53 +1128,66 @@ def export_historico_csv():
     
     start_date = request.args.get('start')
     end_date = request.args.get('end')
+    compactar = request.args.get('gzip') in ('1', 'true')
     
-    query = Pedido.query.filter_by(status='concluido')
-    
-    if start_date and end_date:
-        try:
-            # Ajusta para cobrir o dia inteiro
-            s_dt = datetime.strptime(start_date, "%Y-%m-%d")
-            e_dt = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59, second=59)
-            query = query.filter(Pedido.data_hora >= s_dt, Pedido.data_hora <= e_dt)
-        except: pass
+    try:
+        criteria = history_criteria(
+            start=start_date if start_date and end_date else None,
+            end=end_date if start_date and end_date else None,
+            telefone=request.args.get('telefone'),
+            pagamento=request.args.get('pagamento'),
+            motoboy=request.args.get('motoboy')
+        )
+    except ValueError:
+        criteria = history_criteria()  # Datas inválidas: exporta o histórico geral, como antes
+    
+    def generate():
+        # Linhas saem em blocos conforme o banco entrega os lotes (nada de montar o arquivo inteiro em memória)
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=';')
+        compressor = zlib.compressobj(wbits=31) if compactar else None  # wbits=31: formato gzip
         
-    pedidos = query.order_by(Pedido.data_hora.desc()).all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';')
-    writer.writerow(['ID', 'Data', 'Cliente', 'Telefone', 'Metodo', 'Endereco', 'Total', 'Itens', 'Obs', 'Motoboy', 'Status Final'])
-    
-    for p in pedidos:
-        # Recupera meta
-        meta = {}
-        if p.metadata_json:
-            try: meta = json.loads(p.metadata_json)
-            except: pass
-            
-        # Formata itens
-        item_str = " | ".join([f"{i.produto_nome} (R$ {i.preco_unitario:.2f})" for i in p.itens])
+        def chunk():
+            data = output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+            return compressor.compress(data) if compressor else data
         
-        writer.writerow([
-            p.id,
-            p.data_hora.strftime("%d/%m/%Y %H:%M:%S"),
-            p.cliente_nome,
-            p.cliente_telefone,
-            meta.get('metodo_envio', ''),
-            p.cliente_endereco,
-            f"R$ {p.total:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-            item_str,
-            meta.get('obs', ''),
-            meta.get('motoboy', ''),
-            p.status
-        ])
+        output.write('\ufeff')  # BOM para o Excel abrir em UTF-8
+        writer.writerow(['ID', 'Data', 'Cliente', 'Telefone', 'Metodo', 'Endereco', 'Total', 'Itens', 'Obs', 'Motoboy', 'Status Final'])
+        yield chunk()
         
-    output.seek(0)
+        for n, (p, itens, meta) in enumerate(order_reads.iter_rows(*criteria), 1):
+            # Formata itens
+            item_str = " | ".join([f"{f'{qtd}x ' if qtd and qtd > 1 else ''}{nome} (R$ {preco:.2f})" for nome, qtd, preco in itens])
+            
+            writer.writerow([
+                p.id,
+                p.data_hora.strftime("%d/%m/%Y %H:%M:%S"),
+                p.cliente_nome,
+                p.cliente_telefone,
+                p.metodo_envio or '',
+                p.cliente_endereco,
+                format_price(p.total),
+                item_str,
+                meta.get('obs', ''),
+                p.motoboy or '',
+                p.status
+            ])
+            if n % EXPORT_BATCH_SIZE == 0:
+                data = chunk()
+                if data:
+                    yield data
+        
+        yield chunk() + (compressor.flush() if compressor else b'')
+    
     filename = f"historico_pedidos_{start_date}_a_{end_date}.csv" if start_date and end_date else "historico_pedidos_geral.csv"
+    if compactar:
+        filename += '.gz'
     
     return Response(
-        output.getvalue().encode('utf-8-sig'),
-        mimetype="text/csv",
+        stream_with_context(generate()),
+        mimetype="application/gzip" if compactar else "text/csv",
         headers={"Content-disposition": f"attachment; filename={filename}"}
     )
 
@@ -1268,12 +1197,8 @@ def admin_dashboard():
         return redirect(url_for('login'))
         
     inventory_enabled = False
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                cfg = json.load(f)
-                inventory_enabled = cfg.get('inventory_enabled', False)
-        except: pass
+    try: inventory_enabled = config_store.read().get('inventory_enabled', False)
+    except ValueError: pass
         
     return render_template('admin_dashboard.html', title='Dashboard — Pizzaria Colonial', inventory_enabled=inventory_enabled)
 
@@ -1284,11 +1209,8 @@ def admin_estoque():
         
     # Checa se está habilitado
     config = {}
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except: pass
+    try: config = config_store.read()
+    except ValueError: pass
         
     if not config.get('inventory_enabled', False):
          flash('O módulo de estoque está desativado.', 'warning')
@@ -1305,11 +1227,8 @@ def admin_estoque_baixo():
         
     # Checa se está habilitado
     config = {}
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except: pass
+    try: config = config_store.read()
+    except ValueError: pass
         
     if not config.get('inventory_enabled', False):
          flash('O módulo de estoque está desativado.', 'warning')
@@ -1317,6 +1236,22 @@ def admin_estoque_baixo():
 
     return render_template('admin_estoque_baixo.html', title='Relatório de Baixo Estoque — Pizzaria Colonial')
 
+@app.route('/admin/estoque/margens')
+def admin_estoque_margens():
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+        
+    # Checa se está habilitado
+    config = {}
+    try: config = config_store.read()
+    except ValueError: pass
+        
+    if not config.get('inventory_enabled', False):
+         flash('O módulo de estoque está desativado.', 'warning')
+         return redirect(url_for('admin_dashboard'))
+
+    return render_template('admin_estoque_margens.html', title='Custo e Margem dos Produtos — Pizzaria Colonial')
+
 @app.route('/api/admin/reservas', methods=['GET'])
 def api_admin_reservas():
     if not session.get('logged_in'):
@@ -1409,33 +1344,28 @@ def admin_config():
         
     if request.method == 'POST':
         try:
-            # Carrega config atual
-            current_config = {}
-            if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    current_config = json.load(f)
-            
             # Atualiza com dados do form
             data = request.form
             
-            # Checkbox html: se não marcado, não vem no form.
-            current_config['inventory_enabled'] = 'inventory_enabled' in data
-            current_config['allow_negative_stock'] = 'allow_negative_stock' in data
-            current_config['ai_enabled'] = 'ai_enabled' in data
-            current_config['self_service_enabled'] = 'self_service_enabled' in data
-            current_config['rodizio_pizza_enabled'] = 'rodizio_pizza_enabled' in data
-            current_config['rodizio_carne_enabled'] = 'rodizio_carne_enabled' in data
-            
-            # Campos de texto
-            current_config['tempo_espera'] = data.get('tempo_espera')
-            current_config['telefone'] = data.get('telefone')
-            current_config['whatsapp'] = data.get('whatsapp')
-            current_config['endereco_principal'] = data.get('endereco_principal')
-            current_config['theme'] = data.get('theme')
-            current_config['sobre_nos'] = data.get('sobre_nos')
+            def apply_form(current_config):
+                # Checkbox html: se não marcado, não vem no form.
+                current_config['inventory_enabled'] = 'inventory_enabled' in data
+                current_config['allow_negative_stock'] = 'allow_negative_stock' in data
+                current_config['ai_enabled'] = 'ai_enabled' in data
+                current_config['self_service_enabled'] = 'self_service_enabled' in data
+                current_config['rodizio_pizza_enabled'] = 'rodizio_pizza_enabled' in data
+                current_config['rodizio_carne_enabled'] = 'rodizio_carne_enabled' in data
+                
+                # Campos de texto
+                current_config['tempo_espera'] = data.get('tempo_espera')
+                current_config['telefone'] = data.get('telefone')
+                current_config['whatsapp'] = data.get('whatsapp')
+                current_config['endereco_principal'] = data.get('endereco_principal')
+                current_config['theme'] = data.get('theme')
+                current_config['sobre_nos'] = data.get('sobre_nos')
             
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(current_config, f, indent=4, ensure_ascii=False)
+            # Carrega config atual, aplica o form e grava (atômico)
+            config_store.update(apply_form)
                 
             flash('Configurações salvas com sucesso!', 'success')
             return redirect(url_for('admin_config'))
@@ -1445,58 +1375,58 @@ def admin_config():
     
     # GET: Carrega config para exibir
     config = {}
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        except: pass
+    try: config = config_store.read()
+    except ValueError: pass
         
     return render_template('admin_config.html', title='Configurações — Pizzaria Colonial', config=config)
 
+def _stats_period():
+    """Período dos gráficos (?start=&end=, dias inteiros) como critérios sobre Pedido.data_hora; sem período, tudo"""
+    start_date = request.args.get('start')
+    end_date = request.args.get('end')
+    if not (start_date and end_date):
+        return []
+    inicio = datetime.strptime(start_date, "%Y-%m-%d")
+    fim = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59, second=59, microsecond=999999)
+    return [Pedido.data_hora >= inicio, Pedido.data_hora <= fim]
+
+def _as_date(value):
+    # func.date() devolve texto no SQLite e date nos servidores
+    return value if not isinstance(value, str) else datetime.strptime(value, "%Y-%m-%d").date()
+
 @app.route('/api/admin/stats')
 def admin_stats():
     if not session.get('logged_in'):
         return jsonify({}), 401
     
-    start_date = request.args.get('start')
-    end_date = request.args.get('end')
-    
-    dates = []
-    
-    def extract_dates(file_path):
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for item in data:
-                        if 'timestamp' in item:
-                            # Extrai data (dd/mm/yyyy)
-                            date_str = item['timestamp'].split(' ')[0]
-                            
-                            # Filtro de Data
-                            if start_date and end_date:
-                                try:
-                                    item_dt = datetime.strptime(date_str, "%d/%m/%Y").date()
-                                    start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
-                                    end_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
-                                    if not (start_dt <= item_dt <= end_dt):
-                                        continue
-                                except: pass
-                            
-                            dates.append(date_str)
-            except: pass
-
-    # Coleta datas de pedidos ativos e do histórico
-    extract_dates(ORDERS_FILE)
-    extract_dates(HISTORY_FILE)
-    
-    counts = Counter(dates)
-    # Ordena cronologicamente
-    sorted_dates = sorted(counts.keys(), key=lambda x: datetime.strptime(x, "%d/%m/%Y"))
+    try:
+        criteria = _stats_period()
+    except ValueError:
+        return jsonify({"success": False, "message": "Período inválido"}), 400
+    
+    # Pedidos por dia, por tipo de entrega e por cupom: GROUP BY nas colunas de pedidos
+    dia = db.func.date(Pedido.data_hora)
+    por_dia = db.session.execute(
+        db.select(dia, db.func.count(Pedido.id)).where(*criteria).group_by(dia).order_by(dia)
+    ).all()
+    por_envio = db.session.execute(
+        db.select(Pedido.metodo_envio, db.func.count(Pedido.id))
+        .where(Pedido.metodo_envio.is_not(None), *criteria)
+        .group_by(Pedido.metodo_envio)
+    ).all()
+    cupons = db.func.count(Pedido.id)
+    por_cupom = db.session.execute(
+        db.select(Pedido.cupom_codigo, cupons, db.func.sum(Pedido.total))
+        .where(Pedido.cupom_codigo.is_not(None), *criteria)
+        .group_by(Pedido.cupom_codigo)
+        .order_by(cupons.desc())
+    ).all()
     
     return jsonify({
-        "labels": sorted_dates,
-        "values": [counts[d] for d in sorted_dates]
+        "labels": [_as_date(d).strftime("%d/%m/%Y") for d, _ in por_dia if d],
+        "values": [total for d, total in por_dia if d],
+        "metodos_envio": {metodo: total for metodo, total in por_envio},
+        "cupons": [{"cupom": codigo, "pedidos": total, "faturamento": format_price(valor)} for codigo, total, valor in por_cupom]
     })
 
 @app.route('/api/admin/stats/categories')
@@ -1504,50 +1434,26 @@ def admin_stats_categories():
     if not session.get('logged_in'):
         return jsonify({}), 401
     
-    start_date = request.args.get('start')
-    end_date = request.args.get('end')
-    
-    # Carrega mapeamento de itens -> categorias para saber a qual categoria o item pertence
-    item_category_map = {}
-    if os.path.exists(CARDAPIO_FILE):
-        try:
-            with open(CARDAPIO_FILE, 'r', encoding='utf-8') as f:
-                menu = json.load(f)
-                for category, items in menu.items():
-                    for item in items:
-                        item_category_map[item['nome'].lower().strip()] = category
-        except: pass
-        
-    category_counts = Counter()
-    
-    def process_orders(file_path):
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for order in data:
-                        # Filtro de Data
-                        if start_date and end_date and 'timestamp' in order:
-                            try:
-                                order_dt = datetime.strptime(order['timestamp'].split(' ')[0], "%d/%m/%Y").date()
-                                s_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
-                                e_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
-                                if not (s_dt <= order_dt <= e_dt):
-                                    continue
-                            except: pass
-                        
-                        for item in order.get('items', []):
-                            name = item['name'].lower().strip()
-                            cat = item_category_map.get(name, 'Outros')
-                            category_counts[cat] += 1
-            except: pass
-
-    process_orders(ORDERS_FILE)
-    process_orders(HISTORY_FILE)
+    try:
+        criteria = _stats_period()
+    except ValueError:
+        return jsonify({"success": False, "message": "Período inválido"}), 400
+    
+    # Itens vendidos por categoria do produto (itens sem produto cadastrado: 'Outros')
+    categoria = db.func.coalesce(Categoria.nome, 'Outros')
+    rows = db.session.execute(
+        db.select(categoria, db.func.count(ItemPedido.id))
+        .select_from(ItemPedido)
+        .join(Pedido, Pedido.id == ItemPedido.pedido_id)
+        .outerjoin(Produto, Produto.id == ItemPedido.produto_id)
+        .outerjoin(Categoria, Categoria.id == Produto.categoria_id)
+        .where(*criteria)
+        .group_by(categoria)
+    ).all()
     
     return jsonify({
-        "labels": list(category_counts.keys()),
-        "values": list(category_counts.values())
+        "labels": [nome for nome, _ in rows],
+        "values": [total for _, total in rows]
     })
 
 @app.route('/api/admin/stats/clients')
@@ -1555,86 +1461,37 @@ def admin_stats_clients():
     if not session.get('logged_in'):
         return jsonify([]), 401
     
-    start_date = request.args.get('start')
-    end_date = request.args.get('end')
-    
-    client_counts = Counter()
-    client_names = {} 
-
-    def process_orders(file_path):
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for order in data:
-                        # Filtro de Data
-                        if start_date and end_date and 'timestamp' in order:
-                            try:
-                                order_dt = datetime.strptime(order['timestamp'].split(' ')[0], "%d/%m/%Y").date()
-                                s_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
-                                e_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
-                                if not (s_dt <= order_dt <= e_dt):
-                                    continue
-                            except: pass
-                        
-                        phone = order.get('phone', '').strip()
-                        name = order.get('customer', 'Desconhecido').strip()
-                        
-                        if phone:
-                            client_counts[phone] += 1
-                            client_names[phone] = name 
-            except: pass
-
-    process_orders(ORDERS_FILE)
-    process_orders(HISTORY_FILE)
-    
-    top_5 = client_counts.most_common(5)
-    
-    result = []
-    for phone, count in top_5:
-        result.append({
-            "name": client_names.get(phone, "Desconhecido"),
-            "phone": phone,
-            "count": count
-        })
-        
-    return jsonify(result)
+    try:
+        criteria = _stats_period()
+    except ValueError:
+        return jsonify({"success": False, "message": "Período inválido"}), 400
+    
+    # Top 5 por telefone (só dígitos, o mesmo cliente com formatações diferentes conta junto)
+    pedidos = db.func.count(Pedido.id)
+    rows = db.session.execute(
+        db.select(db.func.max(Pedido.cliente_nome), db.func.max(Pedido.cliente_telefone), pedidos)
+        .where(Pedido.cliente_telefone_digitos.is_not(None), *criteria)
+        .group_by(Pedido.cliente_telefone_digitos)
+        .order_by(pedidos.desc())
+        .limit(5)
+    ).all()
+    
+    return jsonify([{"name": name or "Desconhecido", "phone": phone, "count": count} for name, phone, count in rows])
 
 @app.route('/api/admin/stats/peak_hours')
 def admin_stats_peak_hours():
     if not session.get('logged_in'):
         return jsonify({}), 401
     
-    start_date = request.args.get('start')
-    end_date = request.args.get('end')
-    
-    hours_counts = Counter()
+    try:
+        criteria = _stats_period()
+    except ValueError:
+        return jsonify({"success": False, "message": "Período inválido"}), 400
     
-    def process_orders(file_path):
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for order in data:
-                        if 'timestamp' in order:
-                            try:
-                                # timestamp format: "dd/mm/yyyy HH:MM:SS"
-                                dt_str = order['timestamp']
-                                dt_obj = datetime.strptime(dt_str, "%d/%m/%Y %H:%M:%S")
-                                
-                                # Date filtering
-                                if start_date and end_date:
-                                    s_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
-                                    e_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
-                                    if not (s_dt <= dt_obj.date() <= e_dt):
-                                        continue
-                                
-                                hours_counts[dt_obj.hour] += 1
-                            except: pass
-            except: pass
-
-    process_orders(ORDERS_FILE)
-    process_orders(HISTORY_FILE)
+    hora = db.extract('hour', Pedido.data_hora)
+    hours_counts = dict(db.session.execute(
+        db.select(hora, db.func.count(Pedido.id)).where(Pedido.data_hora.is_not(None), *criteria).group_by(hora)
+    ).all())
     
     # Garante que todas as horas 00-23 existam no gráfico
     labels = [f"{h:02d}h" for h in range(24)]
@@ -1645,7 +1502,40 @@ def admin_stats_peak_hours():
         "values": values
     })
 
+@app.route('/api/admin/stats/motoboys')
+def admin_stats_motoboys():
+    if not session.get('logged_in'):
+        return jsonify([]), 401
+    
+    start_date = request.args.get('start')
+    end_date = request.args.get('end')
+    
+    # Sem período: semana atual (desde segunda-feira)
+    hoje = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    inicio, fim = hoje - timedelta(days=hoje.weekday()), None
+    if start_date and end_date:
+        try:
+            inicio = datetime.strptime(start_date, "%Y-%m-%d")
+            fim = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59, second=59, microsecond=999999)
+        except ValueError:
+            return jsonify({"success": False, "message": "Período inválido"}), 400
+    
+    # Um GROUP BY sobre o índice (motoboy, data_hora)
+    criteria = [Pedido.motoboy.is_not(None), Pedido.data_hora >= inicio]
+    if fim:
+        criteria.append(Pedido.data_hora <= fim)
+    entregas = db.func.count(Pedido.id)
+    rows = db.session.execute(
+        db.select(Pedido.motoboy, entregas, db.func.sum(Pedido.taxa_entrega))
+        .where(*criteria)
+        .group_by(Pedido.motoboy)
+        .order_by(entregas.desc())
+    ).all()
+    
+    return jsonify([{"motoboy": motoboy, "entregas": total, "taxas": format_price(taxas)} for motoboy, total, taxas in rows])
+
 MOTOBOYS_FILE = os.path.join(os.path.dirname(__file__), 'motoboys.json')
+motoboys_store = JsonStore(MOTOBOYS_FILE, default=list)
 
 @app.route('/admin/motoboys')
 def admin_motoboys():
@@ -1659,15 +1549,11 @@ def api_motoboys():
         return jsonify({"success": False}), 401
         
     if request.method == 'GET':
-        if os.path.exists(MOTOBOYS_FILE):
-            with open(MOTOBOYS_FILE, 'r', encoding='utf-8') as f:
-                return jsonify(json.load(f))
-        return jsonify([])
+        return jsonify(motoboys_store.read())
 
     if request.method == 'POST':
         data = request.get_json()
-        with open(MOTOBOYS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        motoboys_store.write(data)
         log_activity("Atualizou lista de motoboys")
         return jsonify({"success": True})
 
@@ -1679,10 +1565,7 @@ def api_usuarios():
         return jsonify({"success": False}), 403
         
     if request.method == 'GET':
-        if os.path.exists(USERS_FILE):
-            with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                return jsonify(json.load(f))
-        return jsonify([])
+        return jsonify(users_store.read())
         
     if request.method == 'POST':
         data = request.get_json()
@@ -1691,10 +1574,7 @@ def api_usuarios():
         
         # --- Lógica de Log de Alterações ---
         try:
-            old_users = []
-            if os.path.exists(USERS_FILE):
-                with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                    old_users = json.load(f)
+            old_users = users_store.read()
             
             old_map = {u['username']: u for u in old_users}
             new_map = {u['username']: u for u in data}
@@ -1720,8 +1600,7 @@ def api_usuarios():
             if not re.match(r'^[a-fA-F0-9]{64}$', pwd):
                 u['password'] = hashlib.sha256(pwd.encode()).hexdigest()
 
-        with open(USERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        users_store.write(data)
         
         return jsonify({"success": True})
 
@@ -1739,23 +1618,22 @@ def change_own_password():
         
     username = session.get('username')
     
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r', encoding='utf-8') as f:
-            users = json.load(f)
+    for u in users_store.read():
+        if u['username'] == username:
+            # Verifica senha atual (Hash)
+            curr_hash = hashlib.sha256(current_pass.encode()).hexdigest()
+            if u['password'] != curr_hash:
+                 return jsonify({"success": False, "message": "Senha atual incorreta"}), 400
             
-        for u in users:
-            if u['username'] == username:
-                # Verifica senha atual (Hash)
-                curr_hash = hashlib.sha256(current_pass.encode()).hexdigest()
-                if u['password'] != curr_hash:
-                     return jsonify({"success": False, "message": "Senha atual incorreta"}), 400
-                
-                # Define nova senha
-                u['password'] = hashlib.sha256(new_pass.encode()).hexdigest()
-                with open(USERS_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(users, f, indent=4)
-                log_activity(f"Alterou a própria senha")
-                return jsonify({"success": True})
+            # Define nova senha
+            new_hash = hashlib.sha256(new_pass.encode()).hexdigest()
+            def set_password(users):
+                for user in users:
+                    if user['username'] == username:
+                        user['password'] = new_hash
+            users_store.update(set_password)
+            log_activity(f"Alterou a própria senha")
+            return jsonify({"success": True})
             
     return jsonify({"success": False, "message": "Usuário não encontrado"}), 404
 
@@ -1765,25 +1643,18 @@ def api_promocoes():
         return jsonify({"success": False}), 403
         
     if request.method == 'GET':
-        if os.path.exists(PROMOS_FILE):
-            with open(PROMOS_FILE, 'r', encoding='utf-8') as f:
-                return jsonify(json.load(f))
-        return jsonify([])
+        return jsonify(promos_store.read())
         
     if request.method == 'POST':
         data = request.get_json()
-        with open(PROMOS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        promos_store.write(data)
         
         log_activity("Atualizou promoções agendadas")
         return jsonify({"success": True})
 
 @app.route('/api/admin/categorias')
 def api_categorias():
-    if os.path.exists(CARDAPIO_FILE):
-        with open(CARDAPIO_FILE, 'r', encoding='utf-8') as f:
-            return jsonify(list(json.load(f).keys()))
-    return jsonify([])
+    return jsonify(list(legacy_menu_store.read().keys()))
 
 # --- Configurações Gerais e Fidelidade ---
 
@@ -1794,33 +1665,16 @@ def api_config_geral():
         if not session.get('logged_in'):
             return jsonify({"success": False}), 401
         data = request.get_json()
-        config = {}
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        
-        config.update(data) # Atualiza/Mescla com os dados novos
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4)
+        config_store.update(lambda config: config.update(data)) # Atualiza/Mescla com os dados novos
         return jsonify({"success": True})
     
-    # GET
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return jsonify(json.load(f))
-    return jsonify({})
+    # GET (público): corpo pré-serializado, revalidado pela revisão do arquivo
+    return config_json_cache.get(config_store.revision, config_store.read).response()
 
 @app.route('/api/fidelidade/pontos', methods=['POST'])
 def api_fidelidade_pontos():
     data = request.get_json()
-    phone = ''.join(filter(str.isdigit, data.get('phone', '')))
-    
-    if os.path.exists(LOYALTY_FILE):
-        with open(LOYALTY_FILE, 'r', encoding='utf-8') as f:
-            loyalty = json.load(f)
-            return jsonify({"pontos": loyalty.get(phone, 0)})
-            
-    return jsonify({"pontos": 0})
+    return jsonify({"pontos": get_points(data.get('phone', ''))})
 
 @app.route('/api/admin/banners', methods=['GET', 'POST'])
 def api_admin_banners():
@@ -1828,15 +1682,11 @@ def api_admin_banners():
         return jsonify({"success": False}), 401
     
     if request.method == 'GET':
-        if os.path.exists(BANNERS_FILE):
-            with open(BANNERS_FILE, 'r', encoding='utf-8') as f:
-                return jsonify(json.load(f))
-        return jsonify([])
+        return jsonify(banners_store.read())
         
     if request.method == 'POST':
         data = request.get_json()
-        with open(BANNERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        banners_store.write(data)
         log_activity("Atualizou banners da home")
         return jsonify({"success": True})
 
@@ -0,0 +1,137 @@
+from flask import abort, request, send_file, url_for, Response
+from werkzeug.security import safe_join
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+try:
+    from .image_pipeline import HASHED_FILENAME
+except ImportError:
+    from image_pipeline import HASHED_FILENAME
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Arquivos de texto que vale a pena comprimir antecipadamente
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.txt'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Fotos do pipeline de imagens já têm o hash do conteúdo no nome (ver image_pipeline.py)
+HASHED_UPLOAD_RE = re.compile(rf'^/static/uploads/{HASHED_FILENAME}$')
+
+
+class Asset:
+    def __init__(self, path, full_path):
+        self.path = path
+        self.full_path = full_path
+        self.mtime = os.path.getmtime(full_path)
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        root, ext = os.path.splitext(path)
+        self.hashed_path = f"{root}.{self.digest}{ext}"
+
+        # Versões pré-comprimidas ficam em memória (só para texto: css/js/json/svg)
+        self.body = self.gzipped = self.brotli = None
+        if ext.lower() in COMPRESSIBLE:
+            self.body = data
+            self.gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.brotli = brotli.compress(data, quality=11)
+
+
+class AssetManifest:
+    """
+    Manifesto dos arquivos estáticos com impressão digital (hash do conteúdo).
+
+    asset_url('css/style.css') nos templates gera /assets/css/style.<hash>.css,
+    servido com Cache-Control imutável e em gzip/brotli pré-comprimidos.
+    Como a URL muda junto com o conteúdo, o navegador nunca precisa revalidar.
+    Em modo debug o arquivo é reprocessado sempre que for alterado em disco.
+    """
+
+    def __init__(self, app=None, url_prefix='/assets'):
+        self.url_prefix = url_prefix
+        self._lock = threading.Lock()
+        self._by_path = {}
+        self._by_hashed = {}
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.add_url_rule(f"{self.url_prefix}/<path:filename>", 'assets', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+        app.after_request(self._cache_hashed_uploads)
+
+    def _cache_hashed_uploads(self, response):
+        if response.status_code in (200, 304) and HASHED_UPLOAD_RE.match(request.path):
+            response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+    def _load(self, path):
+        # safe_join impede sair da pasta static (ex: ../app.py)
+        full_path = safe_join(self.app.static_folder, path)
+        if full_path is None or not os.path.isfile(full_path):
+            return None
+        asset = Asset(path, full_path)
+        with self._lock:
+            old = self._by_path.get(path)
+            if old is not None:
+                self._by_hashed.pop(old.hashed_path, None)
+            self._by_path[path] = asset
+            self._by_hashed[asset.hashed_path] = asset
+        return asset
+
+    def get(self, path):
+        asset = self._by_path.get(path)
+        if asset is None:
+            return self._load(path)
+        if self.app.debug:
+            try:
+                if os.path.getmtime(asset.full_path) != asset.mtime:
+                    return self._load(path)
+            except OSError:
+                return None
+        return asset
+
+    def url(self, path):
+        """Helper de template: URL com hash do arquivo (ou /static/ se não existir)"""
+        asset = self.get(path)
+        if asset is None:
+            return url_for('static', filename=path)
+        return f"{self.url_prefix}/{asset.hashed_path}"
+
+    def serve(self, filename):
+        asset = self._by_hashed.get(filename)
+        if asset is None:
+            # Ainda não carregado neste processo: style.<hash>.css -> style.css
+            root, ext = os.path.splitext(filename)
+            asset = self.get(root.rpartition('.')[0] + ext)
+            if asset is None or asset.hashed_path != filename:
+                abort(404)
+
+        if asset.body is None:
+            response = send_file(asset.full_path, mimetype=asset.mimetype, conditional=True)
+        else:
+            encodings = request.accept_encodings
+            if asset.brotli is not None and 'br' in encodings:
+                response = Response(asset.brotli, mimetype=asset.mimetype)
+                response.headers['Content-Encoding'] = 'br'
+            elif 'gzip' in encodings:
+                response = Response(asset.gzipped, mimetype=asset.mimetype)
+                response.headers['Content-Encoding'] = 'gzip'
+            else:
+                response = Response(asset.body, mimetype=asset.mimetype)
+            response.vary.add('Accept-Encoding')
+
+        response.set_etag(asset.digest)
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
@@ -0,0 +1,236 @@
+try:
+    from .database import db
+    from .models import Cupom, CupomUso
+    from .versioned_cache import VersionedCache
+    from .loyalty import normalize_phone
+    from .json_store import migrate_json_once
+except ImportError:
+    from database import db
+    from models import Cupom, CupomUso
+    from versioned_cache import VersionedCache
+    from loyalty import normalize_phone
+    from json_store import migrate_json_once
+from datetime import datetime, time
+from sqlalchemy import func, literal, or_
+
+TIPOS = ('porcentagem', 'fixo')
+
+
+class CouponError(ValueError):
+    """Cupom inválido, expirado ou esgotado (mensagem pronta para o cliente)"""
+
+
+def normalize_code(codigo):
+    return str(codigo or '').upper().strip()
+
+
+def _parse_date(value, end_of_day=False):
+    """'2025-12-31' ou ISO completo -> datetime; vazio -> None"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    parsed = datetime.fromisoformat(str(value).strip())
+    if end_of_day and len(str(value).strip()) == 10:
+        parsed = datetime.combine(parsed.date(), time.max)
+    return parsed
+
+
+def _parse_limit(value):
+    if value in (None, ''):
+        return None
+    limit = int(value)
+    if limit < 0:
+        raise ValueError(f"Limite inválido: {value}")
+    return limit
+
+
+def _date_str(value):
+    return value.date().isoformat() if value else None
+
+
+def coupon_to_dict(c):
+    """Formato da API de admin/validação: {valor, tipo, desc, ...}"""
+    return {
+        "id": c.id,
+        "valor": c.valor,
+        "tipo": c.tipo,
+        "desc": c.descricao or '',
+        "ativo": c.ativo is not False,
+        "inicio": _date_str(c.valido_de),
+        "fim": _date_str(c.valido_ate),
+        "limite_uso": c.limite_uso,
+        "limite_por_cliente": c.limite_por_cliente,
+        "usos": c.usos or 0
+    }
+
+
+class CouponSnapshot:
+    def __init__(self, version, cupons):
+        self.version = version
+        self.cupons = cupons  # codigo -> dict (só cupons ativos)
+
+
+class CouponCache(VersionedCache):
+    """
+    Cupons ativos em memória, recarregados só quando o admin salva a lista
+    (ou quando um cupom esgota), então validar um cupom não consulta o banco.
+    A versão entre workers fica num arquivo próprio (instance/cupons_version),
+    separado do cardápio.
+    """
+
+    def _make_snapshot(self):
+        # inicio/fim do dict são só a data (tela de admin); a validade usa os datetimes das colunas
+        cupons = {
+            c.codigo: {**coupon_to_dict(c), "valido_de": c.valido_de, "valido_ate": c.valido_ate}
+            for c in Cupom.query.filter(Cupom.ativo.is_(True)).all()
+        }
+        return CouponSnapshot(self._version, cupons)
+
+    def lookup(self, codigo):
+        return self.get().cupons.get(normalize_code(codigo))
+
+
+def list_coupons():
+    """Cupons ativos para a tela de admin: {CODIGO: {...}}"""
+    return {c.codigo: coupon_to_dict(c) for c in Cupom.query.filter(Cupom.ativo.is_(True)).order_by(Cupom.codigo).all()}
+
+
+def save_coupons(data):
+    """
+    Aplica a lista completa enviada pelo admin ({CODIGO: {valor, tipo, desc, ...}}).
+
+    Cupons que sumiram da lista são apagados, ou só desativados se já tiverem
+    sido usados (mantém o histórico dos pedidos). O contador de usos nunca vem
+    do payload. Não faz commit.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Formato de cupons inválido.")
+
+    existentes = {c.codigo: c for c in Cupom.query.all()}
+    vistos = set()
+    for codigo, item in data.items():
+        codigo = normalize_code(codigo)
+        if not codigo or not isinstance(item, dict):
+            raise ValueError(f"Cupom inválido: {codigo or '(sem código)'}")
+        tipo = item.get('tipo', 'porcentagem')
+        if tipo not in TIPOS:
+            raise ValueError(f"Tipo de desconto inválido no cupom {codigo}: {tipo}")
+        try:
+            valores = {
+                "tipo": tipo,
+                "valor": float(item.get('valor') or 0),
+                "descricao": item.get('desc', ''),
+                "ativo": item.get('ativo', True) is not False,
+                "valido_de": _parse_date(item.get('inicio')),
+                "valido_ate": _parse_date(item.get('fim'), end_of_day=True),
+                "limite_uso": _parse_limit(item.get('limite_uso')),
+                "limite_por_cliente": _parse_limit(item.get('limite_por_cliente')),
+            }
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Cupom {codigo}: {e}")
+
+        vistos.add(codigo)
+        cupom = existentes.get(codigo)
+        if cupom is None:
+            db.session.add(Cupom(codigo=codigo, usos=0, **valores))
+        else:
+            for campo, valor in valores.items():
+                setattr(cupom, campo, valor)
+
+    for codigo, cupom in existentes.items():
+        if codigo in vistos:
+            continue
+        if cupom.usos:
+            cupom.ativo = False
+        else:
+            db.session.delete(cupom)
+
+
+def _window_error(cupom, now):
+    # Mesmas comparações do UPDATE de redeem_coupon (valido_de <= now <= valido_ate)
+    if cupom['valido_de'] and now < cupom['valido_de']:
+        return "Este cupom ainda não está válido."
+    if cupom['valido_ate'] and now > cupom['valido_ate']:
+        return "Cupom inválido ou expirado."
+    return None
+
+
+def _customer_uses(cupom_id, telefone):
+    return db.session.scalar(
+        db.select(func.count(CupomUso.id)).where(CupomUso.cupom_id == cupom_id, CupomUso.telefone == telefone)
+    )
+
+
+def check_coupon(cache, codigo, phone=None, now=None):
+    """Validação para o checkout (sem reservar): retorna o cupom ou levanta CouponError"""
+    cupom = cache.lookup(codigo)
+    if cupom is None:
+        raise CouponError("Cupom inválido ou expirado.")
+    erro = _window_error(cupom, now or datetime.now())
+    if erro:
+        raise CouponError(erro)
+    if cupom['limite_uso'] is not None and cupom['usos'] >= cupom['limite_uso']:
+        raise CouponError("Este cupom esgotou.")
+    telefone = normalize_phone(phone)
+    if telefone and cupom['limite_por_cliente'] is not None:
+        if _customer_uses(cupom['id'], telefone) >= cupom['limite_por_cliente']:
+            raise CouponError("Você já usou este cupom o máximo de vezes permitido.")
+    return cupom
+
+
+def redeem_coupon(cache, codigo, phone, pedido_id=None, now=None):
+    """
+    Reserva um uso do cupom na transação atual (sem commit).
+
+    O contador é incrementado com um único UPDATE condicionado ao limite e à
+    validade, e o uso por cliente é inserido com INSERT ... SELECT condicionado
+    à contagem, então pedidos simultâneos não ultrapassam os limites. Em caso
+    de CouponError quem chama deve fazer rollback.
+    """
+    now = now or datetime.now()
+    cupom = check_coupon(cache, codigo, now=now)
+    telefone = normalize_phone(phone)
+    if cupom['limite_por_cliente'] is not None and not telefone:
+        raise CouponError("Informe o telefone para usar este cupom.")
+
+    result = db.session.execute(
+        db.update(Cupom)
+        .where(
+            Cupom.id == cupom['id'],
+            Cupom.ativo.is_(True),
+            or_(Cupom.limite_uso.is_(None), Cupom.usos < Cupom.limite_uso),
+            or_(Cupom.valido_de.is_(None), Cupom.valido_de <= now),
+            or_(Cupom.valido_ate.is_(None), Cupom.valido_ate >= now),
+        )
+        .values(usos=Cupom.usos + 1)
+    )
+    if not result.rowcount:
+        # Esgotou (ou foi desativado) depois que o cache foi carregado
+        cache.invalidate()
+        raise CouponError("Este cupom esgotou.")
+
+    uso = db.select(literal(cupom['id']), literal(telefone), literal(pedido_id), literal(now))
+    if cupom['limite_por_cliente'] is not None:
+        uso = uso.where(
+            db.select(func.count(CupomUso.id))
+            .where(CupomUso.cupom_id == cupom['id'], CupomUso.telefone == telefone)
+            .scalar_subquery() < cupom['limite_por_cliente']
+        )
+    result = db.session.execute(
+        db.insert(CupomUso).from_select(['cupom_id', 'telefone', 'pedido_id', 'created_at'], uso)
+    )
+    if not result.rowcount:
+        raise CouponError("Você já usou este cupom o máximo de vezes permitido.")
+    return cupom
+
+
+def migrate_coupons_json(path):
+    """Importa uma única vez o cupons.json antigo para a tabela de cupons"""
+    def importer(data):
+        if Cupom.query.first() is None:
+            save_coupons(data)
+            db.session.commit()
+        return len(data)
+
+    return migrate_json_once(path, importer)
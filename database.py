@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import DeclarativeBase
 
 class Base(DeclarativeBase):
@@ -6,7 +7,104 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+# Perfis de armazenamento (DATABASE_PROFILE na config; sem ele, escolhido pelo tipo da URI).
+# engine_options vão para o create_engine; pragmas são aplicados em toda conexão nova do SQLite.
+STORAGE_PROFILES = {
+    # Arquivo local: WAL deixa leituras (cozinha, painel, relatórios) rodarem durante uma escrita,
+    # e busy_timeout faz escritas concorrentes esperarem o lock em vez de falhar com "database is locked"
+    'sqlite': {
+        'engine_options': {
+            'connect_args': {'timeout': 5, 'check_same_thread': False},
+            'query_cache_size': 1200,
+        },
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',  # Com WAL: fsync só no checkpoint, sem risco de corromper
+            'busy_timeout': 5000,  # ms
+            'cache_size': -32000,  # KiB (negativo) = ~32 MB por conexão
+            'mmap_size': 256 * 1024 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        # Só no engine do OrderWriter (writer_engine): o pysqlite não abre transação antes de
+        # SAVEPOINT, e sem BEGIN explícito cada RELEASE vira um commit próprio. IMMEDIATE pega o
+        # lock de escrita já no início do lote. As demais sessões ficam com o comportamento do
+        # driver (transação só na primeira escrita): com BEGIN na primeira leitura, um commit de
+        # outra conexão no meio faria a escrita falhar com "database is locked" (sem busy_timeout)
+        'writer_begin': 'BEGIN IMMEDIATE',
+    },
+    # Servidor (PostgreSQL/MySQL): pool dimensionado para os workers, conexões testadas antes do uso
+    'server': {
+        'engine_options': {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 10,
+            'pool_pre_ping': True,
+            'pool_recycle': 1800,  # s; evita conexões derrubadas por firewall/proxy ociosos
+            'query_cache_size': 1200,  # Cache de SQL compilado do SQLAlchemy
+        },
+        'pragmas': {},
+        'writer_begin': None,  # Transações normais do servidor já servem ao commit em grupo
+    },
+}
+
+def storage_profile(app):
+    """Nome do perfil configurado ou deduzido de SQLALCHEMY_DATABASE_URI"""
+    name = app.config.get('DATABASE_PROFILE')
+    if not name:
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        name = 'sqlite' if uri.startswith('sqlite') else 'server'
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"Perfil de banco desconhecido: {name}")
+    return name
+
+def _apply_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+    return on_connect
+
+def _disable_driver_begin(dbapi_connection, connection_record):
+    # Receita do SQLAlchemy para o pysqlite: o driver não controla mais as transações...
+    dbapi_connection.isolation_level = None
+
+def _emit_begin(statement):
+    # ...e toda transação começa com um BEGIN de verdade (inclusive antes de SAVEPOINT)
+    def on_begin(conn):
+        conn.exec_driver_sql(statement)
+    return on_begin
+
+def writer_engine(app):
+    """
+    Engine da thread de gravação de pedidos (order_writer.py). No SQLite é um
+    engine à parte, com as mesmas opções e pragmas, em que toda transação começa
+    com writer_begin; nos outros perfis é o próprio db.engine. Chamar dentro de
+    um app context.
+    """
+    profile = STORAGE_PROFILES[storage_profile(app)]
+    if not profile['writer_begin']:
+        return db.engine
+    engine = create_engine(db.engine.url, **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+    if profile['pragmas']:
+        event.listen(engine, 'connect', _apply_pragmas(profile['pragmas']))
+    event.listen(engine, 'connect', _disable_driver_begin)
+    event.listen(engine, 'begin', _emit_begin(profile['writer_begin']))
+    return engine
+
 def init_db(app):
+    profile = STORAGE_PROFILES[storage_profile(app)]
+    # Opções explícitas da config têm prioridade sobre as do perfil
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**profile['engine_options'], **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
     db.init_app(app)
     with app.app_context():
+        if profile['pragmas']:
+            event.listen(db.engine, 'connect', _apply_pragmas(profile['pragmas']))
         db.create_all()
+        # create_all() não altera tabelas que já existem: colunas/índices novos vêm das migrações
+        if app.config.get('AUTO_MIGRATE', True):
+            try:
+                from .migrations import run_migrations
+            except ImportError:
+                from migrations import run_migrations
+            run_migrations()
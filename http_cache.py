@@ -0,0 +1,49 @@
+from flask import current_app, request, Response
+import gzip
+import hashlib
+import threading
+
+
+class PrecomputedJson:
+    """Corpo JSON já serializado (e comprimido) de uma versão de um recurso"""
+
+    def __init__(self, payload, tag):
+        self.body = current_app.json.dumps(payload).encode('utf-8')
+        self.gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        digest = hashlib.sha1(self.body).hexdigest()[:16]
+        # ETag forte: versão do recurso + hash do conteúdo
+        self.etag = f"{tag}-{digest}"
+
+    def response(self, cache_control='no-cache'):
+        """Responde 304 se o cliente já tem esta versão; senão envia os bytes prontos"""
+        if request.if_none_match.contains_weak(self.etag):
+            resp = Response(status=304)
+        elif 'gzip' in request.accept_encodings:
+            resp = Response(self.gzipped, mimetype='application/json')
+            resp.headers['Content-Encoding'] = 'gzip'
+        else:
+            resp = Response(self.body, mimetype='application/json')
+        resp.set_etag(self.etag)
+        resp.headers['Cache-Control'] = cache_control
+        resp.vary.add('Accept-Encoding')
+        return resp
+
+
+class VersionedJsonCache:
+    """Guarda o PrecomputedJson da revisão mais recente de um recurso"""
+
+    def __init__(self, tag):
+        self.tag = tag  # ex: 'm{revision}' para usar a versão no ETag
+        self._lock = threading.Lock()
+        self._entry = (None, None)  # (revisão, PrecomputedJson)
+
+    def get(self, revision, build_payload):
+        cached_revision, cached = self._entry
+        if cached is not None and cached_revision == revision:
+            return cached
+        with self._lock:
+            cached_revision, cached = self._entry
+            if cached is None or cached_revision != revision:
+                cached = PrecomputedJson(build_payload(), self.tag.format(revision=revision))
+                self._entry = (revision, cached)
+            return cached
@@ -0,0 +1,184 @@
+import glob
+import hashlib
+import io
+import os
+import re
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Larguras máximas de cada variante (nunca amplia a imagem original)
+VARIANTS = {
+    "thumb": 320,
+    "medium": 640,
+    "full": 1280,
+}
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+# Arquivos gerados pelo pipeline: <hash>-<largura da full>_<variante>.<ext>, ou <hash>.<ext>
+# quando o original é mantido. O nome muda junto com o conteúdo (assets.py os serve como imutáveis)
+HASHED_FILENAME = r'[0-9a-f]{16}(?:-\d+_[a-z]+)?\.[a-z]+'
+VARIANT_RE = re.compile(r'^(?P<base>.*/)(?P<hash>[0-9a-f]{16})-(?P<width>\d+)_full\.(?P<ext>jpg|png)$')
+
+
+class ImageTooLarge(ValueError):
+    """Imagem com pixels demais para processar (possível 'decompression bomb')"""
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _stem(digest, width):
+    return f"{digest}-{width}"
+
+
+def _variant_name(stem, variant, ext):
+    return f"{stem}_{variant}.{ext}"
+
+
+def variant_widths(full_width):
+    """Largura real de cada variante (a imagem nunca é ampliada)"""
+    return {variant: min(max_width, full_width) for variant, max_width in VARIANTS.items()}
+
+
+def _save_variants(img, digest, folder):
+    """Gera thumb/medium/full no formato base (JPEG ou PNG) e em WebP; retorna o nome da full"""
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    if has_alpha:
+        img = img.convert('RGBA')
+        ext = 'png'
+    else:
+        img = img.convert('RGB')
+        ext = 'jpg'
+
+    stem = _stem(digest, min(img.width, VARIANTS['full']))
+    for variant, max_width in VARIANTS.items():
+        resized = img
+        if img.width > max_width:
+            height = round(img.height * max_width / img.width)
+            resized = img.resize((max_width, height), Image.LANCZOS)
+
+        base_path = os.path.join(folder, _variant_name(stem, variant, ext))
+        if ext == 'jpg':
+            resized.save(base_path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        else:
+            resized.save(base_path, 'PNG', optimize=True)
+        resized.save(os.path.join(folder, _variant_name(stem, variant, 'webp')), 'WEBP', quality=WEBP_QUALITY, method=4)
+    return _variant_name(stem, 'full', ext)
+
+
+def _existing_variant(digest, folder):
+    """Nome da full já gerada para este conteúdo (reenvio da mesma foto), ou None"""
+    for ext in ('jpg', 'png'):
+        for path in glob.glob(os.path.join(folder, f"{digest}-*_full.{ext}")):
+            stem = os.path.basename(path)[:-len(f"_full.{ext}")]
+            if os.path.exists(os.path.join(folder, _variant_name(stem, 'thumb', 'webp'))):
+                return os.path.basename(path)
+    return None
+
+
+def process_image(data, original_ext, folder):
+    """
+    Processa os bytes de uma imagem enviada e devolve o nome do arquivo principal.
+
+    O nome é derivado do hash do conteúdo, então reenviar a mesma foto não cria
+    arquivos novos. Com Pillow instalado são geradas as variantes thumb/medium/full
+    (+ WebP); sem Pillow o original é salvo como está. Levanta ImageTooLarge se a
+    imagem passa do limite de pixels do Pillow.
+    """
+    digest = content_hash(data)
+
+    existing = _existing_variant(digest, folder)
+    if existing:
+        return existing
+
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                if not getattr(img, 'is_animated', False):
+                    return _save_variants(img, digest, folder)
+        except Image.DecompressionBombError as e:
+            raise ImageTooLarge(str(e))
+        except (OSError, ValueError) as e:
+            # Imagem que o Pillow não entende: mantém o original
+            print(f"Pipeline de imagem: usando original ({e})")
+
+    filename = f"{digest}{original_ext.lower()}"
+    path = os.path.join(folder, filename)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    return filename
+
+
+def image_variants(url):
+    """
+    Para uso nos templates: devolve src/srcset da foto de um produto.
+
+    Fotos geradas pelo pipeline ganham srcset com a largura real de cada
+    variante (fotos menores que 1280px não repetem larguras) e uma versão
+    WebP; URLs antigas ou externas são devolvidas sem alteração.
+    """
+    match = VARIANT_RE.match(url or '')
+    if not match:
+        return {"src": url, "srcset": None, "webp_srcset": None}
+
+    base, digest, ext = match.group('base'), match.group('hash'), match.group('ext')
+    stem = _stem(digest, match.group('width'))
+    # Uma variante por largura (a menor, se duas saíram do mesmo tamanho)
+    larguras = {}
+    for variant, width in variant_widths(int(match.group('width'))).items():
+        larguras.setdefault(width, variant)
+
+    def srcset(fmt):
+        return ", ".join(f"{base}{_variant_name(stem, v, fmt)} {w}w" for w, v in larguras.items())
+
+    return {
+        "src": f"{base}{_variant_name(stem, 'medium', ext)}",
+        "srcset": srcset(ext),
+        "webp_srcset": srcset('webp'),
+    }
+
+
+def reprocess_uploads(upload_folder, static_url='/static/uploads/'):
+    """Converte as fotos antigas dos produtos (arquivo original em uploads/) para o pipeline"""
+    try:
+        from .database import db
+        from .models import Produto
+    except ImportError:
+        from database import db
+        from models import Produto
+
+    convertidos = 0
+    for produto in Produto.query.filter(Produto.foto_url.like(f"{static_url}%")).all():
+        if VARIANT_RE.match(produto.foto_url):
+            continue
+        path = os.path.join(upload_folder, produto.foto_url[len(static_url):])
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            filename = process_image(data, os.path.splitext(path)[1], upload_folder)
+        except ImageTooLarge as e:
+            print(f"Pipeline de imagem: ignorando {path} ({e})")
+            continue
+        produto.foto_url = f"{static_url}{filename}"
+        convertidos += 1
+    db.session.commit()
+    return convertidos
+
+
+if __name__ == "__main__":
+    from app import app, menu_cache, UPLOAD_FOLDER
+
+    with app.app_context():
+        total = reprocess_uploads(UPLOAD_FOLDER)
+        if total:
+            menu_cache.invalidate()
+        print(f"✅ {total} foto(s) convertida(s) para o pipeline de imagens.")
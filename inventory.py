@@ -0,0 +1,80 @@
+try:
+    from .database import db
+    from .models import Ingrediente, FichaTecnica, ItemPedido
+except ImportError:
+    from database import db
+    from models import Ingrediente, FichaTecnica, ItemPedido
+from datetime import datetime
+
+
+class StockShortage(ValueError):
+    """Estoque insuficiente para o pedido; `faltas` = [{id, nome, unidade, necessario, atual}]"""
+
+    def __init__(self, faltas):
+        detalhes = "; ".join(f"{f['nome']} (necessário {f['necessario']:g}, atual {f['atual']:g})" for f in faltas)
+        super().__init__(f"Estoque insuficiente: {detalhes}")
+        self.faltas = faltas
+
+
+def _demand_subquery(pedido_id):
+    """Quantidade total de um ingrediente no pedido (ficha técnica x quantidade dos itens), correlacionada com Ingrediente"""
+    return (
+        db.select(db.func.sum(FichaTecnica.quantidade * ItemPedido.quantidade))
+        .join_from(ItemPedido, FichaTecnica, FichaTecnica.produto_id == ItemPedido.produto_id)
+        .where(ItemPedido.pedido_id == pedido_id, FichaTecnica.ingrediente_id == Ingrediente.id)
+        .scalar_subquery()
+    )
+
+
+def order_demand(pedido_id):
+    """
+    Ingredientes que o pedido consome, numa consulta:
+    [{id, nome, unidade, necessario, atual}]. Itens sem produto_id ou sem ficha técnica não entram.
+    """
+    necessario = db.func.sum(FichaTecnica.quantidade * ItemPedido.quantidade)
+    rows = db.session.execute(
+        db.select(Ingrediente.id, Ingrediente.nome, Ingrediente.unidade, necessario, Ingrediente.estoque_atual)
+        .join_from(ItemPedido, FichaTecnica, FichaTecnica.produto_id == ItemPedido.produto_id)
+        .join(Ingrediente, Ingrediente.id == FichaTecnica.ingrediente_id)
+        .where(ItemPedido.pedido_id == pedido_id)
+        .group_by(Ingrediente.id, Ingrediente.nome, Ingrediente.unidade, Ingrediente.estoque_atual)
+    ).all()
+    return [
+        {"id": id_, "nome": nome, "unidade": unidade, "necessario": float(qtd or 0), "atual": float(atual or 0)}
+        for id_, nome, unidade, qtd, atual in rows
+    ]
+
+
+def deduct_stock(pedido_id, allow_negative=True):
+    """
+    Baixa no estoque tudo o que o pedido consome (sem commit).
+
+    Um UPDATE só para todos os ingredientes (estoque_atual = estoque_atual -
+    demanda), então duas conclusões simultâneas nunca perdem uma baixa. Sem
+    estoque negativo, o UPDATE só vale onde há saldo; se algum ingrediente
+    faltar, nada é baixado e StockShortage lista todos os que faltam.
+    Retorna a demanda baixada (formato de order_demand()).
+    """
+    demanda = order_demand(pedido_id)
+    if not demanda:
+        return []
+
+    necessario = _demand_subquery(pedido_id)
+    stmt = (
+        db.update(Ingrediente)
+        .where(Ingrediente.id.in_([d['id'] for d in demanda]))
+        .values(estoque_atual=Ingrediente.estoque_atual - necessario, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if not allow_negative:
+        stmt = stmt.where(Ingrediente.estoque_atual >= necessario)
+
+    savepoint = db.session.begin_nested()
+    if db.session.execute(stmt).rowcount == len(demanda):
+        savepoint.commit()
+        return demanda
+
+    # Algum ingrediente sem saldo: desfaz as baixas parciais e relê os saldos atuais
+    savepoint.rollback()
+    faltas = [d for d in order_demand(pedido_id) if d['atual'] < d['necessario']]
+    raise StockShortage(faltas)
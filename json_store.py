@@ -0,0 +1,134 @@
+from contextlib import contextmanager
+import copy
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Lock exclusivo entre processos (workers) usando um arquivo .lock ao lado do JSON"""
+    with open(lock_path, 'a+b') as fh:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class JsonStore:
+    """
+    Arquivo JSON legado (config.json, cupons.json, ...) com cache em memória.
+
+    read() só relê e faz parse do arquivo quando mtime/tamanho mudam; o objeto
+    devolvido é compartilhado entre requisições e NÃO deve ser alterado.
+    Para ler-modificar-gravar use update(). As gravações vão para um arquivo
+    temporário (fsync) e substituem o original com os.replace, sob um lock
+    entre processos, então um leitor nunca vê um arquivo pela metade.
+    """
+
+    def __init__(self, path, default=dict):
+        self.path = path
+        self.default = default
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._data = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    @property
+    def revision(self):
+        """(mtime_ns, tamanho) do arquivo, ou None se ele não existe"""
+        return self._stat()
+
+    def exists(self):
+        return self._stat() is not None
+
+    def read(self):
+        stamp = self._stat()
+        if stamp is None:
+            return self.default()
+        if stamp == self._stamp:
+            return self._data
+        with self._lock:
+            if stamp != self._stamp:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._data, self._stamp = data, stamp
+            return self._data
+
+    def _write_unlocked(self, data):
+        folder = os.path.dirname(self.path) or '.'
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.json', dir=folder)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try: os.remove(tmp_path)
+            except OSError: pass
+            raise
+        self._data, self._stamp = data, self._stat()
+
+    def write(self, data):
+        with self._lock, file_lock(self.lock_path):
+            self._write_unlocked(data)
+
+    def update(self, func):
+        """
+        Lê-modifica-grava atômico: func recebe uma cópia dos dados atuais e pode
+        alterá-la no lugar ou devolver um novo valor. Retorna o que foi gravado.
+        """
+        with self._lock, file_lock(self.lock_path):
+            data = copy.deepcopy(self.read())
+            result = func(data)
+            if result is not None:
+                data = result
+            self._write_unlocked(data)
+            return data
+
+
+def migrate_json_once(path, importer):
+    """
+    Importação única de um arquivo JSON legado: importer(data) grava no banco
+    (e faz commit); depois o arquivo é renomeado para .migrado. O lock evita
+    que dois workers subindo juntos importem o mesmo arquivo duas vezes.
+    """
+    if not os.path.exists(path):
+        return 0
+    with file_lock(f"{path}.lock"):
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        total = importer(data)
+        os.replace(path, f"{path}.migrado")
+    try: os.remove(f"{path}.lock")
+    except OSError: pass
+    return total
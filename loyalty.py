@@ -0,0 +1,86 @@
+try:
+    from .database import db
+    from .models import FidelidadeMovimento, FidelidadeSaldo
+    from .json_store import migrate_json_once
+except ImportError:
+    from database import db
+    from models import FidelidadeMovimento, FidelidadeSaldo
+    from json_store import migrate_json_once
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+
+
+def normalize_phone(phone):
+    """Só os dígitos do telefone: '(11) 96454-8785' -> '11964548785'"""
+    return ''.join(filter(str.isdigit, str(phone or '')))
+
+
+def _bump_balance(telefone, pontos):
+    """UPDATE atômico do saldo (pontos = pontos + delta); cria a linha se for o primeiro movimento"""
+    now = datetime.utcnow()
+    result = db.session.execute(
+        db.update(FidelidadeSaldo)
+        .where(FidelidadeSaldo.telefone == telefone)
+        .values(pontos=FidelidadeSaldo.pontos + pontos, updated_at=now)
+    )
+    if result.rowcount:
+        return
+    try:
+        # Savepoint: se outro worker criou o saldo ao mesmo tempo, só refaz o UPDATE
+        with db.session.begin_nested():
+            db.session.execute(db.insert(FidelidadeSaldo).values(telefone=telefone, pontos=pontos, updated_at=now))
+    except IntegrityError:
+        db.session.execute(
+            db.update(FidelidadeSaldo)
+            .where(FidelidadeSaldo.telefone == telefone)
+            .values(pontos=FidelidadeSaldo.pontos + pontos, updated_at=now)
+        )
+
+
+def add_points(phone, pontos, pedido_id=None):
+    """
+    Lança pontos no extrato e atualiza o saldo na transação atual (sem commit).
+
+    Quem chama faz o commit junto com a alteração do pedido, então os pontos
+    e o status mudam juntos ou nenhum dos dois.
+    """
+    telefone = normalize_phone(phone)
+    pontos = int(pontos)
+    if not telefone or not pontos:
+        return False
+    db.session.add(FidelidadeMovimento(telefone=telefone, pedido_id=pedido_id, pontos=pontos))
+    _bump_balance(telefone, pontos)
+    return True
+
+
+def get_points(phone):
+    """Saldo de pontos do telefone (leitura pela chave primária)"""
+    telefone = normalize_phone(phone)
+    if not telefone:
+        return 0
+    saldo = db.session.get(FidelidadeSaldo, telefone)
+    return saldo.pontos if saldo else 0
+
+
+def migrate_loyalty_json(path):
+    """Importa uma única vez o fidelidade.json antigo ({telefone: pontos}) para o banco"""
+    def importer(data):
+        total = 0
+        for phone, pontos in data.items():
+            try:
+                if add_points(phone, pontos):
+                    total += 1
+            except (TypeError, ValueError):
+                print(f"Fidelidade: ignorando saldo inválido de {phone}: {pontos}")
+        db.session.commit()
+        return total
+
+    return migrate_json_once(path, importer)
+
+
+if __name__ == "__main__":
+    from app import app, LOYALTY_FILE
+
+    with app.app_context():
+        total = migrate_loyalty_json(LOYALTY_FILE)
+        print(f"✅ {total} saldo(s) de fidelidade migrado(s) para o banco.")
@@ -0,0 +1,120 @@
+try:
+    from .database import db
+    from .models import Categoria, Produto
+    from .versioned_cache import VersionedCache
+except ImportError:
+    from database import db
+    from models import Categoria, Produto
+    from versioned_cache import VersionedCache
+
+
+def parse_price(price_input, strict=False):
+    """Converte preço no formato brasileiro para float: 'R$ 1.200,50' -> 1200.5
+
+    Com strict=True, um valor que não é número levanta ValueError em vez de virar 0.0.
+    """
+    if not price_input: return 0.0
+    if isinstance(price_input, (int, float)): return float(price_input)
+    try:
+        clean = str(price_input).replace('R$', '').replace('\xa0', '').replace(' ', '').replace('.', '').replace(',', '.')
+        return float(clean)
+    except ValueError:
+        if strict:
+            raise ValueError(f"Preço inválido: {price_input}")
+        return 0.0
+
+
+def format_price(valor):
+    """Formata float no padrão brasileiro: 1200.5 -> 'R$ 1.200,50'"""
+    return f"R$ {valor or 0:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+class MenuSnapshot:
+    """Cópia imutável do cardápio (categorias -> produtos) numa versão específica"""
+
+    def __init__(self, version, categorias):
+        self.version = version
+        self.categorias = categorias  # [{"id", "nome", "ordem", "visivel", "exibir_preco", "itens": [...]}]
+
+        # Formato da API (/api/cardapio): todas as categorias com itens, todos os itens
+        self.api_menu = {c['nome']: c['itens'] for c in categorias if c['itens']}
+
+        # Formato do site (/cardapio): só categorias e itens visíveis
+        self.site_menu = {}
+        self.site_config = {}
+        for c in categorias:
+            if not c['visivel']:
+                continue
+            visiveis = [i for i in c['itens'] if i['visivel']]
+            if visiveis:
+                self.site_menu[c['nome']] = visiveis
+                self.site_config[c['nome']] = {"visible": True, "show_price": c['exibir_preco']}
+
+
+class MenuCache(VersionedCache):
+    """
+    Cache em memória do cardápio.
+
+    O snapshot é montado com uma única consulta (categorias LEFT JOIN produtos) e
+    só é descartado quando alguma rota de escrita chama invalidate(). A versão é
+    compartilhada entre processos (workers) pelo arquivo instance/menu_version,
+    então um save feito num worker invalida o cache dos demais.
+    """
+
+    def __init__(self, version_file=None):
+        super().__init__(version_file)
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """Registra callback(version) chamado após cada invalidate() deste processo"""
+        self._listeners.append(callback)
+
+    def _make_snapshot(self):
+        return MenuSnapshot(self._version, self._load())
+
+    def invalidate(self):
+        """Chamado após commit de qualquer alteração no cardápio. Retorna a nova versão."""
+        version = super().invalidate()
+        for callback in self._listeners:
+            try:
+                callback(version)
+            except Exception as e:
+                print(f"Erro em listener do cache do cardápio: {e}")
+        return version
+
+    def _load(self):
+        rows = db.session.execute(
+            db.select(
+                Categoria.id, Categoria.nome, Categoria.ordem, Categoria.visivel, Categoria.exibir_preco,
+                Produto.id, Produto.nome, Produto.descricao, Produto.preco, Produto.foto_url,
+                Produto.visivel, Produto.esgotado
+            )
+            .outerjoin(Produto, Produto.categoria_id == Categoria.id)
+            .order_by(Categoria.ordem, Categoria.id, Produto.id)
+        ).all()
+
+        categorias = []
+        atual = None
+        for (c_id, c_nome, c_ordem, c_visivel, c_exibir, p_id, p_nome, p_desc, p_preco, p_foto, p_visivel, p_esgotado) in rows:
+            if atual is None or atual['id'] != c_id:
+                atual = {
+                    "id": c_id,
+                    "nome": c_nome,
+                    "ordem": c_ordem,
+                    "visivel": c_visivel is not False,
+                    "exibir_preco": c_exibir is not False,
+                    "itens": []
+                }
+                categorias.append(atual)
+            if p_id is None:
+                continue
+            atual['itens'].append({
+                "id": p_id,
+                "nome": p_nome,
+                "desc": p_desc,
+                "preco": format_price(p_preco),
+                "foto": p_foto,
+                "visivel": p_visivel is not False,
+                "esgotado": bool(p_esgotado)
+            })
+        return categorias
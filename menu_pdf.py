@@ -0,0 +1,112 @@
+import hashlib
+import threading
+
+try:
+    from fpdf import FPDF
+except ImportError:
+    FPDF = None
+
+
+def _latin1(text):
+    # FPDF padrão só trabalha com latin-1
+    return (text or '').encode('latin-1', 'replace').decode('latin-1')
+
+
+def render_menu_pdf(snapshot):
+    """Gera o PDF do cardápio (itens visíveis do snapshot) e retorna os bytes"""
+    if FPDF is None:
+        raise RuntimeError("Biblioteca FPDF não instalada. Instale com 'pip install fpdf'")
+
+    class PDF(FPDF):
+        def header(self):
+            self.set_font('Arial', 'B', 16)
+            self.cell(0, 10, _latin1('Cardápio - Pizzaria Colonial'), 0, 1, 'C')
+            self.ln(5)
+
+        def footer(self):
+            self.set_y(-15)
+            self.set_font('Arial', 'I', 8)
+            self.cell(0, 10, _latin1(f'Página {self.page_no()}'), 0, 0, 'C')
+
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    for category, items in snapshot.site_menu.items():
+        show_price = snapshot.site_config.get(category, {}).get('show_price', True)
+
+        # Título da Categoria
+        pdf.set_font("Arial", 'B', 14)
+        pdf.set_fill_color(240, 240, 240)
+        pdf.cell(0, 10, _latin1(category), 1, 1, 'L', 1)
+
+        # Itens
+        pdf.set_font("Arial", size=11)
+        for item in items:
+            pdf.cell(140, 8, _latin1(item['nome']), 0, 0)
+            pdf.cell(50, 8, _latin1(item['preco'] if show_price else ''), 0, 1, 'R')
+            pdf.set_font("Arial", 'I', 9)
+            pdf.multi_cell(0, 5, _latin1(item['desc']))
+            pdf.set_font("Arial", size=11)
+            pdf.ln(2)
+        pdf.ln(5)
+
+    # Em memória: fpdf 1.x devolve str latin-1, fpdf2 devolve bytearray
+    output = pdf.output(dest='S')
+    if isinstance(output, str):
+        output = output.encode('latin-1')
+    return bytes(output)
+
+
+class RenderedPdf:
+    def __init__(self, version, data):
+        self.version = version
+        self.data = data
+        self.etag = f"pdf{version}-{hashlib.sha1(data).hexdigest()[:16]}"
+
+
+class MenuPdfCache:
+    """
+    PDF do cardápio renderizado uma vez por versão do menu.
+
+    Após cada alteração do cardápio o PDF é regenerado numa thread em
+    segundo plano, então os downloads seguintes só servem os bytes prontos.
+    """
+
+    def __init__(self, app, menu_cache):
+        self.app = app
+        self.menu_cache = menu_cache
+        self._lock = threading.Lock()
+        self._rendered = None
+        self._worker = None
+
+    def get(self):
+        version = self.menu_cache.version
+        rendered = self._rendered
+        if rendered is not None and rendered.version == version:
+            return rendered
+        with self._lock:
+            if self._rendered is None or self._rendered.version != self.menu_cache.version:
+                snapshot = self.menu_cache.get()
+                self._rendered = RenderedPdf(snapshot.version, render_menu_pdf(snapshot))
+            return self._rendered
+
+    def refresh_async(self, version=None):
+        """Agenda a regeneração em segundo plano (uma thread por vez)"""
+        if FPDF is None:
+            return
+        if self._worker is not None and self._worker.is_alive():
+            # A thread em execução confere a versão de novo antes de terminar
+            return
+        self._worker = threading.Thread(target=self._refresh, name='menu-pdf', daemon=True)
+        self._worker.start()
+
+    def _refresh(self):
+        with self.app.app_context():
+            try:
+                while True:
+                    rendered = self.get()
+                    if rendered.version == self.menu_cache.version:
+                        break
+            except Exception as e:
+                print(f"Erro ao gerar PDF do cardápio em segundo plano: {e}")
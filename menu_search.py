@@ -0,0 +1,175 @@
+try:
+    from .menu_sync import normalize_name
+except ImportError:
+    from menu_sync import normalize_name
+from bisect import bisect_left
+import heapq
+import re
+import threading
+
+# Peso de cada campo no ranking: acertar o nome vale mais que a descrição
+FIELD_WEIGHTS = (('nome', 3), ('categoria', 2), ('desc', 1))
+TOKEN_RE = re.compile(r'\w+')
+# Buscas e prefixos já resolvidos nesta versão do índice (type-ahead repete muito)
+MAX_CACHED = 2048
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize_name(text))
+
+
+class MenuSearchIndex:
+    """
+    Índice invertido do cardápio visível para a busca do site (type-ahead).
+
+    Termos sem acento/maiúsculas apontam para os produtos em que aparecem, com
+    o peso do melhor campo. Cada termo da busca é tratado como prefixo
+    (busca binária no vocabulário ordenado) e todos precisam casar.
+    Quando a versão do cardápio muda, só os produtos alterados são reindexados.
+    """
+
+    def __init__(self, menu_cache):
+        self.menu_cache = menu_cache
+        self.version = None
+        self._lock = threading.Lock()
+        self._docs = {}       # produto_id -> {"item": dict da resposta, "terms": {termo: peso}}
+        self._postings = {}   # termo -> {produto_id: peso}
+        self._vocab = []      # termos ordenados (para busca por prefixo)
+        self._rank = {}       # produto_id -> posição em ordem alfabética (desempate)
+        self._prefix_cache = {}   # termo digitado -> {produto_id: pontos}
+        self._result_cache = {}   # (termos, limite) -> resultado
+
+    def _sync(self):
+        version = self.menu_cache.version
+        if version == self.version:
+            return
+        snapshot = self.menu_cache.get()
+        with self._lock:
+            if snapshot.version != self.version:
+                self._update(snapshot)
+
+    def _update(self, snapshot):
+        vistos = set()
+        vocab_changed = False
+
+        for cat in snapshot.categorias:
+            if not cat['visivel']:
+                continue
+            for item in cat['itens']:
+                if not item['visivel']:
+                    continue
+                p_id = item['id']
+                vistos.add(p_id)
+
+                terms = {}
+                for field, weight in FIELD_WEIGHTS:
+                    text = cat['nome'] if field == 'categoria' else item[field]
+                    for term in tokenize(text):
+                        if weight > terms.get(term, 0):
+                            terms[term] = weight
+
+                old = self._docs.get(p_id)
+                if old is None or old['terms'] != terms:
+                    if old is not None:
+                        self._unindex(p_id, old['terms'])
+                    for term, weight in terms.items():
+                        postings = self._postings.get(term)
+                        if postings is None:
+                            postings = self._postings[term] = {}
+                            vocab_changed = True
+                        postings[p_id] = weight
+
+                # Preço/foto podem mudar sem mexer nos termos: o payload é sempre atualizado
+                self._docs[p_id] = {
+                    "terms": terms,
+                    "item": {
+                        "id": p_id,
+                        "nome": item['nome'],
+                        "desc": item['desc'],
+                        "preco": item['preco'] if cat['exibir_preco'] else None,
+                        "foto": item['foto'],
+                        "esgotado": item['esgotado'],
+                        "categoria": cat['nome']
+                    }
+                }
+
+        for p_id in [p_id for p_id in self._docs if p_id not in vistos]:
+            self._unindex(p_id, self._docs.pop(p_id)['terms'])
+
+        empty = [term for term, postings in self._postings.items() if not postings]
+        for term in empty:
+            del self._postings[term]
+        if vocab_changed or empty:
+            self._vocab = sorted(self._postings)
+        ordenados = sorted(self._docs, key=lambda p_id: normalize_name(self._docs[p_id]['item']['nome']))
+        self._rank = {p_id: pos for pos, p_id in enumerate(ordenados)}
+        self._prefix_cache = {}
+        self._result_cache = {}
+        self.version = snapshot.version
+
+    def _token_scores(self, token):
+        """{produto_id: pontos} de um termo da busca (maior peso entre os termos com esse prefixo)"""
+        merged = self._prefix_cache.get(token)
+        if merged is not None:
+            return merged
+        merged = {}
+        i = bisect_left(self._vocab, token)
+        while i < len(self._vocab) and self._vocab[i].startswith(token):
+            term = self._vocab[i]
+            # Palavra inteira vale o dobro de um prefixo
+            bonus = 2 if term == token else 1
+            for p_id, weight in self._postings[term].items():
+                score = weight * bonus
+                if score > merged.get(p_id, 0):
+                    merged[p_id] = score
+            i += 1
+        if len(self._prefix_cache) >= MAX_CACHED:
+            self._prefix_cache.clear()
+        self._prefix_cache[token] = merged
+        return merged
+
+    def _unindex(self, p_id, terms):
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(p_id, None)
+
+    def search(self, query, limit=10):
+        """Retorna até `limit` produtos visíveis que casam com todos os termos da busca"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        self._sync()
+
+        with self._lock:
+            key = (tuple(tokens), limit)
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                return cached
+
+            token_maps = sorted((self._token_scores(token) for token in tokens), key=len)
+
+            # Todos os termos precisam casar: interseção começando pelo menor conjunto
+            candidates = token_maps[0].keys()
+            for m in token_maps[1:]:
+                candidates = candidates & m.keys()
+
+            # Agrupa por pontuação; dentro do grupo, ordem alfabética pré-calculada
+            buckets = {}
+            for p_id in candidates:
+                score = 0
+                for m in token_maps:
+                    score += m[p_id]
+                buckets.setdefault(score, []).append(p_id)
+
+            ranked = []
+            for score in sorted(buckets, reverse=True):
+                ranked.extend(heapq.nsmallest(limit - len(ranked), buckets[score], key=self._rank.__getitem__))
+                if len(ranked) >= limit:
+                    break
+
+            result = [self._docs[p_id]['item'] for p_id in ranked]
+            if len(self._result_cache) >= MAX_CACHED:
+                self._result_cache.clear()
+            self._result_cache[key] = result
+            return result
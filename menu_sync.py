@@ -0,0 +1,321 @@
+try:
+    from .database import db
+    from .models import Categoria, Produto, ItemPedido, FichaTecnica, ProdutoCusto
+    from .menu_cache import parse_price
+except ImportError:
+    from database import db
+    from models import Categoria, Produto, ItemPedido, FichaTecnica, ProdutoCusto
+    from menu_cache import parse_price
+import csv
+import unicodedata
+
+# Limite seguro de parâmetros por IN (...) no SQLite
+CHUNK_SIZE = 500
+# Linhas do CSV acumuladas antes de cada INSERT/UPDATE em lote
+BATCH_SIZE = 1000
+# Quantidade máxima de erros de linha devolvidos na resposta
+MAX_ERROS = 100
+
+PRODUTO_CAMPOS = ('categoria_id', 'nome', 'descricao', 'preco', 'foto_url', 'visivel', 'esgotado')
+
+
+class ImportAborted(ValueError):
+    """Arquivo com mais erros que linhas válidas no modo 'replace' (nada é removido)"""
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_name(value):
+    """Chave de comparação sem acento e sem diferença de maiúsculas: ' Pão  de Queijo' -> 'pao de queijo'"""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return ' '.join(value.casefold().split())
+
+
+def _remove_produtos(ids):
+    for chunk in _chunks(ids):
+        # Pedidos antigos guardam o nome do produto; só desfaz o vínculo
+        db.session.execute(db.update(ItemPedido).where(ItemPedido.produto_id.in_(chunk)).values(produto_id=None))
+        db.session.execute(db.delete(FichaTecnica).where(FichaTecnica.produto_id.in_(chunk)))
+        db.session.execute(db.delete(ProdutoCusto).where(ProdutoCusto.produto_id.in_(chunk)))
+        db.session.execute(db.delete(Produto).where(Produto.id.in_(chunk)))
+
+
+def _remove_categorias(ids):
+    for chunk in _chunks(ids):
+        db.session.execute(db.delete(Categoria).where(Categoria.id.in_(chunk)))
+
+
+def _produto_from_item(item, categoria_id):
+    return {
+        "categoria_id": categoria_id,
+        "nome": item.get('nome'),
+        "descricao": item.get('desc'),
+        "preco": parse_price(item.get('preco')),
+        "foto_url": item.get('foto'),
+        "visivel": item.get('visivel', True),
+        "esgotado": item.get('esgotado', False)
+    }
+
+
+def _changed(atual, novo):
+    for campo in PRODUTO_CAMPOS:
+        if campo == 'preco':
+            if abs((atual['preco'] or 0.0) - novo['preco']) > 0.001:
+                return True
+        elif atual[campo] != novo[campo]:
+            return True
+    return False
+
+
+def sync_menu(data):
+    """
+    Sincroniza o cardápio do banco com o JSON do admin ({ "Categoria": [itens] }).
+
+    Carrega categorias e produtos uma única vez, calcula o diff (inserir,
+    atualizar, remover) e aplica com operações em lote na sessão atual.
+    O commit fica a cargo de quem chama. Retorna um resumo das alterações.
+    """
+    if not isinstance(data, dict) or not data:
+        raise ValueError("Cardápio vazio ou em formato inválido")
+
+    resumo = {
+        "categorias": {"criadas": 0, "atualizadas": 0, "removidas": 0},
+        "produtos": {"criados": 0, "atualizados": 0, "removidos": 0, "inalterados": 0}
+    }
+
+    # 1. Estado atual (2 consultas)
+    categorias = {
+        nome: {"id": c_id, "ordem": ordem}
+        for c_id, nome, ordem in db.session.execute(db.select(Categoria.id, Categoria.nome, Categoria.ordem))
+    }
+    produtos_por_id = {}
+    produtos_por_nome = {}
+    for row in db.session.execute(db.select(Produto.id, *[getattr(Produto, c) for c in PRODUTO_CAMPOS])):
+        p = row._asdict()
+        produtos_por_id[p['id']] = p
+        produtos_por_nome.setdefault((p['categoria_id'], p['nome']), p)
+
+    # 2. Categorias: cria as novas e ajusta a ordem (na ordem em que vieram do admin)
+    novas_categorias = []
+    ordem_updates = []
+    for ordem, cat_name in enumerate(data.keys(), start=1):
+        cat = categorias.get(cat_name)
+        if cat is None:
+            novas_categorias.append({"nome": cat_name, "ordem": ordem})
+        elif cat['ordem'] != ordem:
+            ordem_updates.append({"id": cat['id'], "ordem": ordem})
+
+    if novas_categorias:
+        for c_id, nome in db.session.execute(db.insert(Categoria).returning(Categoria.id, Categoria.nome), novas_categorias):
+            categorias[nome] = {"id": c_id, "ordem": None}
+        resumo['categorias']['criadas'] = len(novas_categorias)
+    if ordem_updates:
+        db.session.execute(db.update(Categoria), ordem_updates)
+        resumo['categorias']['atualizadas'] = len(ordem_updates)
+
+    # 3. Produtos: casa por ID e, como fallback, por (categoria, nome)
+    vistos = set()
+    inserts = []
+    updates = []
+    for cat_name, items in data.items():
+        categoria_id = categorias[cat_name]['id']
+        for item in items or []:
+            atual = produtos_por_id.get(_to_int(item.get('id')))
+            if atual is None or atual['id'] in vistos:
+                atual = produtos_por_nome.get((categoria_id, item.get('nome')))
+                if atual is not None and atual['id'] in vistos:
+                    atual = None
+
+            if not item.get('nome'):
+                # Linha em branco no admin: não cria nada, mas também não apaga o existente
+                if atual is not None:
+                    vistos.add(atual['id'])
+                continue
+
+            novo = _produto_from_item(item, categoria_id)
+            if atual is None:
+                inserts.append(novo)
+                continue
+
+            vistos.add(atual['id'])
+            if _changed(atual, novo):
+                updates.append({"id": atual['id'], **novo})
+            else:
+                resumo['produtos']['inalterados'] += 1
+
+    if inserts:
+        db.session.execute(db.insert(Produto), inserts)
+        resumo['produtos']['criados'] = len(inserts)
+    if updates:
+        db.session.execute(db.update(Produto), updates)
+        resumo['produtos']['atualizados'] = len(updates)
+
+    # 4. Remoções: produtos que não vieram no JSON foram apagados no admin
+    removidos = [p_id for p_id in produtos_por_id if p_id not in vistos]
+    _remove_produtos(removidos)
+    resumo['produtos']['removidos'] = len(removidos)
+
+    # Categorias que não vieram no JSON (apagadas ou renomeadas no admin). O cardápio
+    # do admin (api_menu) não lista categorias vazias, então a ausência de uma categoria
+    # sem produtos não diz nada: ela fica, com visibilidade e exibição de preço.
+    com_produtos = {p['categoria_id'] for p in produtos_por_id.values()}
+    categorias_removidas = [
+        cat['id'] for nome, cat in categorias.items() if nome not in data and cat['id'] in com_produtos
+    ]
+    _remove_categorias(categorias_removidas)
+    resumo['categorias']['removidas'] = len(categorias_removidas)
+
+    return resumo
+
+
+class CsvMenuImporter:
+    """
+    Importa o CSV do modelo (Categoria;Nome;Descricao;Preco;Foto) direto para o banco.
+
+    O arquivo é lido linha a linha; cada linha é casada com um índice
+    (categoria, nome) sem acento/maiúsculas montado uma única vez, e as
+    alterações vão para o banco em lotes de BATCH_SIZE. No modo 'replace',
+    produtos e categorias que não aparecem no arquivo são removidos ao final;
+    se nenhuma linha foi aceita, ou houve mais erros que linhas aceitas (ex:
+    cabeçalho ou separador errado), levanta ImportAborted sem remover nada.
+    O commit (ou rollback) fica a cargo de quem chama.
+    """
+
+    def __init__(self, mode='merge'):
+        if mode not in ('merge', 'replace'):
+            raise ValueError(f"Modo de importação inválido: {mode}")
+        self.mode = mode
+        self.resumo = {"linhas": 0, "criados": 0, "atualizados": 0, "removidos": 0, "categorias_criadas": 0, "erros": 0}
+        self.erros = []
+
+        self._categorias = {}   # nome normalizado -> id
+        self._produtos = {}     # (categoria_id, nome normalizado) -> id
+        self._existentes = set()
+        self._vistos = set()
+        self._categorias_vistas = set()
+        self._aceitas = 0
+        self._inserts = {}      # (categoria_id, nome normalizado) -> linha pendente
+        self._updates = []
+        self._proxima_ordem = 1
+
+    def _load_index(self):
+        for c_id, nome, ordem in db.session.execute(db.select(Categoria.id, Categoria.nome, Categoria.ordem)):
+            self._categorias.setdefault(normalize_name(nome), c_id)
+            self._proxima_ordem = max(self._proxima_ordem, (ordem or 0) + 1)
+        for p_id, categoria_id, nome in db.session.execute(db.select(Produto.id, Produto.categoria_id, Produto.nome)):
+            self._produtos.setdefault((categoria_id, normalize_name(nome)), p_id)
+            self._existentes.add(p_id)
+
+    def _categoria_id(self, nome):
+        key = normalize_name(nome)
+        c_id = self._categorias.get(key)
+        if c_id is None:
+            c_id = db.session.execute(
+                db.insert(Categoria).values(nome=nome, ordem=self._proxima_ordem).returning(Categoria.id)
+            ).scalar_one()
+            self._categorias[key] = c_id
+            self._proxima_ordem += 1
+            self.resumo['categorias_criadas'] += 1
+        self._categorias_vistas.add(c_id)
+        return c_id
+
+    def _erro(self, linha, mensagem):
+        self.resumo['erros'] += 1
+        if len(self.erros) < MAX_ERROS:
+            self.erros.append({"linha": linha, "erro": mensagem})
+
+    def _flush(self):
+        if self._inserts:
+            rows = list(self._inserts.items())
+            result = db.session.execute(
+                db.insert(Produto).returning(Produto.id, sort_by_parameter_order=True),
+                [row for _, row in rows]
+            )
+            for (key, _), p_id in zip(rows, result.scalars()):
+                self._produtos[key] = p_id
+                self._vistos.add(p_id)
+            self.resumo['criados'] += len(rows)
+            self._inserts = {}
+        if self._updates:
+            db.session.execute(db.update(Produto), self._updates)
+            self.resumo['atualizados'] += len(self._updates)
+            self._updates = []
+
+    def process_row(self, linha, row):
+        categoria = (row.get('Categoria') or '').strip()
+        nome = (row.get('Nome') or '').strip()
+        desc = (row.get('Descricao') or '').strip()
+        photo = (row.get('Foto') or '').strip()
+
+        if not categoria or not nome:
+            self._erro(linha, "Categoria e Nome são obrigatórios")
+            return
+        try:
+            preco = parse_price((row.get('Preco') or '').strip(), strict=True)
+        except ValueError as e:
+            self._erro(linha, str(e))
+            return
+
+        self._aceitas += 1
+        categoria_id = self._categoria_id(categoria)
+        key = (categoria_id, normalize_name(nome))
+        p_id = self._produtos.get(key)
+
+        if p_id is not None:
+            update = {"id": p_id, "descricao": desc, "preco": preco}
+            if photo: update['foto_url'] = photo
+            self._updates.append(update)
+            self._vistos.add(p_id)
+        elif key in self._inserts:
+            # Linha repetida no mesmo lote: a última vence
+            pendente = self._inserts[key]
+            pendente.update(descricao=desc, preco=preco)
+            if photo: pendente['foto_url'] = photo
+        else:
+            self._inserts[key] = {
+                "categoria_id": categoria_id,
+                "nome": nome,
+                "descricao": desc,
+                "preco": preco,
+                "foto_url": photo or None,
+                "visivel": True,
+                "esgotado": False
+            }
+
+        if len(self._inserts) + len(self._updates) >= BATCH_SIZE:
+            self._flush()
+
+    def run(self, text_stream):
+        """Processa um arquivo texto já decodificado. Retorna o resumo da importação."""
+        self._load_index()
+        reader = csv.DictReader(text_stream, delimiter=';')
+        # Linha 1 é o cabeçalho
+        for linha, row in enumerate(reader, start=2):
+            self.resumo['linhas'] += 1
+            self.process_row(linha, row)
+        self._flush()
+
+        if self.mode == 'replace':
+            if not self._aceitas or self.resumo['erros'] > self._aceitas:
+                raise ImportAborted(
+                    f"Importação cancelada: {self._aceitas} linha(s) válida(s) e {self.resumo['erros']} com erro. "
+                    "Confira o cabeçalho (Categoria;Nome;Descricao;Preco;Foto) e o separador ';'. Nada foi removido."
+                )
+            removidos = list(self._existentes - self._vistos)
+            _remove_produtos(removidos)
+            self.resumo['removidos'] = len(removidos)
+            _remove_categorias([c_id for c_id in set(self._categorias.values()) if c_id not in self._categorias_vistas])
+
+        return self.resumo
@@ -0,0 +1,263 @@
+try:
+    from .database import db
+    from .models import SchemaVersion
+    from .recipe_costs import refresh_statements
+    from .activity_log import migrate_logs_json
+    from .loyalty import migrate_loyalty_json
+    from .coupons import migrate_coupons_json
+except ImportError:
+    from database import db
+    from models import SchemaVersion
+    from recipe_costs import refresh_statements
+    from activity_log import migrate_logs_json
+    from loyalty import migrate_loyalty_json
+    from coupons import migrate_coupons_json
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+import json
+import sys
+
+
+# --- PASSOS REUTILIZÁVEIS (todos idempotentes) ---
+
+def add_column(conn, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN se a coluna ainda não existe; retorna True se criou"""
+    inspector = inspect(conn)
+    if table not in inspector.get_table_names():
+        return False
+    if column in {c['name'] for c in inspector.get_columns(table)}:
+        return False
+    print(f"Migração: adicionando coluna {table}.{column}")
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def create_index(conn, name, table, columns):
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def backfill_from_metadata(conn, column, key, convert=None):
+    """Copia metadata_json[key] dos pedidos antigos para uma coluna nova de pedidos"""
+    updates = []
+    for pedido_id, raw in conn.execute(text("SELECT id, metadata_json FROM pedidos WHERE metadata_json IS NOT NULL")):
+        try:
+            value = json.loads(raw).get(key)
+        except (ValueError, AttributeError):
+            continue
+        if value in (None, ''):
+            continue
+        try:
+            updates.append({"id": pedido_id, "value": convert(value) if convert else value})
+        except (TypeError, ValueError):
+            continue
+    if updates:
+        conn.execute(text(f"UPDATE pedidos SET {column} = :value WHERE id = :id"), updates)
+
+
+# --- MIGRAÇÕES ---
+# Rodam em ordem, uma vez por banco, cada uma na sua transação. Precisam ser
+# idempotentes: num banco novo create_all() já criou tudo e elas só são registradas.
+
+def m001_ingredientes_tipo(conn):
+    """Antigo migrate_tipo.py"""
+    add_column(conn, 'ingredientes', 'tipo', "VARCHAR(20) DEFAULT 'insumo'")
+
+
+def m002_pedidos_updated_at(conn):
+    if add_column(conn, 'pedidos', 'updated_at', 'TIMESTAMP'):
+        conn.execute(text("UPDATE pedidos SET updated_at = data_hora WHERE updated_at IS NULL"))
+    create_index(conn, 'ix_pedidos_updated_at', 'pedidos', ['updated_at'])
+
+
+def m003_pedidos_campos_entrega(conn):
+    """Campos promovidos do metadata_json, com os valores dos pedidos antigos"""
+    for column, ddl, key, convert in (
+        ('metodo_envio', 'VARCHAR(20)', 'metodo_envio', None),
+        ('taxa_entrega', 'FLOAT DEFAULT 0', 'taxa_entrega', float),
+        ('cupom_codigo', 'VARCHAR(50)', 'coupon', None),
+        ('motoboy', 'VARCHAR(100)', 'motoboy', None),
+        ('troco_para', 'VARCHAR(50)', 'troco_para', str),
+    ):
+        if add_column(conn, 'pedidos', column, ddl):
+            backfill_from_metadata(conn, column, key, convert)
+    create_index(conn, 'ix_pedidos_metodo_envio', 'pedidos', ['metodo_envio'])
+    create_index(conn, 'ix_pedidos_cupom_codigo', 'pedidos', ['cupom_codigo'])
+    create_index(conn, 'ix_pedidos_motoboy_data_hora', 'pedidos', ['motoboy', 'data_hora'])
+
+
+def m004_indices_desempenho(conn):
+    """Colunas usadas em filtros, ordenação e junções das telas e relatórios"""
+    # Também atende buscas só por status (prefixo do índice)
+    create_index(conn, 'ix_pedidos_status_data_hora', 'pedidos', ['status', 'data_hora', 'id'])
+    create_index(conn, 'ix_pedidos_data_hora', 'pedidos', ['data_hora'])
+    create_index(conn, 'ix_pedidos_cliente_telefone', 'pedidos', ['cliente_telefone'])
+    create_index(conn, 'ix_itens_pedido_pedido_id', 'itens_pedido', ['pedido_id'])
+    create_index(conn, 'ix_ficha_tecnica_produto_id', 'ficha_tecnica', ['produto_id'])
+    create_index(conn, 'ix_produtos_nome', 'produtos', ['nome'])
+    create_index(conn, 'ix_produtos_categoria_id', 'produtos', ['categoria_id'])
+    create_index(conn, 'ix_reservas_data_reserva', 'reservas', ['data_reserva'])
+
+
+def m005_produto_custos(conn):
+    """Tabela nova (create_all); calcula o custo de todos os produtos com as fichas existentes"""
+    # Produtos afetados pela mudança de custo de um ingrediente
+    create_index(conn, 'ix_ficha_tecnica_ingrediente_id', 'ficha_tecnica', ['ingrediente_id'])
+    for stmt in refresh_statements():
+        conn.execute(stmt)
+
+
+def m006_pedidos_telefone_digitos(conn):
+    """Telefone só com dígitos, indexado, para o filtro do histórico por cliente"""
+    if add_column(conn, 'pedidos', 'cliente_telefone_digitos', 'VARCHAR(20)'):
+        updates = [
+            {"id": pedido_id, "value": ''.join(filter(str.isdigit, telefone)) or None}
+            for pedido_id, telefone in conn.execute(text("SELECT id, cliente_telefone FROM pedidos WHERE cliente_telefone IS NOT NULL"))
+        ]
+        if updates:
+            conn.execute(text("UPDATE pedidos SET cliente_telefone_digitos = :value WHERE id = :id"), updates)
+    create_index(conn, 'ix_pedidos_telefone_status_data_hora', 'pedidos',
+                 ['cliente_telefone_digitos', 'status', 'data_hora', 'id'])
+    # O filtro nunca usava este índice (a coluna ia dentro de replace())
+    conn.execute(text("DROP INDEX IF EXISTS ix_pedidos_cliente_telefone"))
+
+
+MIGRATIONS = [
+    (1, 'ingredientes.tipo', m001_ingredientes_tipo),
+    (2, 'pedidos.updated_at', m002_pedidos_updated_at),
+    (3, 'pedidos: campos de entrega fora do metadata_json', m003_pedidos_campos_entrega),
+    (4, 'índices de desempenho', m004_indices_desempenho),
+    (5, 'produto_custos: custo das fichas técnicas', m005_produto_custos),
+    (6, 'pedidos.cliente_telefone_digitos', m006_pedidos_telefone_digitos),
+]
+
+
+# --- EXECUÇÃO ---
+
+def applied_versions():
+    return set(db.session.scalars(db.select(SchemaVersion.versao)))
+
+
+def pending_migrations():
+    aplicadas = applied_versions()
+    return [m for m in MIGRATIONS if m[0] not in aplicadas]
+
+
+def run_migrations():
+    """Aplica as migrações pendentes (dentro de um app context); retorna as versões aplicadas"""
+    aplicadas = []
+    for versao, nome, migrate in pending_migrations():
+        try:
+            with db.engine.begin() as conn:
+                migrate(conn)
+                conn.execute(db.insert(SchemaVersion).values(versao=versao, nome=nome, aplicada_em=datetime.utcnow()))
+        except Exception:
+            # Outro processo pode ter aplicado a mesma versão ao mesmo tempo
+            db.session.rollback()
+            if versao in applied_versions():
+                continue
+            raise
+        print(f"Migração {versao} aplicada: {nome}")
+        aplicadas.append(versao)
+    return aplicadas
+
+
+def import_legacy_json(logs_file, loyalty_file, coupons_file):
+    """
+    Importa uma única vez os JSON antigos (logs, fidelidade, cupons) para o banco;
+    cada arquivo importado é renomeado para .migrado. Só roda pela linha de
+    comando: importar o app nunca mexe nos arquivos da árvore.
+    """
+    for nome, migrate, path in (
+        ('logs', migrate_logs_json, logs_file),
+        ('fidelidade', migrate_loyalty_json, loyalty_file),
+        ('cupons', migrate_coupons_json, coupons_file),
+    ):
+        total = migrate(path)
+        if total:
+            print(f"JSON antigo importado: {total} registro(s) de {nome} ({path})")
+
+
+# --- RELATÓRIO DE PLANOS DE CONSULTA ---
+# Formas das consultas principais do app (valores de exemplo; o plano não depende deles)
+REPORT_QUERIES = [
+    ("Fila ativa (cozinha/painel)",
+     "SELECT id FROM pedidos WHERE status != 'concluido' ORDER BY data_hora DESC"),
+    ("Pedidos alterados (?since=)",
+     "SELECT id FROM pedidos WHERE updated_at >= '2026-01-01 00:00:00'"),
+    ("Histórico, primeira página",
+     "SELECT id FROM pedidos WHERE status = 'concluido' ORDER BY data_hora DESC, id DESC LIMIT 51"),
+    ("Itens de uma lista de pedidos",
+     "SELECT pedido_id, produto_nome FROM itens_pedido WHERE pedido_id IN (1, 2, 3)"),
+    ("Pedidos de um cliente",
+     "SELECT id FROM pedidos WHERE status = 'concluido' AND cliente_telefone_digitos = '11999999999' ORDER BY data_hora DESC, id DESC LIMIT 51"),
+    ("Pedidos de um período",
+     "SELECT count(*) FROM pedidos WHERE data_hora BETWEEN '2026-01-01' AND '2026-01-31'"),
+    ("Entregas por motoboy",
+     "SELECT motoboy, count(id) FROM pedidos WHERE motoboy IS NOT NULL AND data_hora >= '2026-01-01' GROUP BY motoboy"),
+    ("Ficha técnica do produto",
+     "SELECT ingrediente_id, quantidade FROM ficha_tecnica WHERE produto_id = 1"),
+    ("Produto por nome",
+     "SELECT id FROM produtos WHERE nome = 'Calabresa'"),
+    ("Produtos da categoria",
+     "SELECT id FROM produtos WHERE categoria_id = 1"),
+    ("Produtos que usam um ingrediente",
+     "SELECT produto_id FROM ficha_tecnica WHERE ingrediente_id = 1"),
+    ("Reservas do dia",
+     "SELECT id FROM reservas WHERE data_reserva = '2026-01-01'"),
+]
+
+
+def explain_report():
+    """[(consulta, [linhas do plano])] para REPORT_QUERIES no banco atual"""
+    report = []
+    with db.engine.connect() as conn:
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == 'sqlite' else "EXPLAIN "
+        for nome, sql in REPORT_QUERIES:
+            try:
+                plano = [str(row[-1]) for row in conn.execute(text(prefix + sql))]
+            except DBAPIError as e:
+                # Ex: coluna que só existe depois de uma migração pendente
+                conn.rollback()
+                plano = [f"(indisponível: {e.orig})"]
+            report.append((nome, plano))
+    return report
+
+
+def print_report(report, titulo):
+    print(f"\n=== {titulo} ===")
+    for nome, plano in report:
+        print(f"- {nome}")
+        for linha in plano:
+            print(f"    {linha}")
+
+
+if __name__ == "__main__":
+    # python migrations.py           aplica as pendentes (plano das consultas antes/depois) e importa os JSON antigos
+    # python migrations.py status    versões aplicadas e pendentes
+    # python migrations.py explain   só o plano das consultas
+    # python migrations.py json      só a importação dos JSON antigos (logs, fidelidade, cupons)
+    import os
+    os.environ['AUTO_MIGRATE'] = '0'  # O import do app não aplica nada sozinho
+    from app import app, LOGS_FILE, LOYALTY_FILE, COUPONS_FILE
+
+    comando = sys.argv[1] if len(sys.argv) > 1 else 'migrate'
+    with app.app_context():
+        if comando == 'status':
+            aplicadas = applied_versions()
+            for versao, nome, _ in MIGRATIONS:
+                print(f"{'✅' if versao in aplicadas else '⏳'} {versao:03d} {nome}")
+        elif comando == 'explain':
+            print_report(explain_report(), "Plano das consultas")
+        elif comando == 'json':
+            import_legacy_json(LOGS_FILE, LOYALTY_FILE, COUPONS_FILE)
+        else:
+            pendentes = pending_migrations()
+            if not pendentes:
+                print("✅ Banco já está na última versão.")
+            else:
+                antes = explain_report()
+                run_migrations()
+                print_report(antes, "Antes")
+                print_report(explain_report(), "Depois")
+            import_legacy_json(LOGS_FILE, LOYALTY_FILE, COUPONS_FILE)
@@ -3,8 +3,16 @@ try:
 except ImportError:
     from database import db
 from datetime import datetime
+from sqlalchemy.orm import validates
 import json
 
+# --- CONTROLE DE VERSÃO DO BANCO (migrations.py) ---
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    versao = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    nome = db.Column(db.String(100), nullable=False)
+    aplicada_em = db.Column(db.DateTime, default=datetime.utcnow)
+
 # --- TABELAS DE ADMINISTRAÇÃO E ACESSO ---
 class User(db.Model):
     __tablename__ = 'users'
@@ -40,8 +48,8 @@ class Categoria(db.Model):
 class Produto(db.Model):
     __tablename__ = 'produtos'
     id = db.Column(db.Integer, primary_key=True)
-    categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'), nullable=False)
-    nome = db.Column(db.String(100), nullable=False)
+    categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'), nullable=False, index=True)
+    nome = db.Column(db.String(100), nullable=False, index=True)
     descricao = db.Column(db.Text)
     preco = db.Column(db.Float, nullable=False)
     foto_url = db.Column(db.String(255))
@@ -55,35 +63,66 @@ class FichaTecnica(db.Model):
     """Liga Produto a Ingredientes (Receita)"""
     __tablename__ = 'ficha_tecnica'
     id = db.Column(db.Integer, primary_key=True)
-    produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), nullable=False)
-    ingrediente_id = db.Column(db.Integer, db.ForeignKey('ingredientes.id'), nullable=False)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), nullable=False, index=True)
+    ingrediente_id = db.Column(db.Integer, db.ForeignKey('ingredientes.id'), nullable=False, index=True)
     quantidade = db.Column(db.Float, nullable=False) # Quanto usa desse ingrediente
     
     # Relacionamento
     ingrediente = db.relationship('Ingrediente', backref='fichas_tecnicas')
 
+class ProdutoCusto(db.Model):
+    """Custo da receita (CMV) de cada produto, recalculado por recipe_costs quando ficha ou custo mudam"""
+    __tablename__ = 'produto_custos'
+    produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id', ondelete='CASCADE'), primary_key=True, autoincrement=False)
+    custo = db.Column(db.Float, nullable=False, default=0.0)
+    itens_ficha = db.Column(db.Integer, default=0)
+    itens_sem_custo = db.Column(db.Integer, default=0) # Ingredientes da ficha sem custo cadastrado
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
 # --- VENDAS E PEDIDOS ---
 class Pedido(db.Model):
     __tablename__ = 'pedidos'
+    # Histórico paginado por (data_hora, id) dentro de um status (e de um cliente); entregas por motoboy num período
+    __table_args__ = (
+        db.Index('ix_pedidos_status_data_hora', 'status', 'data_hora', 'id'),
+        db.Index('ix_pedidos_telefone_status_data_hora', 'cliente_telefone_digitos', 'status', 'data_hora', 'id'),
+        db.Index('ix_pedidos_motoboy_data_hora', 'motoboy', 'data_hora'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    data_hora = db.Column(db.DateTime, default=datetime.utcnow)
+    data_hora = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     cliente_nome = db.Column(db.String(100))
     cliente_telefone = db.Column(db.String(20))
+    # Só os dígitos do telefone (filtro do histórico por cliente), preenchido junto com cliente_telefone
+    cliente_telefone_digitos = db.Column(db.String(20))
     cliente_endereco = db.Column(db.Text)
     
     status = db.Column(db.String(20), default='novo') # novo, preparo, entrega, concluido, cancelado
     metodo_pagamento = db.Column(db.String(50))
     total = db.Column(db.Float, default=0.0)
     
-    # JSON para armazenar dados flexíveis (ex: taxas, cupons aplicados)
+    # Dados de entrega/pagamento consultados em filtros e relatórios (antes dentro do metadata_json)
+    metodo_envio = db.Column(db.String(20), index=True) # Entrega, Retirada
+    taxa_entrega = db.Column(db.Float, default=0.0)
+    cupom_codigo = db.Column(db.String(50), index=True)
+    motoboy = db.Column(db.String(100))
+    troco_para = db.Column(db.String(50))
+    
+    # JSON para dados raros/flexíveis (ex: obs, descontos aplicados, endereço completo)
     metadata_json = db.Column(db.Text) 
+    # Tocado em toda alteração (cursor do ?since= em /api/admin/pedidos)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     itens = db.relationship('ItemPedido', backref='pedido', lazy=True)
 
+    @validates('cliente_telefone')
+    def _set_telefone_digitos(self, key, telefone):
+        self.cliente_telefone_digitos = ''.join(filter(str.isdigit, str(telefone or ''))) or None
+        return telefone
+
 class ItemPedido(db.Model):
     __tablename__ = 'itens_pedido'
     id = db.Column(db.Integer, primary_key=True)
-    pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos.id'), nullable=False)
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos.id'), nullable=False, index=True)
     produto_nome = db.Column(db.String(100)) # Copia nome caso produto seja deletado depois
     produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), nullable=True) # Link opcional
     quantidade = db.Column(db.Integer, nullable=False)
@@ -96,7 +135,7 @@ class Reserva(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome_cliente = db.Column(db.String(100), nullable=False)
     telefone = db.Column(db.String(20), nullable=False)
-    data_reserva = db.Column(db.Date, nullable=False)
+    data_reserva = db.Column(db.Date, nullable=False, index=True)
     hora_reserva = db.Column(db.Time, nullable=False)
     num_pessoas = db.Column(db.Integer, nullable=False)
     observacao = db.Column(db.Text)
@@ -112,3 +151,56 @@ class Depoimento(db.Model):
     nota = db.Column(db.Integer, default=5)
     data = db.Column(db.DateTime, default=datetime.utcnow)
     aprovado = db.Column(db.Boolean, default=False) # Para moderação futura
+
+# --- FIDELIDADE ---
+class FidelidadeMovimento(db.Model):
+    """Extrato de pontos (só inserção): cada pedido concluído gera uma linha"""
+    __tablename__ = 'fidelidade'
+    id = db.Column(db.Integer, primary_key=True)
+    telefone = db.Column(db.String(20), nullable=False, index=True) # Só dígitos
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos.id'), nullable=True, index=True) # None = migração/ajuste
+    pontos = db.Column(db.Integer, nullable=False) # Pode ser negativo (resgate)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FidelidadeSaldo(db.Model):
+    """Saldo atual por telefone (soma do extrato), lido pela chave primária"""
+    __tablename__ = 'fidelidade_saldos'
+    telefone = db.Column(db.String(20), primary_key=True)
+    pontos = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# --- CUPONS ---
+class Cupom(db.Model):
+    __tablename__ = 'cupons'
+    id = db.Column(db.Integer, primary_key=True)
+    codigo = db.Column(db.String(30), nullable=False, unique=True, index=True) # Sempre maiúsculo
+    tipo = db.Column(db.String(20), default='porcentagem') # porcentagem, fixo
+    valor = db.Column(db.Float, nullable=False, default=0.0)
+    descricao = db.Column(db.String(200))
+    ativo = db.Column(db.Boolean, default=True)
+    valido_de = db.Column(db.DateTime, nullable=True) # None = sem início
+    valido_ate = db.Column(db.DateTime, nullable=True) # None = sem validade
+    limite_uso = db.Column(db.Integer, nullable=True) # Total de usos (None = ilimitado)
+    limite_por_cliente = db.Column(db.Integer, nullable=True) # Usos por telefone (None = ilimitado)
+    usos = db.Column(db.Integer, nullable=False, default=0) # Contador atômico (ver coupons.py)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class CupomUso(db.Model):
+    """Cada resgate de cupom (um por pedido), para o limite por cliente"""
+    __tablename__ = 'cupons_usos'
+    __table_args__ = (db.Index('ix_cupons_usos_cupom_telefone', 'cupom_id', 'telefone'),)
+    id = db.Column(db.Integer, primary_key=True)
+    cupom_id = db.Column(db.Integer, db.ForeignKey('cupons.id'), nullable=False)
+    telefone = db.Column(db.String(20), nullable=False) # Só dígitos
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# --- AUDITORIA ---
+class LogAtividade(db.Model):
+    """Log de atividades do admin (só inserção, gravado em lote por activity_log.py)"""
+    __tablename__ = 'logs_atividade'
+    __table_args__ = (db.Index('ix_logs_atividade_usuario_data', 'usuario', 'data_hora'),)
+    id = db.Column(db.Integer, primary_key=True)
+    data_hora = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
+    usuario = db.Column(db.String(80), nullable=False)
+    acao = db.Column(db.Text, nullable=False)
@@ -0,0 +1,100 @@
+from collections import deque
+import json
+import threading
+import uuid
+
+# Quantos eventos ficam guardados para quem reconecta (Last-Event-ID)
+BUFFER_SIZE = 1000
+# Intervalo do comentário de keep-alive do SSE (proxies derrubam conexões mudas)
+KEEPALIVE_SECONDS = 15
+
+
+class OrderEventBus:
+    """
+    Barramento de eventos de pedidos deste processo (criado/alterado/removido).
+
+    As rotas de pedido publicam depois do commit; cada conexão SSE fica
+    bloqueada em wait() até haver algo novo, então tela parada não custa CPU.
+    Os eventos ficam num buffer circular e o cursor '<época>-<seq>' permite a
+    uma tela que reconecta receber só o que perdeu. Cursor de outra época
+    (reinício do servidor ou outro worker) ou antigo demais devolve None: o
+    cliente recebe então a lista completa.
+
+    Só vê o que foi publicado neste processo: com vários workers, o cliente
+    (order_feed.js) completa com o ?since= de /api/admin/pedidos.
+    """
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=buffer_size)  # (seq, evento, json)
+        self._seq = 0
+
+    @property
+    def cursor(self):
+        return f"{self.epoch}-{self._seq}"
+
+    def publish(self, event, data):
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event, payload))
+            self._cond.notify_all()
+
+    def parse_cursor(self, cursor):
+        """Sequência do cursor se ele é desta época, senão None"""
+        epoch, _, seq = (cursor or '').partition('-')
+        if epoch != self.epoch:
+            return None
+        try:
+            return int(seq)
+        except ValueError:
+            return None
+
+    def wait(self, seq, timeout=KEEPALIVE_SECONDS):
+        """
+        Eventos depois de `seq` (espera até `timeout` segundos por algum).
+        Retorna [] se nada aconteceu ou None se o buffer já não cobre `seq`.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+            if self._seq <= seq:
+                return []
+            if self._events[0][0] > seq + 1:
+                return None
+            return [e for e in self._events if e[0] > seq]
+
+
+def sse_format(event, payload, event_id=None):
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {payload}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream_events(bus, seq, snapshot):
+    """
+    Gerador do corpo text/event-stream. `snapshot()` devolve a lista atual de
+    pedidos; é enviada na conexão inicial (seq None) e sempre que o cursor
+    não puder ser retomado.
+    """
+    # Dica de reconexão para o EventSource (ms)
+    yield "retry: 3000\n\n"
+    while True:
+        if seq is None:
+            cursor = bus.cursor
+            seq = bus.parse_cursor(cursor)
+            yield sse_format('snapshot', json.dumps(snapshot(), ensure_ascii=False), cursor)
+            continue
+        events = bus.wait(seq)
+        if events is None:
+            seq = None
+            continue
+        if not events:
+            yield ": keep-alive\n\n"
+            continue
+        for event_seq, event, payload in events:
+            yield sse_format(event, payload, f"{bus.epoch}-{event_seq}")
+        seq = events[-1][0]
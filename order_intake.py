@@ -0,0 +1,109 @@
+try:
+    from .database import db
+    from .models import ItemPedido
+    from .menu_cache import parse_price
+    from .menu_sync import normalize_name
+except ImportError:
+    from database import db
+    from models import ItemPedido
+    from menu_cache import parse_price
+    from menu_sync import normalize_name
+import threading
+
+
+class ProductResolver:
+    """
+    Tabela de preços em memória: nome normalizado/id -> produto do cardápio
+    ({id, nome, preco, categoria, disponivel}).
+
+    Reconstruída a partir do snapshot do MenuCache só quando a versão do
+    cardápio muda, então resolver ou cotar os itens de um pedido não consulta o banco.
+    """
+
+    def __init__(self, menu_cache):
+        self.menu_cache = menu_cache
+        self._lock = threading.Lock()
+        self._index = None  # (versão, {nome normalizado: produto}, {id: produto})
+
+    def _get_index(self):
+        version = self.menu_cache.version
+        index = self._index
+        if index is not None and index[0] == version:
+            return index
+        with self._lock:
+            if self._index is None or self._index[0] != version:
+                snapshot = self.menu_cache.get()
+                by_name, by_id = {}, {}
+                for cat in snapshot.categorias:
+                    for item in cat['itens']:
+                        produto = {
+                            "id": item['id'],
+                            "nome": item['nome'],
+                            "preco": parse_price(item['preco']),
+                            "categoria": cat['nome'],
+                            "disponivel": cat['visivel'] and item['visivel'] and not item['esgotado']
+                        }
+                        by_id[item['id']] = produto
+                        # Nomes repetidos em categorias diferentes: vale o de menor id
+                        key = normalize_name(item['nome'])
+                        if key not in by_name or by_name[key]['id'] > item['id']:
+                            by_name[key] = produto
+                self._index = (snapshot.version, by_name, by_id)
+            return self._index
+
+    @property
+    def version(self):
+        return self._get_index()[0]
+
+    def resolve(self, produto_id=None, nome=None):
+        """Produto pelo id (se ainda existir) ou pelo nome; None se não encontrado"""
+        _, by_name, by_id = self._get_index()
+        try:
+            produto = by_id.get(int(produto_id)) if produto_id not in (None, '') else None
+        except (TypeError, ValueError):
+            produto = None
+        if produto is None and nome:
+            produto = by_name.get(normalize_name(nome))
+        return produto
+
+
+def insert_order_items(resolver, pedido_id, items):
+    """
+    Grava os itens do pedido num único INSERT em lote (sem commit).
+
+    `items` é uma lista de dicts {nome, id, quantidade, preco, obs}; itens
+    iguais (mesmo produto, preço e observação) são somados em `quantidade`.
+    Retorna a lista de linhas inseridas.
+    """
+    agrupados = {}
+    for item in items:
+        nome = item.get('nome')
+        produto = resolver.resolve(item.get('id'), nome)
+        produto_id = produto['id'] if produto else None
+        preco = item.get('preco')
+        if preco in (None, '') and produto:
+            preco = produto['preco']
+        preco = parse_price(preco)
+        observacao = item.get('obs') or ''
+        quantidade = int(item.get('quantidade') or 1)
+        if quantidade <= 0:
+            continue
+
+        key = (produto_id, nome if produto_id is None else None, preco, observacao)
+        row = agrupados.get(key)
+        if row is None:
+            agrupados[key] = {
+                "pedido_id": pedido_id,
+                "produto_nome": nome,
+                "produto_id": produto_id,
+                "quantidade": quantidade,
+                "preco_unitario": preco,
+                "observacao": observacao
+            }
+        else:
+            row['quantidade'] += quantidade
+
+    rows = list(agrupados.values())
+    if rows:
+        db.session.execute(db.insert(ItemPedido), rows)
+    return rows
@@ -0,0 +1,279 @@
+try:
+    from .database import db
+    from .models import Pedido, ItemPedido
+    from .menu_cache import format_price
+except ImportError:
+    from database import db
+    from models import Pedido, ItemPedido
+    from menu_cache import format_price
+from datetime import datetime
+import json
+import threading
+
+# Acima disso os itens são buscados por subconsulta com os mesmos filtros em vez de IN (ids)
+MAX_IN_IDS = 500
+# Pedidos serializados mantidos em memória (limpa tudo ao encher, como a busca)
+MAX_CACHED = 5000
+
+# Pedidos por lote nas exportações (itens de cada lote numa consulta IN)
+EXPORT_BATCH_SIZE = 500
+# Tamanho da página do histórico (?limit=)
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+# Só as colunas usadas na resposta (sem hidratar objetos do ORM)
+ORDER_COLUMNS = (
+    Pedido.id, Pedido.data_hora, Pedido.cliente_nome, Pedido.cliente_telefone,
+    Pedido.cliente_endereco, Pedido.status, Pedido.metodo_pagamento, Pedido.total,
+    Pedido.metodo_envio, Pedido.taxa_entrega, Pedido.cupom_codigo, Pedido.motoboy, Pedido.troco_para,
+    Pedido.metadata_json, Pedido.updated_at
+)
+ITEM_COLUMNS = (ItemPedido.pedido_id, ItemPedido.produto_nome, ItemPedido.quantidade, ItemPedido.preco_unitario)
+
+
+def order_meta(row):
+    """metadata_json decodificado ({} se vazio ou inválido)"""
+    if row.metadata_json:
+        try:
+            meta = json.loads(row.metadata_json)
+            if isinstance(meta, dict):
+                return meta
+        except ValueError:
+            pass
+    return {}
+
+
+def order_dict(row, itens):
+    """
+    Formato legado das telas de pedidos (admin, cozinha, histórico).
+    `row` tem os atributos de ORDER_COLUMNS (linha do select ou objeto Pedido);
+    `itens` é uma lista de (produto_nome, quantidade, preco_unitario).
+    """
+    meta = order_meta(row)
+    return {
+        "id": row.id,
+        "customer": row.cliente_nome,
+        "phone": row.cliente_telefone,
+        "method": row.metodo_envio or '',
+        "address": row.cliente_endereco,
+        "total": format_price(row.total),
+        "items": [{"name": nome, "quantity": qtd or 1, "price": format_price(preco)} for nome, qtd, preco in itens],
+        "obs": meta.get('obs', ''),
+        "coupon": row.cupom_codigo,
+        "fee": format_price(row.taxa_entrega),
+        "timestamp": row.data_hora.strftime("%d/%m/%Y %H:%M:%S"),
+        "status": row.status,
+        "motoboy": row.motoboy,
+        "payment_info": {
+            "method": row.metodo_pagamento or "Não informado",
+            "change": row.troco_para
+        }
+    }
+
+
+def history_criteria(start=None, end=None, telefone=None, pagamento=None, motoboy=None):
+    """
+    Filtros do histórico (pedidos concluídos). `start`/`end` são datas
+    'AAAA-MM-DD' (o dia final é incluído inteiro); levanta ValueError se inválidas.
+    """
+    criteria = [Pedido.status == 'concluido']
+    if start:
+        criteria.append(Pedido.data_hora >= datetime.strptime(start, "%Y-%m-%d"))
+    if end:
+        criteria.append(Pedido.data_hora <= datetime.strptime(end, "%Y-%m-%d").replace(hour=23, minute=59, second=59, microsecond=999999))
+    if telefone:
+        digitos = ''.join(filter(str.isdigit, telefone))
+        # Coluna só com dígitos (indexada): '(11) 9...' e '119...' acham os mesmos pedidos
+        criteria.append(Pedido.cliente_telefone_digitos == digitos if digitos else Pedido.cliente_telefone == telefone)
+    if pagamento:
+        criteria.append(Pedido.metodo_pagamento == pagamento)
+    if motoboy:
+        criteria.append(Pedido.motoboy == motoboy)
+    return criteria
+
+
+def encode_history_cursor(row):
+    return f"{row.data_hora.isoformat()}_{row.id}"
+
+
+def decode_history_cursor(cursor):
+    """'<data_hora ISO>_<id>' -> (datetime, id); levanta ValueError se inválido"""
+    data_hora, sep, pedido_id = cursor.rpartition('_')
+    if not sep:
+        raise ValueError(cursor)
+    return datetime.fromisoformat(data_hora), int(pedido_id)
+
+
+class OrderReadModel:
+    """
+    Leitura de listas de pedidos para as telas e exportações.
+
+    Pedidos e itens saem em duas consultas por lista (colunas projetadas, sem
+    lazy load por pedido). O dict de cada pedido fica em cache pela chave
+    (id, updated_at): como toda alteração via ORM toca updated_at, um pedido
+    só é serializado de novo quando muda. Alterações feitas com UPDATE direto
+    (Core) precisam atualizar updated_at também.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}  # id -> (updated_at, dict)
+
+    def _load_items(self, ids, criteria, order_by, limit):
+        itens = {pedido_id: [] for pedido_id in ids}
+        query = db.select(*ITEM_COLUMNS)
+        if criteria is None or len(ids) <= MAX_IN_IDS:
+            query = query.where(ItemPedido.pedido_id.in_(ids))
+        else:
+            # Lista grande: repete o filtro da lista de pedidos numa subconsulta (continua uma consulta só)
+            pedidos = db.select(Pedido.id).where(*criteria).order_by(*order_by)
+            if limit is not None:
+                pedidos = pedidos.limit(limit)
+            query = query.where(ItemPedido.pedido_id.in_(pedidos))
+        for pedido_id, nome, qtd, preco in db.session.execute(query.order_by(ItemPedido.pedido_id, ItemPedido.id)):
+            lista = itens.get(pedido_id)
+            if lista is not None:
+                lista.append((nome, qtd, preco))
+        return itens
+
+    def _select(self, criteria, order_by, limit):
+        query = db.select(*ORDER_COLUMNS).where(*criteria).order_by(*order_by)
+        if limit is not None:
+            query = query.limit(limit)
+        return db.session.execute(query).all()
+
+    def iter_rows(self, *criteria, order_by=(Pedido.data_hora.desc(),), batch_size=EXPORT_BATCH_SIZE):
+        """
+        Gerador de linhas cruas (row, itens, meta) para exportações grandes:
+        os pedidos vêm do cursor em lotes de `batch_size` (yield_per) e os
+        itens de cada lote numa consulta só, então a memória usada não
+        depende de quantos pedidos a exportação tem. Não passa pelo cache.
+        """
+        query = db.select(*ORDER_COLUMNS).where(*criteria).order_by(*order_by)
+        result = db.session.execute(query.execution_options(yield_per=batch_size))
+        try:
+            for rows in result.partitions():
+                # Sempre IN (ids do lote): a subconsulta traria os itens da exportação inteira
+                itens = self._load_items([row.id for row in rows], None, None, None)
+                for row in rows:
+                    yield row, itens[row.id], order_meta(row)
+        finally:
+            result.close()
+
+    def fetch(self, *criteria, order_by=(Pedido.data_hora.desc(),), limit=None):
+        """Lista de dicts dos pedidos que atendem `criteria` (expressões sobre Pedido)"""
+        return self._serialize(self._select(criteria, order_by, limit), criteria, order_by, limit)
+
+    def history(self, cursor=None, limit=HISTORY_PAGE_SIZE, **filtros):
+        """
+        Uma página do histórico, do mais recente para o mais antigo, paginada
+        por chave (data_hora, id): a página seguinte começa logo depois do
+        último pedido da anterior, então o custo não cresce com o tamanho do
+        histórico. O total só é contado na primeira página (sem cursor).
+        Levanta ValueError com cursor ou filtro inválido.
+        """
+        criteria = history_criteria(**filtros)
+        total = None
+        if cursor:
+            data_hora, pedido_id = decode_history_cursor(cursor)
+            criteria.append(db.and_(Pedido.data_hora <= data_hora,
+                                    db.or_(Pedido.data_hora < data_hora, Pedido.id < pedido_id)))
+        else:
+            total = db.session.scalar(db.select(db.func.count()).select_from(Pedido).where(*criteria))
+
+        order_by = (Pedido.data_hora.desc(), Pedido.id.desc())
+        limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+        # Um a mais só para saber se existe próxima página
+        rows = self._select(criteria, order_by, limit + 1)
+        proximo = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            proximo = encode_history_cursor(rows[-1])
+        return {
+            "pedidos": self._serialize(rows, criteria, order_by, limit + 1),
+            "proximo": proximo,
+            "total": total
+        }
+
+    def _serialize(self, rows, criteria, order_by, limit):
+        cache = self._cache
+        result = [None] * len(rows)
+        missing = []
+        for pos, row in enumerate(rows):
+            cached = cache.get(row.id)
+            if cached is not None and row.updated_at is not None and cached[0] == row.updated_at:
+                result[pos] = cached[1]
+            else:
+                missing.append(pos)
+
+        if missing:
+            itens = self._load_items([rows[pos].id for pos in missing], criteria, order_by, limit)
+            with self._lock:
+                if len(cache) + len(missing) > MAX_CACHED:
+                    cache.clear()
+                for pos in missing:
+                    row = rows[pos]
+                    data = order_dict(row, itens[row.id])
+                    if row.updated_at is not None:
+                        cache[row.id] = (row.updated_at, data)
+                    result[pos] = data
+        return result
+
+    def serialize(self, pedido):
+        """Dict de um único objeto Pedido (ex: depois de um commit, para o SSE)"""
+        itens = [(i.produto_nome, i.quantidade, i.preco_unitario) for i in pedido.itens]
+        return order_dict(pedido, itens)
+
+
+def benchmark(read_model, tamanhos=(10, 100, 1000), itens_por_pedido=3):
+    """
+    Conta consultas e tempo para listar N pedidos: lazy load por pedido (antigo)
+    x OrderReadModel (frio e com cache). Grava pedidos de teste e desfaz no fim.
+    """
+    from datetime import datetime
+    from sqlalchemy import event
+    import time
+
+    consultas = [0]
+
+    def contar(*args):
+        consultas[0] += 1
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', contar)
+    try:
+        for n in tamanhos:
+            agora = datetime.utcnow()
+            base = (db.session.scalar(db.select(db.func.max(Pedido.id))) or 0) + 1
+            db.session.execute(db.insert(Pedido), [{
+                "id": base + i, "data_hora": agora, "updated_at": agora, "cliente_nome": f"Benchmark {i}",
+                "status": "benchmark", "total": 50.0, "metadata_json": '{"obs": "teste"}'
+            } for i in range(n)])
+            db.session.execute(db.insert(ItemPedido), [{
+                "pedido_id": base + i, "produto_nome": f"Pizza {j}", "quantidade": 1, "preco_unitario": 10.0
+            } for i in range(n) for j in range(itens_por_pedido)])
+            filtro = Pedido.status == 'benchmark'
+
+            medidas = []
+            for nome, listar in (
+                ("lazy load", lambda: [read_model.serialize(p) for p in Pedido.query.filter(filtro).all()]),
+                ("read model", lambda: read_model.fetch(filtro)),
+                ("read model (cache)", lambda: read_model.fetch(filtro)),
+            ):
+                db.session.expire_all()
+                consultas[0] = 0
+                inicio = time.perf_counter()
+                total = len(listar())
+                medidas.append(f"{nome}: {consultas[0]} consulta(s), {(time.perf_counter() - inicio) * 1000:.1f} ms")
+            print(f"N={total:>5} | " + " | ".join(medidas))
+            db.session.rollback()
+    finally:
+        event.remove(engine, 'before_cursor_execute', contar)
+        db.session.rollback()
+
+
+if __name__ == "__main__":
+    from app import app, order_reads
+
+    with app.app_context():
+        benchmark(order_reads)
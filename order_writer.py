@@ -0,0 +1,293 @@
+try:
+    from .database import db, writer_engine
+    from .models import Pedido, ItemPedido
+    from .coupons import redeem_coupon
+    from .order_intake import insert_order_items
+except ImportError:
+    from database import db, writer_engine
+    from models import Pedido, ItemPedido
+    from coupons import redeem_coupon
+    from order_intake import insert_order_items
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from flask_sqlalchemy.session import Session
+import atexit
+import os
+import queue
+import threading
+import time
+
+# Quanto a requisição espera o pedido ser gravado antes de desistir (segundos)
+WRITE_TIMEOUT = 10
+# Espera extra quando o pedido já está no lote em gravação (segundos)
+WRITE_GRACE = 30
+
+
+class OrderQueueFull(RuntimeError):
+    """Fila de gravação cheia (banco travado ou sobrecarregado)"""
+
+
+class OrderPending(OrderQueueFull):
+    """Pedido ainda em gravação depois da espera: pode ser gravado, o cliente não deve reenviar"""
+
+
+class _WriterSession(Session):
+    """db.session da thread de gravação: tudo vai para o engine dela (writer_engine)"""
+
+    def __init__(self, db, engine, **kwargs):
+        super().__init__(db, **kwargs)
+        self._engine = engine
+
+    def get_bind(self, *args, **kwargs):
+        return self._engine
+
+
+class OrderWriter:
+    """
+    Gravação de pedidos novos por uma única thread, com commit em grupo.
+
+    As rotas validam e cotam o pedido e chamam submit(); a thread junta os
+    pedidos que chegarem em até `max_wait` segundos (no máximo `batch_size`)
+    e grava todos numa transação só, com um SAVEPOINT por pedido: cupom
+    esgotado ou erro num pedido não derruba os outros do lote. Cada
+    requisição recebe o id do seu pedido (ou a exceção dele) por um Future.
+
+    No SQLite isso troca N commits concorrentes disputando o lock de escrita
+    por um commit (e um fsync) por lote; depende do BEGIN IMMEDIATE do engine
+    próprio da thread (writer_engine em database.py), sem ele cada SAVEPOINT
+    vira uma transação própria. As sessões das rotas continuam no db.engine.
+    check_group_commit() e check_concurrent_writes() conferem isso no banco
+    real. Como no ActivityLog, a thread (e o engine) são criados no primeiro
+    submit() de cada processo.
+    """
+
+    def __init__(self, app, resolver, coupon_cache, on_commit=None,
+                 batch_size=50, max_wait=0.005, maxsize=1000):
+        self.app = app
+        self.resolver = resolver
+        self.coupon_cache = coupon_cache
+        self.on_commit = on_commit  # Chamado com cada Pedido gravado, depois do commit
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+        self._engine = None
+        self._engine_pid = None
+        atexit.register(self.flush)
+
+    def submit(self, fields, items, coupon=None, phone=None):
+        """
+        Enfileira um pedido já validado: `fields` são as colunas de Pedido,
+        `items` a lista aceita por insert_order_items(), `coupon`/`phone` o
+        cupom a resgatar. Retorna um Future com o id do pedido.
+        """
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put((fields, items, coupon, phone, future), timeout=1)
+        except queue.Full:
+            raise OrderQueueFull("Muitos pedidos no momento. Tente novamente em instantes.")
+        return future
+
+    def write(self, fields, items, coupon=None, phone=None, timeout=WRITE_TIMEOUT):
+        """
+        submit() e espera o commit; retorna o id ou levanta a exceção do pedido.
+        Se em `timeout` segundos o pedido nem começou a ser gravado, ele sai da
+        fila e levanta OrderQueueFull (o cliente pode tentar de novo). Se já
+        está no lote em gravação, espera mais WRITE_GRACE segundos e então
+        levanta OrderPending: o pedido pode ainda ser gravado, e uma nova
+        tentativa gravaria (e usaria o cupom) duas vezes.
+        """
+        future = self.submit(fields, items, coupon, phone)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise OrderQueueFull("Muitos pedidos no momento. Tente novamente em instantes.")
+        try:
+            return future.result(WRITE_GRACE)
+        except FutureTimeout:
+            raise OrderPending("Seu pedido está em processamento. Aguarde a confirmação antes de enviar de novo.")
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='order-writer', daemon=True)
+            self._pid = os.getpid()
+            self._worker.start()
+
+    def _take_batch(self, timeout):
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        # Espera um pouco pelos pedidos que chegam junto (pico), sem passar de max_wait
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def engine(self):
+        """Engine da thread de gravação (um por processo); chamar dentro de um app context"""
+        if self._engine_pid != os.getpid():
+            self._engine = writer_engine(self.app)
+            self._engine_pid = os.getpid()
+        return self._engine
+
+    def _write_one(self, fields, items, coupon, phone):
+        with db.session.begin_nested():
+            pedido = Pedido(**fields)
+            db.session.add(pedido)
+            db.session.flush()  # Gerar ID (necessário para itens e cupom)
+            # Reserva o uso do cupom na mesma transação do pedido
+            if coupon:
+                redeem_coupon(self.coupon_cache, coupon, phone, pedido_id=pedido.id)
+            insert_order_items(self.resolver, pedido.id, items)
+        return pedido
+
+    def _write(self, batch):
+        with self.app.app_context():
+            # db.session deste app context (usado também por cupons e itens) vai para o engine da thread
+            db.session.registry.set(_WriterSession(db, self.engine(), query_cls=db.Query))
+            gravados = []
+            try:
+                for fields, items, coupon, phone, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        pedido = self._write_one(fields, items, coupon, phone)
+                        # id lido antes do commit: depois dele o objeto expira e seria recarregado
+                        gravados.append((pedido, pedido.id, future))
+                    except Exception as e:
+                        future.set_exception(e)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao gravar lote de {len(batch)} pedido(s): {e}")
+                for _, _, future in gravados:
+                    future.set_exception(e)
+                return
+
+            self.batches += 1
+            self.written += len(gravados)
+            for _, pedido_id, future in gravados:
+                future.set_result(pedido_id)
+            if self.on_commit:
+                for pedido, _, _ in gravados:
+                    try:
+                        self.on_commit(pedido)
+                    except Exception as e:
+                        print(f"Erro ao notificar pedido #{pedido.id}: {e}")
+
+    def _run(self):
+        while True:
+            batch = self._take_batch(1.0)
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Grava o que estiver na fila (no encerramento do processo)"""
+        while True:
+            batch = self._take_batch(0)
+            if not batch:
+                return
+            self._write(batch)
+
+
+def _delete_test_orders():
+    db.session.execute(db.delete(ItemPedido).where(
+        ItemPedido.pedido_id.in_(db.select(Pedido.id).where(Pedido.status.like('teste_%')))))
+    db.session.execute(db.delete(Pedido).where(Pedido.status.like('teste_%')))
+    db.session.commit()
+
+
+def check_group_commit(writer, pedidos=200):
+    """
+    Confere o commit em grupo no banco real (SQLite): grava `pedidos` pedidos
+    de teste pela fila e conta, pelo trace do driver, os COMMIT que a thread de
+    gravação executou de fato. Falha (AssertionError) se houver mais de um
+    COMMIT por lote. Apaga os pedidos de teste no fim.
+    """
+    from sqlalchemy import event
+
+    engine = writer.engine()
+    comandos = []
+
+    def trace(sql):
+        if threading.current_thread().name == 'order-writer':
+            comandos.append(sql.split(None, 1)[0].upper())
+
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(trace)
+
+    # Conexões novas (com trace) para a thread de gravação
+    event.listen(engine, 'connect', on_connect)
+    engine.dispose()
+    try:
+        writer.flush()
+        lotes_antes = writer.batches
+        futures = [
+            writer.submit({"cliente_nome": f"Teste commit {i}", "status": "teste_commit", "total": 0.0},
+                          [{"nome": "Teste", "quantidade": 1, "preco": 1.0}])
+            for i in range(pedidos)
+        ]
+        ids = [f.result(WRITE_TIMEOUT) for f in futures]
+        lotes = writer.batches - lotes_antes
+        commits = comandos.count('COMMIT')
+        print(f"{len(ids)} pedidos | {lotes} lote(s) | {comandos.count('BEGIN')} BEGIN | "
+              f"{commits} COMMIT | {comandos.count('RELEASE')} RELEASE")
+        assert commits == lotes, f"{commits} COMMIT para {lotes} lote(s): sem commit em grupo"
+        assert comandos.count('BEGIN') == lotes, "transação extra fora do lote"
+    finally:
+        event.remove(engine, 'connect', on_connect)
+        engine.dispose()
+        _delete_test_orders()
+
+
+def check_concurrent_writes(writer):
+    """
+    Confere que uma rota que lê e depois grava não falha quando outra conexão
+    grava no meio (o caso do pico: a thread de gravação comitando a cada
+    poucos ms). A sessão da "rota" lê um pedido, a fila grava um pedido novo
+    e outra conexão altera o mesmo pedido; o commit da rota tem que passar.
+    Com BEGIN já na leitura ele falharia com "database is locked". Apaga os
+    pedidos de teste no fim.
+    """
+    try:
+        pedido = Pedido(cliente_nome="Teste concorrência", status="teste_leitura", total=0.0)
+        db.session.add(pedido)
+        db.session.commit()
+
+        pedido = db.session.get(Pedido, pedido.id)  # Leitura da "rota"
+        total = pedido.total
+        writer.write({"cliente_nome": "Teste concorrência", "status": "teste_fila", "total": 0.0},
+                     [{"nome": "Teste", "quantidade": 1, "preco": 1.0}])
+        with db.engine.begin() as conn:
+            conn.execute(db.update(Pedido).where(Pedido.id == pedido.id).values(total=1.0))
+
+        pedido.total = total + 2.0  # Escrita da "rota" depois dos commits das outras conexões
+        db.session.commit()
+        print("Leitura seguida de escrita com commits concorrentes: ok")
+    finally:
+        db.session.rollback()
+        _delete_test_orders()
+
+
+if __name__ == "__main__":
+    from app import app, product_resolver, coupon_cache
+
+    with app.app_context():
+        # Sem on_commit: os pedidos de teste não vão para as telas (SSE)
+        writer = OrderWriter(app, product_resolver, coupon_cache)
+        check_group_commit(writer)
+        check_concurrent_writes(writer)
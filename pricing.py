@@ -0,0 +1,269 @@
+try:
+    from .coupons import CouponError, check_coupon, normalize_code
+except ImportError:
+    from coupons import CouponError, check_coupon, normalize_code
+from datetime import datetime
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+import math
+import threading
+
+# Validade da cotação assinada (o cliente pede outra se expirar)
+QUOTE_TTL = 30 * 60
+MAX_QTD = 99
+# Padrões da taxa de entrega (mesma fórmula do chat: R$ 3,00 + R$ 1,50 por km, até 6 km)
+DEFAULT_FEE_BASE = 3.00
+DEFAULT_FEE_PER_KM = 1.50
+DEFAULT_RADIUS_KM = 6.0
+
+
+class QuoteError(ValueError):
+    """Carrinho que não pode ser cotado (produto inexistente, esgotado, fora da área...)"""
+
+
+def _money(value):
+    return round(value + 1e-9, 2)
+
+
+def _distance_km(lat1, lon1, lat2, lon2):
+    """Distância em linha reta (haversine), igual ao cálculo do chat"""
+    r = 6371
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2
+    return r * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _parse_time(value):
+    try:
+        hour, minute = str(value).split(':')[:2]
+        return int(hour) * 60 + int(minute)
+    except (TypeError, ValueError):
+        return None
+
+
+def _compile_promos(promos):
+    """promocoes.json -> lista de regras prontas para comparar com o horário do pedido"""
+    regras = []
+    for promo in promos if isinstance(promos, list) else []:
+        if not isinstance(promo, dict) or promo.get('active', True) is False:
+            continue
+        try:
+            desconto = float(promo.get('discount') or 0)
+            dias = {int(d) for d in promo.get('days', [])}
+        except (TypeError, ValueError):
+            continue
+        inicio, fim = _parse_time(promo.get('start')), _parse_time(promo.get('end'))
+        if desconto <= 0 or not dias or inicio is None or fim is None:
+            continue
+        categorias = set(promo.get('categories') or ['Todas'])
+        regras.append({
+            "nome": promo.get('name', ''),
+            "desconto": min(desconto, 100.0),
+            "dias": dias,
+            "inicio": inicio,
+            "fim": fim,
+            "categorias": None if 'Todas' in categorias else categorias
+        })
+    return regras
+
+
+def _promo_active(regra, now):
+    if now.weekday() not in regra['dias']:
+        return False
+    minuto = now.hour * 60 + now.minute
+    if regra['inicio'] <= regra['fim']:
+        return regra['inicio'] <= minuto < regra['fim']
+    return minuto >= regra['inicio'] or minuto < regra['fim']  # Atravessa a meia-noite
+
+
+class PricingEngine:
+    """
+    Cotação do carrinho feita no servidor: preço dos itens, promoções do
+    horário, cupom e taxa de entrega, numa única passada e sem consultar o
+    banco (tabela de preços do ProductResolver, promoções/config dos
+    JsonStore e cupons do CouponCache em memória).
+
+    A cotação volta assinada; os endpoints de pedido aceitam o token sem
+    recalcular e rejeitam totais que não batem com ela.
+    """
+
+    def __init__(self, resolver, coupon_cache, promos_store, config_store, secret_key):
+        self.resolver = resolver
+        self.coupon_cache = coupon_cache
+        self.promos_store = promos_store
+        self.config_store = config_store
+        self.serializer = URLSafeTimedSerializer(secret_key, salt='pedido-cotacao')
+        self._lock = threading.Lock()
+        self._promos = None  # (revisão do arquivo, regras compiladas)
+
+    def _promo_rules(self):
+        revision = self.promos_store.revision
+        cached = self._promos
+        if cached is not None and cached[0] == revision:
+            return cached[1]
+        with self._lock:
+            try:
+                regras = _compile_promos(self.promos_store.read())
+            except ValueError:
+                regras = []
+            self._promos = (revision, regras)
+            return regras
+
+    def _delivery_fee(self, config, lat=None, lon=None):
+        """Taxa pela distância (calculada aqui) do endereço até a unidade mais próxima"""
+        if lat in (None, '') or lon in (None, ''):
+            raise QuoteError("Informe o endereço de entrega para calcular a taxa.")
+        units = [u for u in config.get('units', []) if u.get('lat') not in (None, '') and u.get('lon') not in (None, '')]
+        if not units:
+            raise QuoteError("Entrega indisponível no momento: nenhuma unidade com localização cadastrada.")
+        try:
+            distancia = min(_distance_km(float(lat), float(lon), float(u['lat']), float(u['lon'])) for u in units)
+        except (TypeError, ValueError):
+            raise QuoteError("Localização de entrega inválida.")
+
+        raio = float(config.get('delivery_radius_km', DEFAULT_RADIUS_KM))
+        if distancia > raio:
+            raise QuoteError(f"Endereço fora da área de entrega (até {raio:g} km).")
+        base = float(config.get('delivery_fee_base', DEFAULT_FEE_BASE))
+        por_km = float(config.get('delivery_fee_per_km', DEFAULT_FEE_PER_KM))
+        return _money(base + distancia * por_km), round(distancia, 2)
+
+    def quote(self, items, tipo_entrega='Retirada', coupon=None, phone=None,
+              lat=None, lon=None, now=None):
+        """
+        Calcula a cotação. `items`: [{id?, nome?, qtd?, obs?}] (o preço enviado
+        pelo cliente é ignorado); entrega exige `lat`/`lon` do endereço.
+        Levanta QuoteError se algo não puder ser cotado.
+        """
+        now = now or datetime.now()
+        tipo_entrega = tipo_entrega or 'Retirada'
+        if not items:
+            raise QuoteError("O carrinho está vazio.")
+        try:
+            config = self.config_store.read()
+        except ValueError:
+            config = {}
+        regras = [r for r in self._promo_rules() if _promo_active(r, now)]
+
+        linhas = {}
+        for item in items:
+            nome = item.get('nome') or item.get('name')
+            produto = self.resolver.resolve(item.get('id'), nome)
+            if produto is None:
+                raise QuoteError(f"Produto não encontrado no cardápio: {nome or item.get('id')}")
+            if not produto['disponivel']:
+                raise QuoteError(f"{produto['nome']} está indisponível no momento.")
+            try:
+                qtd = int(item.get('qtd') or item.get('quantidade') or 1)
+            except (TypeError, ValueError):
+                raise QuoteError(f"Quantidade inválida para {produto['nome']}.")
+            if qtd < 1 or qtd > MAX_QTD:
+                raise QuoteError(f"Quantidade inválida para {produto['nome']}.")
+            obs = (item.get('obs') or '').strip()
+
+            key = (produto['id'], obs)
+            linha = linhas.get(key)
+            if linha is not None:
+                linha['qtd'] += qtd
+                continue
+
+            # Melhor promoção ativa para a categoria do produto
+            promo = None
+            for regra in regras:
+                if regra['categorias'] is None or produto['categoria'] in regra['categorias']:
+                    if promo is None or regra['desconto'] > promo['desconto']:
+                        promo = regra
+            preco = produto['preco']
+            if promo:
+                preco = _money(preco * (1 - promo['desconto'] / 100))
+            linhas[key] = {
+                "id": produto['id'],
+                "nome": produto['nome'],
+                "qtd": qtd,
+                "preco_tabela": produto['preco'],
+                "preco": preco,
+                "promocao": promo['nome'] if promo else None,
+                "obs": obs
+            }
+
+        itens = list(linhas.values())
+        subtotal_tabela = _money(sum(i['preco_tabela'] * i['qtd'] for i in itens))
+        subtotal = _money(sum(i['preco'] * i['qtd'] for i in itens))
+        for item in itens:
+            item['total'] = _money(item['preco'] * item['qtd'])
+
+        # Cupom sobre o subtotal (já com promoções); não desconta a taxa de entrega
+        cupom = normalize_code(coupon) or None
+        desconto_cupom = 0.0
+        if cupom:
+            try:
+                dados = check_coupon(self.coupon_cache, cupom, phone=phone, now=now)
+            except CouponError as e:
+                raise QuoteError(str(e))
+            if dados['tipo'] == 'fixo':
+                desconto_cupom = min(float(dados['valor']), subtotal)
+            else:
+                desconto_cupom = subtotal * min(float(dados['valor']), 100.0) / 100
+            desconto_cupom = _money(desconto_cupom)
+
+        taxa_entrega, distancia = 0.0, None
+        if tipo_entrega == 'Entrega':
+            taxa_entrega, distancia = self._delivery_fee(config, lat, lon)
+
+        return {
+            "itens": itens,
+            "subtotal": subtotal,
+            "desconto_promocao": _money(subtotal_tabela - subtotal),
+            "cupom": cupom,
+            "desconto_cupom": desconto_cupom,
+            "tipo_entrega": tipo_entrega,
+            "distancia_km": distancia,
+            "taxa_entrega": taxa_entrega,
+            "total": _money(max(subtotal - desconto_cupom, 0) + taxa_entrega),
+            "versao_cardapio": self.resolver.version
+        }
+
+    def sign(self, quote):
+        return self.serializer.dumps(quote)
+
+    def verify(self, token):
+        """Cotação assinada emitida por quote()/sign(); levanta QuoteError se adulterada ou expirada"""
+        try:
+            return self.serializer.loads(token, max_age=QUOTE_TTL)
+        except SignatureExpired:
+            raise QuoteError("A cotação expirou. Revise o carrinho e tente novamente.")
+        except BadSignature:
+            raise QuoteError("Cotação inválida.")
+
+    def checkout(self, token=None, client_total=None, **quote_args):
+        """
+        Cotação usada para gravar o pedido: o token assinado enviado pelo
+        cliente (sem recalcular nada) ou, sem token, uma cotação feita agora.
+        Token de outro tipo de entrega, ou emitido antes de uma mudança no
+        cardápio com preço diferente, levanta QuoteMismatch com a cotação
+        nova; também se o cliente mandou um total diferente.
+        """
+        if not token:
+            quote = self.quote(**quote_args)
+        else:
+            quote = self.verify(token)
+            tipo_entrega = quote_args.get('tipo_entrega') or 'Retirada'
+            if quote['tipo_entrega'] != tipo_entrega:
+                raise QuoteMismatch(self.quote(**quote_args))
+            if quote.get('versao_cardapio') != self.resolver.version:
+                # Cardápio mudou: recota em memória; só incomoda o cliente se o total mudou
+                nova = self.quote(**quote_args)
+                if nova['total'] != quote['total']:
+                    raise QuoteMismatch(nova)
+                quote = nova
+        if client_total not in (None, '') and abs(float(client_total) - quote['total']) >= 0.011:
+            raise QuoteMismatch(quote)
+        return quote
+
+
+class QuoteMismatch(QuoteError):
+    """Total enviado pelo cliente não confere com a cotação do servidor"""
+
+    def __init__(self, quote):
+        super().__init__("O valor do pedido foi atualizado. Confira o novo total e envie novamente.")
+        self.quote = quote
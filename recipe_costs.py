@@ -0,0 +1,107 @@
+try:
+    from .database import db
+    from .models import Produto, Categoria, Ingrediente, FichaTecnica, ProdutoCusto
+except ImportError:
+    from database import db
+    from models import Produto, Categoria, Ingrediente, FichaTecnica, ProdutoCusto
+
+
+def _ingredient_products(ingrediente_id):
+    """Subconsulta com os produtos cuja ficha técnica usa o ingrediente"""
+    return db.select(FichaTecnica.produto_id).where(FichaTecnica.ingrediente_id == ingrediente_id)
+
+
+def refresh_statements(produtos=None):
+    """
+    DELETE + INSERT ... SELECT que recalculam o custo dos `produtos` (lista de
+    ids ou subconsulta; None = todos) direto das fichas técnicas, sem trazer
+    nada para o Python. Linhas de ficha com ingrediente sem custo (ou apagado)
+    entram com custo zero e são contadas em itens_sem_custo.
+    """
+    sem_custo = db.or_(Ingrediente.id.is_(None), db.func.coalesce(Ingrediente.custo_unitario, 0) <= 0)
+    calculo = (
+        db.select(
+            FichaTecnica.produto_id,
+            db.func.sum(FichaTecnica.quantidade * db.func.coalesce(Ingrediente.custo_unitario, 0)),
+            db.func.count(FichaTecnica.id),
+            db.func.sum(db.case((sem_custo, 1), else_=0)),
+            db.func.current_timestamp(),
+        )
+        .outerjoin(Ingrediente, Ingrediente.id == FichaTecnica.ingrediente_id)
+        .group_by(FichaTecnica.produto_id)
+    )
+    delete = db.delete(ProdutoCusto)
+    if produtos is not None:
+        calculo = calculo.where(FichaTecnica.produto_id.in_(produtos))
+        delete = delete.where(ProdutoCusto.produto_id.in_(produtos))
+    insert = db.insert(ProdutoCusto).from_select(
+        ['produto_id', 'custo', 'itens_ficha', 'itens_sem_custo', 'atualizado_em'], calculo
+    )
+    return delete, insert
+
+
+def _refresh(produtos):
+    for stmt in refresh_statements(produtos):
+        db.session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def refresh_product_costs(produto_ids):
+    """Recalcula o custo dos produtos informados (ex: ficha técnica editada); sem commit"""
+    produto_ids = [int(p) for p in produto_ids]
+    if produto_ids:
+        _refresh(produto_ids)
+
+
+def refresh_ingredient_costs(ingrediente_id):
+    """Recalcula só os produtos que usam o ingrediente (custo alterado ou ingrediente apagado); sem commit"""
+    _refresh(_ingredient_products(ingrediente_id))
+
+
+def rebuild_costs():
+    """Recalcula o custo de todos os produtos; sem commit"""
+    _refresh(None)
+
+
+def margin_report():
+    """
+    Custo e margem de todos os produtos do cardápio numa consulta só.
+
+    O custo vem da tabela produto_custos (mantida pelas funções acima); a
+    margem é calculada aqui com o preço atual, então editar o preço no
+    cardápio nunca deixa margem desatualizada. status: 'ok', 'sem_ficha'
+    (produto sem ficha técnica) ou 'custo_incompleto' (algum ingrediente da
+    ficha sem custo cadastrado).
+    """
+    rows = db.session.execute(
+        db.select(Produto.id, Produto.nome, Categoria.nome.label('categoria'), Produto.preco,
+                  ProdutoCusto.custo, ProdutoCusto.itens_ficha, ProdutoCusto.itens_sem_custo,
+                  ProdutoCusto.atualizado_em)
+        .join(Categoria, Categoria.id == Produto.categoria_id)
+        .outerjoin(ProdutoCusto, ProdutoCusto.produto_id == Produto.id)
+        .order_by(Categoria.ordem, Categoria.nome, Produto.nome)
+    ).all()
+
+    report = []
+    for row in rows:
+        preco = float(row.preco or 0)
+        if row.custo is None:
+            custo, margem, margem_pct, status = None, None, None, 'sem_ficha'
+        else:
+            custo = round(float(row.custo), 4)
+            margem = round(preco - custo, 2)
+            margem_pct = round(margem / preco * 100, 1) if preco > 0 else None
+            status = 'custo_incompleto' if row.itens_sem_custo else 'ok'
+        report.append({
+            "id": row.id,
+            "nome": row.nome,
+            "categoria": row.categoria,
+            "preco": preco,
+            "custo": custo,
+            "margem": margem,
+            "margem_pct": margem_pct,
+            "itens_ficha": row.itens_ficha or 0,
+            "itens_sem_custo": row.itens_sem_custo or 0,
+            "status": status,
+            "atualizado_em": row.atualizado_em.strftime("%d/%m/%Y %H:%M") if row.atualizado_em else None
+        })
+    return report
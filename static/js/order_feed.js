@@ -0,0 +1,64 @@
+// Fila de pedidos em tempo real (SSE) para a cozinha e o painel de pedidos.
+// Recebe a lista completa na conexão ('snapshot') e depois só os pedidos
+// criados/alterados ('pedido') ou que saíram da fila ('removido').
+// O EventSource reconecta sozinho e reenvia o último id (Last-Event-ID).
+// Sem suporte a EventSource, consulta /api/admin/pedidos periodicamente pedindo
+// só o que mudou desde a última resposta (?since=<cursor>).
+// O stream é por processo do servidor: com vários workers, pedidos gravados em
+// outro worker não chegam por ele. Por isso a mesma consulta ?since= roda a cada
+// `pollInterval` também com o stream aberto, mesmo com eventos chegando (o cursor
+// deixa a consulta barata; repetidos são inofensivos).
+function subscribeOrderFeed({ onSnapshot, onUpsert, onRemove, pollInterval = 10000 }) {
+    let cursor = null;
+    const poll = async () => {
+        try {
+            if (!cursor) {
+                const res = await fetch('/api/admin/pedidos');
+                cursor = res.headers.get('X-Pedidos-Cursor');
+                onSnapshot(await res.json());
+                return;
+            }
+            const res = await fetch(`/api/admin/pedidos?since=${encodeURIComponent(cursor)}`);
+            const delta = await res.json();
+            cursor = delta.cursor;
+            delta.pedidos.forEach(onUpsert);
+            delta.removidos.forEach(onRemove);
+        } catch (e) {
+            console.error(e);
+            cursor = null; // Próxima consulta recarrega a lista completa
+        }
+    };
+
+    if (!window.EventSource) {
+        poll();
+        const timer = setInterval(poll, pollInterval);
+        return { close: () => clearInterval(timer) };
+    }
+
+    const source = new EventSource('/api/admin/pedidos/stream');
+    source.addEventListener('snapshot', (e) => onSnapshot(JSON.parse(e.data)));
+    source.addEventListener('pedido', (e) => onUpsert(JSON.parse(e.data)));
+    source.addEventListener('removido', (e) => onRemove(JSON.parse(e.data).id));
+    source.onerror = () => console.log('Conexão com a fila de pedidos perdida, reconectando...');
+
+    const timer = setInterval(poll, pollInterval);
+    return {
+        close: () => {
+            clearInterval(timer);
+            source.close();
+        }
+    };
+}
+
+// Aplica um pedido criado/alterado numa lista ordenada do mais recente para o mais antigo.
+// Retorna true se o pedido é novo na lista.
+function upsertOrder(orders, order) {
+    const idx = orders.findIndex(o => o.id === order.id);
+    if (idx >= 0) {
+        orders.splice(idx, 1, order);
+        return false;
+    }
+    const pos = orders.findIndex(o => o.id < order.id);
+    orders.splice(pos === -1 ? orders.length : pos, 0, order);
+    return true;
+}
@@ -335,7 +335,38 @@ function initAIWidget() {
         localStorage.setItem('vts_user_name', orderData.name);
         localStorage.setItem('vts_user_phone', orderData.phone);
 
-        let total = 0;
+        const formatBRL = (v) => v.toLocaleString('pt-BR', { style: 'currency', currency: 'BRL' });
+        const couponCode = orderData.discount ? orderData.discount.codigo : null;
+
+        // Cotação no servidor: preços, promoções, cupom e taxa de entrega oficiais
+        let quote, quoteToken;
+        try {
+            const response = await fetch('/api/pedido/cotacao', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    items: cart,
+                    method: orderData.method,
+                    coupon: couponCode,
+                    phone: orderData.phone,
+                    // A distância e a taxa são calculadas no servidor a partir da localização
+                    lat: orderData.method === 'Entrega' ? orderData.lat : null,
+                    lon: orderData.method === 'Entrega' ? orderData.lon : null
+                })
+            });
+            const resData = await response.json();
+            if (!resData.success) {
+                addMessage(`❌ <strong>Erro no Pedido:</strong> ${resData.message}`, 'bot');
+                return;
+            }
+            quote = resData.cotacao;
+            quoteToken = resData.token;
+        } catch (err) {
+            console.error("Erro ao cotar pedido", err);
+            addMessage("❌ Erro de conexão ao registrar pedido. Tente novamente.", 'bot');
+            return;
+        }
+
         let msg = `Olá! Gostaria de fazer um pedido (${orderData.method}):\n\n`;
         msg += `👤 *Cliente:* ${orderData.name}\n`;
         msg += `📱 *Tel:* ${orderData.phone}\n`;
@@ -348,29 +379,16 @@ function initAIWidget() {
 
         msg += `\n🛒 *Itens:* \n`;
 
-        cart.forEach(item => {
-            msg += `- ${item.name} (${item.price})\n`;
-            const priceVal = parseFloat(item.price.replace(/[^\d,]/g, '').replace(',', '.'));
-            if (!isNaN(priceVal)) total += priceVal;
+        quote.itens.forEach(item => {
+            msg += `- ${item.qtd > 1 ? item.qtd + 'x ' : ''}${item.nome} (${formatBRL(item.preco)})${item.promocao ? ' 🔥 ' + item.promocao : ''}\n`;
         });
 
-        // Adiciona taxa de entrega se houver
-        const feeVal = parseFloat(orderData.fee.replace(/[^\d,]/g, '').replace(',', '.'));
-        if (!isNaN(feeVal) && feeVal > 0) total += feeVal;
-
-        // Aplica Desconto
-        if (orderData.discount) {
-            let discountVal = 0;
-            if (orderData.discount.tipo === 'fixo') discountVal = parseFloat(orderData.discount.valor);
-            else discountVal = total * (parseFloat(orderData.discount.valor) / 100);
-
-            total -= discountVal;
-            if (total < 0) total = 0;
-
-            msg += `\n🎟️ *Cupom (${orderData.discount.codigo}):* -${discountVal.toLocaleString('pt-BR', { style: 'currency', currency: 'BRL' })}`;
+        if (quote.cupom) {
+            msg += `\n🎟️ *Cupom (${quote.cupom}):* -${formatBRL(quote.desconto_cupom)}`;
         }
 
-        const totalFormatted = total.toLocaleString('pt-BR', { style: 'currency', currency: 'BRL' });
+        const totalFormatted = formatBRL(quote.total);
+        if (orderData.method === 'Entrega' && quote.distancia_km !== null) orderData.fee = formatBRL(quote.taxa_entrega);
 
         // Enviar para o Painel Admin (API)
         try {
@@ -384,8 +402,11 @@ function initAIWidget() {
                     address: orderData.method === 'Entrega' ? (orderData.street ? `${orderData.street}, ${orderData.number_complement} (${orderData.cep})` : orderData.cep) : 'Retirada na Loja',
                     items: cart,
                     total: totalFormatted,
+                    cotacao: quoteToken,
                     obs: orderData.obs,
-                    coupon: orderData.discount ? orderData.discount.codigo : null,
+                    coupon: couponCode,
+                    lat: orderData.method === 'Entrega' ? orderData.lat : null,
+                    lon: orderData.method === 'Entrega' ? orderData.lon : null,
                     fee: orderData.fee,
                     paymentMethod: orderData.paymentMethod,
                     change: orderData.change
@@ -445,15 +466,29 @@ function initAIWidget() {
         addMessage(`${introText}<br>Digite o número ou nome da opção:<br>1️⃣ <strong>Pizzas</strong><br>2️⃣ <strong>Churrasco</strong><br>3️⃣ <strong>Hambúrgueres</strong><br>4️⃣ <strong>Marmitex</strong><br>5️⃣ <strong>Bebidas</strong><br>6️⃣ <strong>Ver Tudo</strong><br>7️⃣ <strong>⭐ Favoritos</strong>`, 'bot');
     }
 
+    // Cardápio carregado uma única vez por página (destaques e listagem compartilham a mesma requisição)
+    let menuPromise = null;
+    function loadMenu() {
+        if (!menuPromise) {
+            menuPromise = fetch('/api/cardapio')
+                .then(response => {
+                    if (!response.ok) throw new Error('Erro na API');
+                    return response.json();
+                })
+                .catch(error => {
+                    menuPromise = null; // Permite nova tentativa
+                    throw error;
+                });
+        }
+        return menuPromise;
+    }
+
     // Sugerir Destaques (IA)
     async function suggestHighlights() {
         try {
             addMessage("Deixa comigo! Vou separar umas opções deliciosas para você... 👩‍🍳", 'bot');
 
-            const response = await fetch('/api/cardapio');
-            if (!response.ok) throw new Error('Erro na API');
-
-            const menu = await response.json();
+            const menu = await loadMenu();
             let allItems = [];
 
             // Coleta todos os itens visíveis e não esgotados
@@ -508,10 +543,7 @@ function initAIWidget() {
         try {
             addMessage("Buscando as melhores opções para você... 😋", 'bot');
 
-            const response = await fetch('/api/cardapio');
-            if (!response.ok) throw new Error('Erro na API');
-
-            const menu = await response.json();
+            const menu = await loadMenu();
 
             if (Object.keys(menu).length === 0) {
                 addMessage("O cardápio parece estar vazio no momento. 😕 Tente novamente mais tarde.", 'bot');
@@ -791,6 +823,9 @@ function initAIWidget() {
                     currentUnit = nearestUnit;
                     orderData.cep = isStreetSearch ? "Não informado" : inputText;
                     orderData.fee = calculateDeliveryFee(minDistance);
+                    orderData.distance = minDistance;
+                    orderData.lat = userLat;
+                    orderData.lon = userLon;
                     orderData.street = street + (neighborhood ? ` - ${neighborhood}` : "");
 
                     checkoutState = 'address_number';
@@ -835,6 +870,9 @@ function initAIWidget() {
                 if (text.match(/sim|s|quero/i)) {
                     orderData.method = 'Retirada';
                     orderData.fee = 'R$ 0,00';
+                    orderData.distance = null;
+                    orderData.lat = null;
+                    orderData.lon = null;
 
                     const savedName = localStorage.getItem('vts_user_name');
                     const savedPhone = localStorage.getItem('vts_user_phone');
@@ -904,7 +942,7 @@ function initAIWidget() {
                         const response = await fetch('/api/cupom/validar', {
                             method: 'POST',
                             headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({ codigo: text })
+                            body: JSON.stringify({ codigo: text, phone: orderData.phone })
                         });
                         const data = await response.json();
 
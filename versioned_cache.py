@@ -0,0 +1,85 @@
+import os
+import threading
+
+
+class VersionedCache:
+    """
+    Base dos caches em memória invalidados por versão (cardápio, cupons).
+
+    Guarda um snapshot imutável montado por _make_snapshot() e só o descarta
+    quando a versão muda. A versão é compartilhada entre processos (workers)
+    por um pequeno arquivo em instance/ (um por cache): invalidate() num
+    worker grava a versão nova e os demais percebem pelo os.stat do arquivo
+    na próxima leitura.
+    """
+
+    def __init__(self, version_file=None):
+        self.version_file = version_file
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = 0
+        self._file_stamp = None
+
+    @property
+    def version(self):
+        self._sync_version()
+        return self._version
+
+    def _read_stamp(self):
+        if not self.version_file:
+            return None
+        try:
+            st = os.stat(self.version_file)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _read_version_file(self):
+        try:
+            with open(self.version_file, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _sync_version(self):
+        # Um os.stat por leitura: barato e detecta invalidações de outros workers
+        stamp = self._read_stamp()
+        if stamp is None or stamp == self._file_stamp:
+            return
+        with self._lock:
+            if stamp == self._file_stamp:
+                return
+            file_version = self._read_version_file()
+            if file_version != self._version:
+                # Sempre avança (nunca volta para uma versão já servida por este processo)
+                self._version = max(self._version + 1, file_version)
+                self._snapshot = None
+            self._file_stamp = stamp
+
+    def get(self):
+        """Retorna o snapshot atual, reconstruindo-o se a versão mudou"""
+        self._sync_version()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._make_snapshot()
+            return self._snapshot
+
+    def _make_snapshot(self):
+        """Snapshot da versão atual (self._version), chamado com o lock"""
+        raise NotImplementedError
+
+    def invalidate(self):
+        """Chamado após o commit de uma alteração nos dados do cache. Retorna a nova versão."""
+        with self._lock:
+            self._version = max(self._version, self._read_version_file() if self.version_file else 0) + 1
+            self._snapshot = None
+            if self.version_file:
+                tmp = f"{self.version_file}.{os.getpid()}.tmp"
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.write(str(self._version))
+                os.replace(tmp, self.version_file)
+                self._file_stamp = self._read_stamp()
+            return self._version